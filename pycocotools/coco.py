@@ -62,6 +62,15 @@ if PYTHON_VERSION == 2:
 elif PYTHON_VERSION == 3:
     from urllib.request import urlretrieve
 
+try:
+    # the json backend of pydatatool, PYDATATOOL_JSON picks it, see get_json_backend()
+    from pydatatool.utils import load_json
+except ImportError:
+    # standalone, without pydatatool
+    def load_json(filename):
+        with open(filename, 'r') as f:
+            return json.load(f)
+
 
 def _isArrayLike(obj):
     return hasattr(obj, '__iter__') and hasattr(obj, '__len__')
@@ -81,7 +90,7 @@ class COCO:
         if not annotation_file == None:
             print('loading annotations into memory...')
             tic = time.time()
-            dataset = json.load(open(annotation_file, 'r'))
+            dataset = load_json(annotation_file)
             assert type(dataset)==dict, 'annotation file format {} not supported'.format(type(dataset))
             print('Done (t={:0.2f}s)'.format(time.time()- tic))
             self.dataset = dataset
@@ -306,7 +315,7 @@ class COCO:
         print('Loading and preparing results...')
         tic = time.time()
         if type(resFile) == str or type(resFile) == unicode:
-            anns = json.load(open(resFile))
+            anns = load_json(resFile)
         elif type(resFile) == np.ndarray:
             anns = self.loadNumpyAnnotations(resFile)
         else:
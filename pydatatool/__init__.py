@@ -6,4 +6,5 @@ from . import kaist
 from . import citypersons
 from . import eurocity
 from . import crowdhuman
+from . import export
 
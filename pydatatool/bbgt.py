@@ -0,0 +1,209 @@
+# Copyright (c) 2018, Zhewei Xu
+# [xzhewei-at-gmail.com]
+# Licensed under The MIT License [see LICENSE for details]
+
+# Vectorized versions of the bbGt ground truth operations used by the
+# caltech, kaist and scut filters. They work on all boxes of a video
+# (or a whole dataset) at once. The detection results are written per
+# video in the bbGt txt format as well.
+
+import numpy as np
+import os
+
+from pydatatool.utils import mkdir_if_missing
+
+def bbox_ignore(lbl, pos, posv, occl, param):
+    """
+    The ignore flags of filter() for N boxes in one pass, the parts shared by
+    caltech, kaist and scut: ilbls, xRng, yRng, wRng, hRng, aRng, arRng and vRng.
+        INPUT
+            lbl:   [N] label names
+            pos:   [Nx4] bbox, x y w h
+            posv:  [Nx4] visible bbox, x y w h
+            occl:  [N] occlusion flag
+            param: a dict created by get_default_filter()
+        OUTPUT
+            ignore: [N] bool array, same as filter(obj,param) for every box.
+                    A box whose aspect ratio (arRng) or visible ratio (vRng) is
+                    undefined, with a zero height or area, is ignored.
+    """
+    pos = np.asarray(pos, dtype=np.float64).reshape(-1, 4)
+    posv = np.asarray(posv, dtype=np.float64).reshape(-1, 4)
+    occl = np.asarray(occl)
+    ignore = np.zeros(len(pos), dtype=bool)
+
+    def out_of(v, rng):
+        return (v < rng[0]) | (v > rng[1])
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        if len(param['ilbls']) != 0:
+            ignore |= np.isin(np.asarray(lbl, dtype=str), param['ilbls'])
+        if len(param['xRng']) != 0:
+            ignore |= out_of(pos[:,0], param['xRng'])
+            ignore |= out_of(pos[:,0]+pos[:,2], param['xRng'])
+        if len(param['yRng']) != 0:
+            ignore |= out_of(pos[:,1], param['yRng'])
+            ignore |= out_of(pos[:,1]+pos[:,3], param['yRng'])
+        if len(param['wRng']) != 0:
+            ignore |= out_of(pos[:,2], param['wRng'])
+        if len(param['hRng']) != 0:
+            ignore |= out_of(pos[:,3], param['hRng'])
+        if len(param['aRng']) != 0:
+            ignore |= out_of(pos[:,2]*pos[:,3], param['aRng'])
+        if len(param['arRng']) != 0:
+            # no aspect ratio, a zero height box is ignored
+            ignore |= out_of(pos[:,2]/pos[:,3], param['arRng']) | (pos[:,3] == 0)
+        if len(param['vRng']) != 0:
+            area = pos[:,2]*pos[:,3]
+            # no visible ratio, a zero area box is ignored
+            v = np.where(area == 0, np.nan, (posv[:,2]*posv[:,3])/area)
+            v = np.where((posv == pos).all(axis=1), 0, v)
+            v = np.where((occl == 0) | (posv == 0).all(axis=1), 1, v)
+            ignore |= out_of(v, param['vRng']) | np.isnan(v)
+    return ignore
+
+def bbox_keep(lbl, param):
+    """
+    The boxes bbox_filter() keeps, the ones labeled in param['lbls'] or param['ilbls'].
+    Like bbox_filter(), nothing is kept when param['lbls'] is empty.
+    """
+    lbl = np.asarray(lbl, dtype=str)
+    if len(param['lbls']) == 0:
+        return np.zeros(len(lbl), dtype=bool)
+    return np.isin(lbl, list(param['lbls'])+list(param['ilbls']))
+
+def bbox_resize_array(bb, hr, wr, ar=0):
+    """
+    Resize N bbs (without moving their centers), bbApply('resize') of Piotr's toolbox.
+    See bbox_resize() for the meaning of hr, wr and ar.
+
+        INPUT
+            bb     - [Nx4] original bbs, changed in place if it is a float64 ndarray
+            hr     - ratio by which to multiply height (or 0)
+            wr     - ratio by which to multiply width (or 0)
+            ar     - [0] target aspect ratio (used only if hr=0 or wr=0)
+
+        OUTPUT
+            bb     - [Nx4] the resized bbs
+
+        EXAMPLE
+            bb = bbox_resize_array(np.array([[0.,0.,1.,1.]]),1.2,0,.5) # h'=1.2*h; w'=h'/2;
+    """
+    bb = np.asarray(bb, dtype=np.float64).reshape(-1, 4)
+    assert (hr>0 and wr>0) or ar>0
+    if hr==0 and wr==0:
+        a = np.sqrt(bb[:,2]*bb[:,3])
+        ar = np.sqrt(ar)
+        d = a*ar - bb[:,2]; bb[:,0] -= d/2; bb[:,2] += d
+        d = a/ar - bb[:,3]; bb[:,1] -= d/2; bb[:,3] += d
+        return bb
+    if hr!=0:
+        d=(hr-1)*bb[:,3]; bb[:,1] -= d/2; bb[:,3] += d
+    if wr!=0:
+        d=(wr-1)*bb[:,2]; bb[:,0] -= d/2; bb[:,2] += d
+    if hr==0:
+        d=bb[:,2]/ar-bb[:,3]; bb[:,1] -= d/2; bb[:,3] += d
+    if wr==0:
+        d=bb[:,3]*ar-bb[:,2]; bb[:,0] -= d/2; bb[:,2] += d
+    return bb
+
+def bbox_squarify_array(bb, flag, ar=1):
+    """
+    Fix the aspect ratios of N bbs (without moving the bb centers), bbApply('squarify')
+    of Piotr's toolbox. See bbox_squarify() for the meaning of flag and ar.
+
+        INPUT
+            bb     - [Nx4] original bbs, changed in place if it is a float64 ndarray
+            flag   - controls whether w or h should change
+            ar     - [1] desired aspect ratio
+
+        OUTPUT
+            bb     - [Nx4] the squarified bbs
+
+        EXAMPLE
+            bb = bbox_squarify_array(np.array([[0.,0.,1.,2.]]),0)
+    """
+    bb = np.asarray(bb, dtype=np.float64).reshape(-1, 4)
+    if flag == 4:
+        return bbox_resize_array(bb,0,0,ar)
+    if flag == 2:
+        usew = np.ones(len(bb), dtype=bool)
+    elif flag == 0:
+        usew = bb[:,2] > bb[:,3]*ar
+    elif flag == 1:
+        usew = bb[:,2] < bb[:,3]*ar
+    else:
+        usew = np.zeros(len(bb), dtype=bool)
+    if usew.all():
+        return bbox_resize_array(bb,0,1,ar)
+    if not usew.any():
+        return bbox_resize_array(bb,1,0,ar)
+    bb[usew] = bbox_resize_array(bb[usew],0,1,ar)
+    bb[~usew] = bbox_resize_array(bb[~usew],1,0,ar)
+    return bb
+
+def format_bbs_txt(frames, dets):
+    """
+    Format detections as lines of the bbGt/dbEval result txt, "frame,x,y,w,h,score".
+    All lines are formatted by one % operation.
+
+        INPUT
+            frames: [N] 1-based frame numbers
+            dets:   [Nx5] x1 y1 x2 y2 score, 0-based
+        OUTPUT
+            text:   the N lines
+    """
+    if len(dets) == 0:
+        return ''
+    dets = np.asarray(dets)
+    # the same arithmetic, in the dets dtype, as formatting each row
+    rows = np.column_stack([np.asarray(frames, dtype=np.int64), dets[:,0]+1, dets[:,1]+1,
+                            dets[:,2]-dets[:,0]+1, dets[:,3]-dets[:,1]+1, dets[:,-1]])
+    return ('%d,%.3f,%.3f,%.3f,%.3f,%.7f\n'*len(rows)) % tuple(rows.ravel().tolist())
+
+def write_bbs_results(all_boxes, image_ids, outputs):
+    """
+    Write voc style detections as the per video result txts of the caltech eval code,
+    path/setXX/VYYY.txt. Every output file is written once, in one pass over the videos.
+
+        INPUT
+            all_boxes: all_boxes[cls_ind][im_ind] is a [Nx5] array of x1 y1 x2 y2 score, or []
+            image_ids: image_ids[im_ind] is the image name, like 'set00_V000_I00000'
+            outputs:   a list of (path, cls_inds), the dets of the classes cls_inds of an
+                       image are written to path, class by class
+    """
+    # the images of each video, in the order of image_ids
+    videos = {}
+    for im_ind, im_id in enumerate(image_ids):
+        s, v, i = im_id.split('_')
+        videos.setdefault((s, v), ([], []))
+        videos[(s, v)][0].append(im_ind)
+        videos[(s, v)][1].append(int(i[1:])+1)
+    cls_inds = sorted(set(c for _, cs in outputs for c in cs))
+
+    for (s, v), (im_inds, frames) in videos.items():
+        # all dets of the video, class by class, each in image order
+        lines = {}
+        img_pos = {}
+        for c in cls_inds:
+            dets = [all_boxes[c][k] for k in im_inds]
+            n = np.array([len(d) for d in dets], dtype=np.int64)
+            if n.sum() == 0:
+                lines[c], img_pos[c] = [], np.zeros(0, dtype=np.int64)
+                continue
+            stacked = np.concatenate([d for d in dets if len(d) > 0])
+            text = format_bbs_txt(np.repeat(frames, n), stacked)
+            lines[c] = text.splitlines(True)
+            img_pos[c] = np.repeat(np.arange(len(im_inds)), n)
+        for path, cs in outputs:
+            if len(cs) == 1:
+                text = ''.join(lines[cs[0]])
+            else:
+                # image by image, the classes in the order of cs
+                all_lines = [l for c in cs for l in lines[c]]
+                order = np.argsort(np.concatenate([img_pos[c] for c in cs]), kind='stable')
+                text = ''.join([all_lines[k] for k in order.tolist()])
+            vname = os.path.join(path, s, v+'.txt')
+            mkdir_if_missing(os.path.split(vname)[0])
+            with open(vname, 'w') as f:
+                f.write(text)
@@ -9,73 +9,13 @@ import glob
 import os
 import math
 import time
+import numpy as np
 
 from pydatatool.utils import *
-
-def load_vbb(filename):
-    """
-    A is a dict load from the caltech vbb file has the same data structure.
-        INPUT
-            filename: vbb path
-        OUTPUT
-            vbb: vbb annotation
-        EXAMPLE
-            import pydatatool as pdt
-            vbb = pdt.caltech.load_vbb('/home/all/datasets/caltech/annotations/set00/V000.vbb')
-    """
-    vbb = loadmat(filename)
-    nFrame = int(vbb['A'][0][0][0][0][0])
-    objLists = vbb['A'][0][0][1][0]
-    maxObj = int(vbb['A'][0][0][2][0][0])
-    objInit = vbb['A'][0][0][3][0]
-    objLbl = [str(v[0]) for v in vbb['A'][0][0][4][0]]
-    objStr = vbb['A'][0][0][5][0]
-    objEnd = vbb['A'][0][0][6][0]
-    objHide = vbb['A'][0][0][7][0]
-    altered = int(vbb['A'][0][0][8][0][0])
-    log = vbb['A'][0][0][9][0]
-    logLen = int(vbb['A'][0][0][10][0][0])
-    
-    obj_list = dict()
-    for frame_id, obj in enumerate(objLists):
-        objs = []
-        if obj.shape[1] > 0:
-            for id, pos, occl, lock, posv in zip(obj['id'][0], obj['pos'][0], obj['occl'][0], obj['lock'][0], obj['posv'][0]):
-                id = int(id[0][0])-1 # matlab is 1-start
-                pos = pos[0].tolist()
-                occl = int(occl[0][0])
-                lock = int(lock[0][0])
-                posv = posv[0].tolist()
-                keys_obj = ('id','pos','occl','lock','posv','ignore')
-                datum = dict(zip(keys_obj, [id, pos, occl, lock, posv, False]))
-                datum['lbl'] = objLbl[id]
-                objs.append(datum)
-        obj_list[frame_id] = objs
-    
-    keys_vbb = ('nFrame','objLists','maxObj','objInit','objLbl','objStr','objEnd','objHide','altered','log','logLen')
-    A = dict(zip(keys_vbb, [nFrame, obj_list, maxObj, objInit, objLbl, objStr, objEnd, objHide, altered, log, logLen]))
-    return A
-
-def load_vbbs(ann_dir):
-    """
-    Read all annotations from dir vbb files, data[set_name][video_name]=A
-        INPUT
-            ann_dir: caltech annotations dir
-        OUTPUT
-            vbbs:    all caltech vbb anno, vbbs[set_name][video_name]
-        EXAMPLE
-            import pydatatool as pdt
-            vbbs = pdt.caltech.load_vbbs('/home/all/datasets/caltech/annotations')
-    """
-    vbbs = dict()
-    for dname in sorted(glob.glob(ann_dir+'/set*')):
-        set_name = os.path.basename(dname)
-        vbbs[set_name] = dict()
-        for anno_fn in sorted(glob.glob('{}/*.vbb'.format(dname))):
-            vid_anno = load_vbb(anno_fn)
-            video_name = os.path.splitext(os.path.basename(anno_fn))[0]
-            vbbs[set_name][video_name] = vid_anno
-    return vbbs
+from pydatatool.vbb import *
+from pydatatool.bbgt import *
+from pydatatool.seq import *
+from pydatatool.dbeval import *
 
 def load_image_set(imageSets_file):
     """
@@ -139,24 +79,17 @@ def bbox_filter(bboxs,param):
         
         See also get_default_filter(), bbox_squarify(), bbox_resize()
     """
-    # Tracer()()
-    n = len(bboxs)
+    # a frame has a few boxes, a loop is faster than numpy here,
+    # filter_objLists() filters all boxes of a video at once
     bbox_filted = []
-    
     if len(param['lbls']) != 0:
-        lbl = set(param['lbls'])|(set(param['ilbls'])) 
-        for i in range(n):            
-            if bboxs[i]['lbl'] in lbl:
-                bbox_filted.append(bboxs[i])
-    
-    for i in range(len(bbox_filted)):
-        # Tracer()()
-        bbox_filted[i]['ignore'] = filter(bbox_filted[i],param)
-        
-        if (bbox_filted[i]['ignore'] == 0) and (len(param['squarify']) != 0):
-            bbox_filted[i]['pos'] = bbox_squarify(bbox_filted[i]['pos'],param['squarify'][0],param['squarify'][1])
-        # Tracer()()
-    # Tracer()()
+        lbl = set(param['lbls'])|(set(param['ilbls']))
+        bbox_filted = [bbox for bbox in bboxs if bbox['lbl'] in lbl]
+
+    for bbox in bbox_filted:
+        bbox['ignore'] = bool(filter(bbox,param))
+        if not bbox['ignore'] and len(param['squarify']) != 0:
+            bbox['pos'] = bbox_squarify(bbox['pos'],param['squarify'][0],param['squarify'][1])
     return bbox_filted
 
 def filter(obj,param={}):
@@ -207,8 +140,12 @@ def filter(obj,param={}):
         v = obj['pos'][2] * obj['pos'][3]
         flag = flag or v < param['aRng'][0] or v > param['aRng'][1]
     if len(param['arRng']) != 0:
-        v = obj['pos'][2] / obj['pos'][3]
-        flag = flag or v < param['arRng'][0] or v > param['arRng'][1]
+        if obj['pos'][3] == 0:
+            # no aspect ratio, a zero height box is ignored
+            flag = True
+        else:
+            v = obj['pos'][2] / obj['pos'][3]
+            flag = flag or v < param['arRng'][0] or v > param['arRng'][1]
     if len(param['vRng']) != 0:
         pos  = obj['pos']
         posv = obj['posv']
@@ -216,12 +153,56 @@ def filter(obj,param={}):
             v = 1
         elif posv==pos:
             v = 0
+        elif pos[2]*pos[3] == 0:
+            # no visible ratio, a zero area box is ignored
+            v = float('nan')
         else:
             v = (posv[2]*posv[3])/(pos[2]*pos[3])
-        flag = flag or v < param['vRng'][0] or v > param['vRng'][1]
+        flag = flag or not (param['vRng'][0] <= v <= param['vRng'][1])
     
     return flag
 
+def filter_boxes(lbl,pos,posv,occl,param={}):
+    """
+    Vectorized filter() and bbox_filter() label selection, for all boxes of a video or a dataset.
+        INPUT
+            lbl:   [N] label names
+            pos:   [Nx4] bbox, x y w h
+            posv:  [Nx4] visible bbox, x y w h
+            occl:  [N] occlusion flag
+            param: filter parameter, see get_default_filter()
+        OUTPUT
+            keep:   [N] bool, the boxes bbox_filter() keeps (label in lbls or ilbls)
+            ignore: [N] bool, filter(obj,param) of every box
+        EXAMPLE
+            import pydatatool as pdt
+            vbb = pdt.caltech.load_vbb('/home/all/datasets/caltech/annotations/set00/V000.vbb',columnar=True)
+            objLists = vbb['objLists']
+            lbl = [objLists.lbls[c] for c in objLists.lbl]
+            keep, ignore = pdt.caltech.filter_boxes(lbl,objLists.pos,objLists.posv,objLists.occl,param)
+    """
+    if len(param)==0:
+        n = len(lbl)
+        return np.ones(n, dtype=bool), np.zeros(n, dtype=bool)
+    keep = bbox_keep(lbl,param)
+    ignore = bbox_ignore(lbl,pos,posv,occl,param)
+    return keep, ignore
+
+def filter_objLists(objLists,param={}):
+    """
+    filter_boxes() for all boxes of a video.
+        INPUT
+            objLists: vbb['objLists'], a VbbObjLists or a legacy dict
+            param:    filter parameter, see get_default_filter()
+        OUTPUT
+            keep, ignore: [N] bool arrays over the rows of the columnar objLists,
+                          see VbbObjLists and filter_boxes()
+    """
+    if not isinstance(objLists, VbbObjLists):
+        objLists = VbbObjLists.from_objLists(objLists)
+    lbl = np.asarray(objLists.lbls, dtype=str)[objLists.lbl] if len(objLists.lbls) else []
+    return filter_boxes(lbl,objLists.pos,objLists.posv,objLists.occl,param)
+
 def bbox_squarify(bb,flag,ar=1):
     """
     Fix bb aspect ratios (without moving the bb centers).
@@ -299,12 +280,12 @@ def bbox_resize(bb,hr,wr,ar=0):
         a = math.sqrt(bb[2]*bb[3])
         ar= math.sqrt(ar)
         d = a*ar - bb[2]; bb[0]=bb[0]-d/2; bb[2]=bb[2]+d
-        d = a*ar - bb[3]; bb[1]=bb[1]-d/2; bb[3]=bb[3]+d
+        d = a/ar - bb[3]; bb[1]=bb[1]-d/2; bb[3]=bb[3]+d
         return bb
     if hr!=0:
         d=(hr-1)*bb[3]; bb[1]=bb[1]-d/2; bb[3]=bb[3]+d
     if wr!=0:
-        d=(hr-1)*bb[2]; bb[0]=bb[0]-d/2; bb[2]=bb[2]+d
+        d=(wr-1)*bb[2]; bb[0]=bb[0]-d/2; bb[2]=bb[2]+d
     if hr==0:
         d=bb[2]/ar-bb[3]; bb[1]=bb[1]-d/2; bb[3]=bb[3]+d
     if wr==0:
@@ -418,6 +399,7 @@ def get_dbInfo(dbName):
 def get_image_ids(dbName,vbbs,skip=1):
     """
     Get a list of image_ids, as [{'id':0,'file_name':'set00_V000_I0000','height':640, 'width':480},...]
+    Only 'nFrame' of each video is used, so vbbs from load_vbbs(ann_dir, lazy=True) is not parsed.
     """
     dbInfo = get_dbInfo(dbName)
     image_ids = []
@@ -437,7 +419,7 @@ def get_image_id(s,v,i):
     """
     return s*(10**8)+v*(10**5)+i
 
-def vbbs2cocos(vbbs,dbName,annId_str=0,objId_str=0,param={}):
+def vbbs2cocos(vbbs,dbName,annId_str=0,objId_str=0,param={},skip=1):
     """
     Convert caltech a subset, like train_1x or test_1x, to coco style.
 
@@ -446,6 +428,9 @@ def vbbs2cocos(vbbs,dbName,annId_str=0,objId_str=0,param={}):
             dbName:      a caltech subset name, caltech/caltech_train/caltech_test, see get_dbInfo()
             annId_str:   in coco annotations every ann need a unique id
             objId_str:   in caltech the unqiue obj id in vidoes, we set the unique id in whole dataset
+            skip:        interval of frames as get_image_ids(), only the kept frames are converted.
+                         The ann ids are the same as with skip=1, so the output equals
+                         save_coco() of the skip=1 annotations with get_image_ids(dbName,vbbs,skip).
         OUPUT
             annotations: coco style annotation
             annId_str:  next convert operate start ann id
@@ -470,12 +455,34 @@ def vbbs2cocos(vbbs,dbName,annId_str=0,objId_str=0,param={}):
         for v in dbInfo['vidIds'][s]:
             vid_name = 'V{:0>3}'.format(v)
             anns, annId_str, objId_str = \
-                vbb2coco(s,v,vbbs[set_name][vid_name],annId_str,objId_str,param)
+                vbb2coco(s,v,vbbs[set_name][vid_name],annId_str,objId_str,param,skip)
             annotations.extend(anns)
     
     return annotations, annId_str, objId_str
 
-def vbb2coco(setId,vidId,vbb,annId_str=0,objId_str=0,param={}):
+def iter_vbbs2cocos(vbbs,dbName,annId_str=0,objId_str=0,param={},skip=1):
+    """
+    Generator version of vbbs2cocos(), yields the annotations video by video.
+    The annotation ids and obj ids are the same as vbbs2cocos() gives. Use it with save_coco()
+    to write a subset without holding all its annotations.
+
+        EXAMPLE
+            import pydatatool as pdt
+            vbbs = pdt.caltech.load_vbbs('/home/all/datasets/caltech/annotations', lazy=True)
+            image_ids = pdt.caltech.get_image_ids('caltech_test',vbbs,30)
+            pdt.caltech.save_coco(pdt.caltech.iter_vbbs2cocos(vbbs,'caltech_test'),image_ids,'caltech_test_1x.json')
+    """
+    dbInfo = get_dbInfo(dbName)
+    for s in dbInfo['setIds']:
+        set_name = 'set{:0>2}'.format(s)
+        for v in dbInfo['vidIds'][s]:
+            vid_name = 'V{:0>3}'.format(v)
+            anns, annId_str, objId_str = \
+                vbb2coco(s,v,vbbs[set_name][vid_name],annId_str,objId_str,param,skip)
+            for ann in anns:
+                yield ann
+
+def vbb2coco(setId,vidId,vbb,annId_str=0,objId_str=0,param={},skip=1):
     """
     Convert vbb struct to coco style.
 
@@ -485,6 +492,8 @@ def vbb2coco(setId,vidId,vbb,annId_str=0,objId_str=0,param={}):
             vbb:        the vbb data from vbb_load
             annId_str:  in coco annotations every ann need a unique id
             objId_str:  in caltech the unqiue obj id in vidoes, we set the unique id in whole dataset
+            skip:       interval of frames, only frames skip-1, 2*skip-1, ... are converted,
+                        the ann ids still count the boxes of the skipped frames
         
         OUTPUT
             anns:       a list contains ann dicts
@@ -497,13 +506,21 @@ def vbb2coco(setId,vidId,vbb,annId_str=0,objId_str=0,param={}):
             anns, annId_str, objId_str = pdt.caltech.vbb2coco(1,1,vbbs['set01']['V001'])
     """
     anns = []
-    for i in range(0,vbb['nFrame']):
+    objLists = vbb['objLists']
+    if isinstance(objLists, VbbObjLists):
+        n_objs = np.diff(objLists.offsets)
+    else:
+        n_objs = np.array([len(objLists[i]) for i in range(vbb['nFrame'])], dtype=np.int64)
+    # the first ann id of every frame, as if all frames were converted
+    frame_annId = annId_str + np.concatenate([[0], np.cumsum(n_objs)])
+    for i in range(skip-1,vbb['nFrame'],skip):
 
-        objs = vbb['objLists'][i]
+        objs = objLists[i]
+        annId = int(frame_annId[i])
         if len(objs) > 0:
             for obj in objs:
                 ann={}
-                ann['id']=annId_str
+                ann['id']=annId
                 ann['obj_id']=objId_str+obj['id']
                 ann['image_id']=get_image_id(setId,vidId,i)
                 ann['category_name']=vbb['objLbl'][obj['id']]
@@ -515,10 +532,45 @@ def vbb2coco(setId,vidId,vbb,annId_str=0,objId_str=0,param={}):
                 ann['occl']=obj['occl']
                 ann['segmentation']=[]
                 ann['area']=obj['pos'][2]*obj['pos'][3]
-                annId_str=annId_str+1
+                annId=annId+1
                 anns.append(ann)
 
-    return anns, annId_str, objId_str + vbb['maxObj']
+    return anns, int(frame_annId[-1]), objId_str + vbb['maxObj']
+
+def vbbs2cocos_setups(vbbs,dbName,setups,annId_str=0,objId_str=0,skip=1):
+    """
+    Convert a subset to coco style for several filter setups in one traversal.
+
+        Every box gets one iscrowd flag per setup, computed by filter_objLists() for the
+        whole video at once. Save the result with save_cocos().
+
+        INPUT
+            vbbs:        vbb annoations from load_vbbs, vbbs[set_name][vid_name] is a vbb anno.
+            dbName:      a subset name, see get_dbInfo()
+            setups:      a list of (name, param), param is a filter param from get_default_filter()
+            annId_str:   in coco annotations every ann need a unique id
+            objId_str:   the unique obj id start in the whole dataset
+            skip:        interval of frames, see vbbs2cocos()
+        OUPUT
+            annotations: coco style annotation as vbbs2cocos(), with ann['iscrowd_'+name] for every setup,
+                         ann['iscrowd'] is the flag of the first setup
+            annId_str:   next convert operate start ann id
+            objId_str:   next convert operate start obj id
+        EXAMPLE
+            import pydatatool as pdt
+            vbbs = pdt.caltech.load_vbbs('/home/all/datasets/caltech/annotations')
+            reasonable = pdt.caltech.get_default_filter()
+            reasonable['hRng'] = [50,float('inf')]
+            reasonable['vRng'] = [0.65,1]
+            nooccl = pdt.caltech.get_default_filter()
+            nooccl['vRng'] = [1,1]
+            setups = [('reasonable',reasonable),('nooccl',nooccl),('all',pdt.caltech.get_default_filter())]
+            annotations, annId_str, objId_str = pdt.caltech.vbbs2cocos_setups(vbbs,'caltech_test',setups)
+            image_ids = pdt.caltech.get_image_ids('caltech_test',vbbs,30)
+            pdt.caltech.save_cocos(annotations,image_ids,setups,'caltech_test_{}.json')
+    """
+    return vbbs_setups_to_cocos(vbbs,dbName,setups,annId_str,objId_str,skip,
+                                get_dbInfo,get_image_id,get_categories(),filter_objLists)
 
 def load_txt(filename):
     # label x y w h occ xv yv wv hv ignore ang
@@ -559,32 +611,77 @@ def txt2coco(imgId,objs,annId_str=0,objId_str=0,param={}):
         anns.append(ann)
     return anns, annId_str, objId_str + len(anns)
 
-def txts2cocos(pth,annId_str=0,objId_str=0,param={}):
+def load_txts(pth,files=None,workers=0):
+    """
+    Load the per frame txt annotations of a dir with a thread pool.
+
+        INPUT
+            pth:     a dir contains setXX_VYYY_IZZZZZ.txt files
+            files:   file names in pth to load, default all of sorted(os.listdir(pth))
+            workers: number of threads reading the files, 0 or 1 reads them one by one.
+                     Threads pay off on network or cold disks, where opening the files dominates.
+        OUTPUT
+            files:   the file names, in the order of objs
+            objs:    a list, objs[k] is load_txt() of files[k]
+    """
+    if files is None:
+        files = sorted(os.listdir(pth))
+    paths = [os.path.join(pth,fn) for fn in files]
+    if workers > 1 and len(paths) > 1:
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            objs = list(executor.map(load_txt, paths))
+    else:
+        objs = [load_txt(fn) for fn in paths]
+    return files, objs
+
+def txts2cocos(pth,annId_str=0,objId_str=0,param={},workers=0):
+    """
+    Convert a dir of per frame txt annotations, like setXX_VYYY_IZZZZZ.txt, to coco style.
+
+        INPUT
+            pth:         a dir contains the txt annotations
+            annId_str:   in coco annotations every ann need a unique id
+            objId_str:   the unique obj id start
+            param:       filter param, see get_default_filter()
+            workers:     number of threads reading the files, see load_txts()
+        OUTPUT
+            annotations: coco style annotation
+            image_ids:   a list contains image dicts, one per txt file
+            annId_str:   next convert operate start ann id
+            objId_str:   next convert operate start obj id
+    """
+    files, objs = load_txts(pth,workers=workers)
+
+    names = [fn.split('.')[0] for fn in files]
+    imgIds = np.array([[int(x[3:]), int(y[1:]), int(z[1:])] for x, y, z in
+                       (name.split('_') for name in names)], dtype=np.int64).reshape(-1, 3)
+    imgIds = imgIds[:,0]*(10**8) + imgIds[:,1]*(10**5) + imgIds[:,2]
+
+    # every file starts its ann and obj ids after the boxes of the files before it
+    n_objs = np.array([len(o) for o in objs], dtype=np.int64)
+    starts = np.concatenate([[0], np.cumsum(n_objs)])
+
     annotations = []
     image_ids = []
-    files = sorted(os.listdir(pth))
-    for i in range(len(files)):
-        imgIds = files[i].split('.')[0].split("_")
-        setId = int(imgIds[0][3:])
-        vidId = int(imgIds[1][1:])
-        frmId = int(imgIds[2][1:])
-        imgId = get_image_id(setId, vidId, frmId)
-        annpth = os.path.join(pth,files[i])
-        objs = load_txt(annpth)
-        anns, annId_str, objId_str = txt2coco(imgId, objs, annId_str, objId_str, param)
+    for k in range(len(files)):
+        imgId = int(imgIds[k])
+        anns, _, _ = txt2coco(imgId, objs[k], annId_str+int(starts[k]), objId_str+int(starts[k]), param)
         annotations.extend(anns)
-        img_name = files[i].split('.')[0]+".jpg"
         image_ids.append(
-            {'id': imgId, 'file_name': img_name, 'height': 480, 'width': 640})
+            {'id': imgId, 'file_name': names[k]+".jpg", 'height': 480, 'width': 640})
 
-    return annotations, image_ids, annId_str, objId_str
+    return annotations, image_ids, annId_str+int(starts[-1]), objId_str+int(starts[-1])
 
 def save_coco(annotations,image_ids,json_file):
     """
     Save annotations to a json file, as coco style.
 
+    The file is written by save_json_stream(), annotations can be a generator, e.g.
+    iter_vbbs2cocos(), and are never all held in memory. A json_file ending with .gz is gzip compressed.
+
     INPUT
-        annotations: a list contaions annotation dicts
+        annotations: a list or an iterable of annotation dicts
         image_ids: a list contaions image dicts
         json_file: the file to save
 
@@ -594,27 +691,125 @@ def save_coco(annotations,image_ids,json_file):
         annotations, annId_str, objId_str = pdt.caltech.vbbs2cocos(vbbs,'caltech')
         image_ids = pdt.caltech.get_image_ids('caltech',vbbs)
         pdt.caltech.save_coco(annotations,image_ids,'caltech.json')
+        # streaming
+        pdt.caltech.save_coco(pdt.caltech.iter_vbbs2cocos(vbbs,'caltech'),image_ids,'caltech.json.gz')
+    """
+    # a set makes the join linear in the number of annotations
+    img_ids = set(img['id'] for img in image_ids)
+
+    n_drop = [0]
+    def annos():
+        for ann in annotations:
+            if ann['image_id'] in img_ids:
+                yield ann
+            else:
+                n_drop[0] += 1
+
+    info = {'description': 'This is a json version label of the Caltech Pedestrian dataset, converted from vbb version.',
+            'version': '1.1',
+            'vbb_version': '1.4',
+            'create_time': '2018-04-03'}
+
+    save_json_stream(json_file, [('info',info),
+                                 ('images',image_ids),
+                                 ('annotations',annos()),
+                                 ('categories',get_categories())])
+    if n_drop[0] > 0:
+        print('Drop {} annotations whose image is not in image_ids.'.format(n_drop[0]))
+
+def save_cocos(annotations,image_ids,setups,json_file):
     """
-    json_data = {'info':{}, 'images':[], 'annotations':[], 'categories':[]}
+    Save the annotations of vbbs2cocos_setups().
 
-    img_ids = [img['id'] for img in image_ids]
+    INPUT
+        annotations: annotations from vbbs2cocos_setups()
+        image_ids:   a list contaions image dicts
+        setups:      the setups given to vbbs2cocos_setups(), a list of (name, param)
+        json_file:   if it contains '{}', one file per setup is written, json_file.format(name),
+                     with ann['iscrowd'] of that setup. Otherwise a single file is written
+                     which keeps the ann['iscrowd_'+name] columns.
 
-    annos = [ann for ann in annotations if ann['image_id'] in img_ids]
+    EXAMPLE
+        see vbbs2cocos_setups()
+    """
+    if '{}' not in json_file:
+        save_coco(annotations,image_ids,json_file)
+        return
+    flag_keys = set('iscrowd_'+name for name, _ in setups)
+    for name, _ in setups:
+        annos = []
+        for ann in annotations:
+            a = {k:v for k,v in ann.items() if k not in flag_keys}
+            a['iscrowd'] = ann['iscrowd_'+name]
+            annos.append(a)
+        save_coco(annos,image_ids,json_file.format(name))
+
+def export_cocos(vbbs,targets,annId_str=0,objId_str=0):
+    """
+    Convert and save several subsets, e.g. train/test at several skip rates, in one traversal.
 
-    json_data['images'] = image_ids
+        Every video is read once for all targets that contain it. The ann ids and obj ids are
+        global: a box has the same ids in every output, and they are the ids that chained
+        vbbs2cocos() calls over the subsets in set order would give. A target is saved
+        as soon as its last video is converted, only the unsaved targets are held in memory.
 
-    json_data['categories'] = get_categories()
+        INPUT
+            vbbs:      vbb annoations from load_vbbs, vbbs[set_name][vid_name] is a vbb anno.
+            targets:   a list of (dbName, skip, param, json_file), see get_dbInfo(),
+                       get_image_ids() and get_default_filter()
+            annId_str: the first ann id
+            objId_str: the first obj id
+        OUTPUT
+            annId_str: next convert operate start ann id
+            objId_str: next convert operate start obj id
+        EXAMPLE
+            import pydatatool as pdt
+            vbbs = pdt.caltech.load_vbbs('/home/all/datasets/caltech/annotations', lazy=True)
+            param = pdt.caltech.get_default_filter()
+            pdt.caltech.export_cocos(vbbs, [('caltech_train', 3, param, 'caltech_train_10x.json'),
+                                         ('caltech_train', 1, param, 'caltech_train_all.json'),
+                                         ('caltech_test', 30, param, 'caltech_test_1x.json')])
+    """
+    return export_vbbs_cocos(vbbs,targets,annId_str,objId_str,
+                             get_dbInfo,get_image_ids,vbb2coco,save_coco)
 
-    json_data['annotations'] = annos
+def update_coco(ann_dir,dbName,json_file,param={},skip=1,manifest_file=None,cache_dir=None,ext='vbb',annId_str=0,objId_str=0):
+    """
+    Convert a subset to a coco json incrementally, only the videos whose vbb file changed
+    since the last run are converted again.
 
-    json_data['info']={'description': 'This is a json version label of the Caltech Pedestrian dataset, converted from vbb version.',
-            'version': '1.1',
-            'vbb_version': '1.4',
-            'create_time': '2018-04-03'}
+        A manifest next to json_file keeps the content hash, nFrame and the allocated ann id
+        and obj id ranges of every video. A changed video is converted and spliced into the
+        existing json_file, the annotations of the other videos are copied as they are, so
+        their ids never change. A changed video keeps its id ranges if its boxes still fit,
+        otherwise it gets new ranges after all allocated ids.
+        The first run, or a run with another dbName, param, skip or ext, converts everything
+        and gives the same file as vbbs2cocos() and save_coco().
 
-    save_json(json_data,json_file)
+        INPUT
+            ann_dir:       annotations dir, contains set*/V*.vbb
+            dbName:        a subset name, see get_dbInfo()
+            json_file:     the coco json to create or update
+            param:         filter param, see vbbs2cocos()
+            skip:          interval of frames, see get_image_ids()
+            manifest_file: default json_file+'.manifest'
+            cache_dir:     vbb cache dir, see load_vbbs()
+            ext:           'vbb' or 'txt', see load_vbbs()
+            annId_str:     the first ann id of a full conversion
+            objId_str:     the first obj id of a full conversion
+        OUTPUT
+            changed:       the converted videos, as 'setXX/VYYY'
+        EXAMPLE
+            import pydatatool as pdt
+            param = pdt.caltech.get_default_filter()
+            pdt.caltech.update_coco('/home/all/datasets/caltech/annotations','caltech_test','caltech_test_1x.json',param,30)
+            # after re-annotating some videos, only they are converted
+            pdt.caltech.update_coco('/home/all/datasets/caltech/annotations','caltech_test','caltech_test_1x.json',param,30)
+    """
+    return update_vbbs_coco(ann_dir,dbName,json_file,param,skip,manifest_file,cache_dir,ext,annId_str,objId_str,
+                            get_dbInfo,get_image_ids,vbb2coco,save_coco)
 
-def seqs2imgs(dbName,sdir,tdir,skip=1):
+def seqs2imgs(dbName,sdir,tdir,skip=1,workers=0,index_dir=None):
     """
     Convert caltech seq set to images, like the dbExtract.m
 
@@ -623,56 +818,90 @@ def seqs2imgs(dbName,sdir,tdir,skip=1):
         sdir: a directory contains the videos, e.g. the videos dir in caltech dataset.
         tdir: the ouput images dir
         skip: interval of frames
+        workers: number of videos extracted at the same time, see extract_seqs()
+        index_dir: where the frame indexes are kept, see SeqReader
+
+    OUTPUT
+        n_frames, n_bytes: the number and total size of the written images
 
     EXAMPLE
         seqs2imgs('caltech','/home/all/datasets/caltech/videos','./extract',30)
+        seqs2imgs('caltech','/home/all/datasets/caltech/videos','./extract',30,workers=8)
     """
     dbInfo = get_dbInfo(dbName)
     if not os.path.exists(sdir):
         print("The videos directory {} is not exits.".format(sdir))
+    vnames = []
     for s in dbInfo['setIds']:
         set_name = 'set{:0>2}'.format(s)
         for v in dbInfo['vidIds'][s]:
             vid_name = 'V{:0>3}.seq'.format(v)
-            vname = os.path.join(sdir,set_name,vid_name)
-            print("Extrace {} to imgs.".format(vname))
-            tic = time.time()
-            seq2imgs(vname,tdir,skip)
-            print('Done (t={:0.2f}s)'.format(time.time()-tic))
+            vnames.append(os.path.join(sdir,set_name,vid_name))
+    return extract_seqs(vnames,tdir,skip,workers,index_dir)
 
-def seq2imgs(vname,tdir,skip=1):
+def build_seq_index(dbName,sdir,workers=0,index_dir=None):
     """
-    Convert a seq file to images.
+    Build the frame index of every seq video of a subset, see SeqReader.
+    Videos with a valid index are skipped, later readers and seqs2imgs() load the index
+    instead of scanning the videos.
+
+    INPUT
+        dbName: a string defind in get_dbInfo
+        sdir: a directory contains the videos, e.g. the videos dir in caltech dataset.
+        workers: number of processes, 0 or 1 indexes the videos one by one
+        index_dir: keep the index files here instead of next to the videos
+
+    OUTPUT
+        nFrames: {'setXX/VYYY': number of frames}
+
+    EXAMPLE
+        pdt.caltech.build_seq_index('caltech','/home/all/datasets/caltech/videos',workers=8)
+    """
+    dbInfo = get_dbInfo(dbName)
+    names = []
+    for s in dbInfo['setIds']:
+        for v in dbInfo['vidIds'][s]:
+            names.append('set{:0>2}/V{:0>3}'.format(s,v))
+    tic = time.time()
+    nFrames = index_seqs([os.path.join(sdir,name+'.seq') for name in names], workers, index_dir)
+    print('Index {} videos (t={:0.2f}s)'.format(len(names), time.time()-tic))
+    return dict(zip(names, nFrames))
+
+class SeqFrameDataset(SeqFrames):
+    """
+    A caltech subset read straight from the seq videos, see SeqFrames.
+
         INPUT
-            vname: the seq file path
-            tdir: the ouput images dir
-            skip: interval of frames
+            dbName:       a subset name, see get_dbInfo()
+            video_dir:    the videos dir, contains setXX/VYYY.seq
+            coco_or_vbbs: a coco dict or json file, whose images of the subset at the skip
+                          frames are used, or the vbbs of load_vbbs(), which are converted
+                          by iter_vbbs2cocos() with param
+            skip:         interval of frames, see get_image_ids()
+            param:        filter param, only used with vbbs
+            decode:       see SeqFrames
+            index_dir:    see SeqReader
         EXAMPLE
-            pdt.caltech.seq2imgs('/home/all/datasets/caltech/videos/set00/V000.seq','./extract',30)
-    """
-    f = open(vname, 'rb')
-    s,v = os.path.split(vname)
-    v,_ = os.path.splitext(v)
-    _,s = os.path.split(s)
-    string = str(f.read())
-    splitstring = '\xFF\xD8\xFF\xE0\x00\x10\x4A\x46\x49\x46'
-    mkdir_if_missing(tdir)
-    strlist = string.split(splitstring)
-    # deal with file segment, every segment is an image except the first one 
-    # Skip the first one, which is filled with .seq header
-    n_frames = 0
-    for idx, img in enumerate(strlist[1:]):
-        if ((idx+1) % skip) == 0:
-            fname = "{}_{}_{:0>5}.jpg".format(s,v,idx) 
-            fname=os.path.join(tdir, fname)
-            
-            with open(fname,'wb+') as i:
-                #print('\rWriting image: {:s}'.format(fname))
-                i.write(splitstring + img)
-                i.close()
-                n_frames += 1
-    print('#Frames: {:d}'.format(n_frames))
-    f.close()
+            import pydatatool as pdt
+            import cv2
+            vbbs = pdt.caltech.load_vbbs('/home/all/datasets/caltech/annotations', lazy=True)
+            decode = lambda b: cv2.imdecode(np.frombuffer(b, np.uint8), cv2.IMREAD_COLOR)
+            ds = pdt.caltech.SeqFrameDataset('caltech_train', '/home/all/datasets/caltech/videos', vbbs, 3, decode=decode)
+            for sample in ds.prefetch(workers=8):
+                im, anns = sample['image'], sample['anns']
+    """
+    def __init__(self,dbName,video_dir,coco_or_vbbs,skip=1,param={},decode=None,index_dir=None):
+        dbInfo = get_dbInfo(dbName)
+        if isinstance(coco_or_vbbs, str) or 'images' in coco_or_vbbs:
+            coco = coco_or_vbbs if not isinstance(coco_or_vbbs, str) else load_json(coco_or_vbbs)
+            vids = set((s,v) for s in dbInfo['setIds'] for v in dbInfo['vidIds'][s])
+            images = [img for img in coco['images']
+                      if (img['id']//(10**8), img['id']//(10**5)%1000) in vids and img['id']%(10**5)%skip == skip-1]
+            anns = coco['annotations']
+        else:
+            images = get_image_ids(dbName,coco_or_vbbs,skip)
+            anns = iter_vbbs2cocos(coco_or_vbbs,dbName,param=param,skip=skip)
+        SeqFrames.__init__(self,video_dir,images,anns,decode,index_dir)
 
 def get_classes():
     """
@@ -697,34 +926,11 @@ def write_voc_results_file(all_boxes,image_ids,path,classes):
                  |-set07---V000.txt
                  |...    |...
     """
-    # set_trace()
-    for cls_ind, cls in enumerate(classes):
-        if cls != 'person':
-            continue
-        print('Writing {} VOC results file'.format(cls))
-        tmp=''
-        f=False
-        for im_ind, im_id in enumerate(image_ids):
-            s,v,i = im_id.split('_')
-            vname = os.path.join(path,s,v+'.txt')
-
-            if vname!=tmp:
-                if f:
-                    f.close()
-                mkdir_if_missing(os.path.split(vname)[0])
-                f = open(vname,'w')
-                tmp = vname
-            dets = all_boxes[cls_ind][im_ind]
-            if dets == []:
-                continue
-            # the VOCdevkit expects 1-based indices
-            for k in range(dets.shape[0]):
-                line = "{:d},{:.3f},{:.3f},{:.3f},{:.3f},{:.7f}\n".format(
-                    int(i[1:])+1, dets[k,0]+1, dets[k,1]+1,
-                    dets[k,2]-dets[k,0]+1, dets[k,3]-dets[k,1]+1, dets[k,-1])
-                f.write(line)
-
-def convert_voc_annoations(image_identifiers, ann_dir, param={}):
+    print('Writing {} VOC results file'.format('person'))
+    outputs = [(path, [k]) for k, cls in enumerate(classes) if cls == 'person']
+    write_bbs_results(all_boxes,image_ids,outputs)
+
+def convert_voc_annoations(image_identifiers, ann_dir, param={}, cache_dir=None):
     '''
     Get all image_identifiers annotation
 
@@ -732,6 +938,7 @@ def convert_voc_annoations(image_identifiers, ann_dir, param={}):
             image_identifiers   - a list contaions image identifier like 'set00_V000_00000'
             ann_dir             - 
             param               - filter param
+            cache_dir           - vbb cache dir, see load_vbbs()
         OUPUT:
             anno : {'set00_V000_I00121': [{'id': 3,
                                         'lbl': 'person',
@@ -743,25 +950,20 @@ def convert_voc_annoations(image_identifiers, ann_dir, param={}):
                     ...}
     '''
     anno = {}
-    data = defaultdict(dict)
-    for dname in sorted(glob.glob(ann_dir+'/set*')):
-        set_name = os.path.basename(dname)
-        data[set_name] = defaultdict(dict)
-        for anno_fn in sorted(glob.glob('{}/*.vbb'.format(dname))):
-            vid_anno = load_vbb(anno_fn)
-            video_name = os.path.splitext(os.path.basename(anno_fn))[0]
-            data[set_name][video_name] = vid_anno['objLists']
-            
+    # only the videos named in image_identifiers are parsed
+    vbbs = load_vbbs(ann_dir, lazy=True, cache_dir=cache_dir)
+
     for image_identifier in image_identifiers:
         image_set_name = image_identifier[0:5]
         image_seq_name = image_identifier[6:10]
         image_id       = int(image_identifier[11:])
         #Tracer()()
-        if image_id in data[image_set_name][image_seq_name]:
+        vbb = vbbs.get(image_set_name, {}).get(image_seq_name)
+        if vbb is not None and image_id in vbb['objLists']:
             if len(param)!=0:
-                anno[image_identifier] = bbox_filter(data[image_set_name][image_seq_name][image_id],param)
+                anno[image_identifier] = bbox_filter(vbb['objLists'][image_id],param)
             else:
-                anno[image_identifier] = data[image_set_name][image_seq_name][image_id]
+                anno[image_identifier] = vbb['objLists'][image_id]
         else:
             print("Warning: No %s.jpg found in annotations" %(image_identifier))
            
@@ -801,4 +1003,44 @@ def do_matlab_eval(path, res_dir, output_dir):
     if p.returncode == 0:
         print('Subprogram success')
     else:
-        print('Subprogram failed')
\ No newline at end of file
+        print('Subprogram failed')
+
+def do_python_eval(res_dir, ann_dir, dbName='caltech_test', setups=None, skip=None, bnds=[5,5,635,475], workers=0, cache_dir=None, ext='vbb'):
+    """
+    Evaluate the results of write_voc_results_file() in python, without matlab.
+    The log-average miss rate over fppi [1e-2,1] of dbEval.m, gt is filtered as its
+    filterGt: 'person' boxes in the height, visibility and aspect ratio range of the
+    setup and inside bnds, the other 'person?', 'people' and 'person-fa' boxes are ignore.
+
+        INPUT
+            res_dir:   results dir, res_dir/setXX/VYYY.txt
+            ann_dir:   vbb annotations dir, ann_dir/setXX/VYYY.vbb
+            dbName:    the evaluated subset, see get_dbInfo()
+            setups:    names of the setups, default all, see get_eval_setups()
+            skip:      evaluate frames skip-1, 2*skip-1, ..., default the skip of dbName
+            bnds:      [x1 y1 x2 y2] gt outside is ignore
+            workers:   number of processes evaluating the videos
+            cache_dir: vbb cache dir, see load_vbbs()
+            ext:       'vbb' or 'txt' annotations
+        OUTPUT
+            results:   a list of dicts, one per setup, see db_eval()
+        EXAMPLE
+            import pydatatool as pdt
+            results = pdt.caltech.do_python_eval('output/res', '/home/all/datasets/caltech/annotations', workers=8)
+            mr = {r['name']:r['mr'] for r in results}['Reasonable']
+    """
+    dbInfo = get_dbInfo(dbName)
+    if skip is None:
+        skip = dbInfo['skip']
+    videos = []
+    for s in dbInfo['setIds']:
+        set_name = 'set{:0>2}'.format(s)
+        for v in dbInfo['vidIds'][s]:
+            vid_name = 'V{:0>3}'.format(v)
+            videos.append((os.path.join(ann_dir, set_name, vid_name+'.'+ext),
+                           os.path.join(res_dir, set_name, vid_name+'.txt')))
+    print('Evaluating {} videos of {} ...'.format(len(videos), dbName))
+    results = db_eval(videos, skip, get_eval_setups(setups), ['person','person?','people','person-fa'], ['person'], bnds,
+                      workers=workers, cache_dir=cache_dir)
+    print_eval_results(results)
+    return results
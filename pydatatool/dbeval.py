@@ -0,0 +1,273 @@
+# Copyright (c) 2018, Zhewei Xu
+# [xzhewei-at-gmail.com]
+# Licensed under The MIT License [see LICENSE for details]
+
+# Evaluation of detection results against vbb ground truth, a numpy port of
+# dbEval.m and bbGt('evalRes'/'compRoc') of the Caltech evaluation code.
+# Shared by caltech, kaist and scut, which only differ in labels and bounds.
+
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+import numpy as np
+import os
+
+from pydatatool.vbb import load_vbb_cached
+from pydatatool.bbgt import bbox_resize_array
+
+def get_eval_setups(names=None):
+    """
+    The experiments of dbEval.m.
+        INPUT
+            names:  the setup names to keep, default all
+        OUTPUT
+            setups: a list of dicts with
+                name:     e.g. 'Reasonable'
+                hr:       gt height range, [min max)
+                vr:       gt visible ratio range, [min max], inf for unoccluded gt
+                ar:       0, or gt |w/h-aspectRatio| < ar for ar > 0, > -ar for ar < 0
+                overlap:  match threshold
+                filterGt: dts are kept if their height is in hr*[1/filterGt filterGt]
+    """
+    inf = float('inf')
+    exps = [('Reasonable',     [50,inf],  [.65,inf], 0,   .5,  1.25),
+            ('All',            [20,inf],  [.2,inf],  0,   .5,  1.25),
+            ('Scale=large',    [100,inf], [inf,inf], 0,   .5,  1.25),
+            ('Scale=near',     [80,inf],  [inf,inf], 0,   .5,  1.25),
+            ('Scale=medium',   [30,80],   [inf,inf], 0,   .5,  1.25),
+            ('Scale=far',      [20,30],   [inf,inf], 0,   .5,  1.25),
+            ('Occ=none',       [50,inf],  [inf,inf], 0,   .5,  1.25),
+            ('Occ=partial',    [50,inf],  [.65,1],   0,   .5,  1.25),
+            ('Occ=heavy',      [50,inf],  [.2,.65],  0,   .5,  1.25),
+            ('Ar=all',         [50,inf],  [inf,inf], 0,   .5,  1.25),
+            ('Ar=typical',     [50,inf],  [inf,inf], .1,  .5,  1.25),
+            ('Ar=atypical',    [50,inf],  [inf,inf], -.1, .5,  1.25),
+            ('Overlap=25',     [50,inf],  [.65,inf], 0,   .25, 1.25),
+            ('Overlap=50',     [50,inf],  [.65,inf], 0,   .5,  1.25),
+            ('Overlap=75',     [50,inf],  [.65,inf], 0,   .75, 1.25),
+            ('Expand=100',     [50,inf],  [.65,inf], 0,   .5,  1.00),
+            ('Expand=125',     [50,inf],  [.65,inf], 0,   .5,  1.25),
+            ('Expand=150',     [50,inf],  [.65,inf], 0,   .5,  1.50)]
+    setups = [dict(zip(('name','hr','vr','ar','overlap','filterGt'), e)) for e in exps]
+    if names is not None:
+        setups = [e for e in setups if e['name'] in names]
+    return setups
+
+def filter_gt(lbl, pos, posv, setup, plbls, bnds, aspectRatio=.41):
+    """
+    filterGtFun of dbEval.m for N boxes.
+        INPUT
+            lbl:   [N] label names
+            pos:   [Nx4] bbox, x y w h
+            posv:  [Nx4] visible bbox, all zero for an unoccluded box
+            setup: a dict from get_eval_setups()
+            plbls: the positive labels, e.g. ['person']
+            bnds:  [x1 y1 x2 y2], boxes must be inside
+        OUTPUT
+            keep:  [N] bool, False for the gt which is ignored
+    """
+    pos = np.asarray(pos, dtype=np.float64).reshape(-1, 4)
+    posv = np.asarray(posv, dtype=np.float64).reshape(-1, 4)
+    hr, vr, ar = setup['hr'], setup['vr'], setup['ar']
+    p = np.isin(np.asarray(lbl, dtype=str), plbls)
+    p &= (pos[:,3] >= hr[0]) & (pos[:,3] < hr[1])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        vf = np.where((posv == 0).all(axis=1), np.inf, posv[:,2]*posv[:,3]/(pos[:,2]*pos[:,3]))
+        p &= (vf >= vr[0]) & (vf <= vr[1])
+        if ar != 0:
+            p &= np.sign(ar)*np.abs(pos[:,2]/pos[:,3]-aspectRatio) < ar
+    p &= (pos[:,0] >= bnds[0]) & (pos[:,0]+pos[:,2] <= bnds[2])
+    p &= (pos[:,1] >= bnds[1]) & (pos[:,1]+pos[:,3] <= bnds[3])
+    return p
+
+def comp_oas(dt, gt, ig):
+    """
+    bbGt's compOas, the overlap of every dt and gt box. For an ignore gt the
+    overlap is the intersection over the dt area.
+        INPUT
+            dt: [Mx4], gt: [Nx4], x y w h
+            ig: [N] bool
+        OUTPUT
+            oa: [MxN]
+    """
+    de = dt[:,None,:2] + dt[:,None,2:4]
+    ge = gt[None,:,:2] + gt[None,:,2:4]
+    wh = np.minimum(de, ge) - np.maximum(dt[:,None,:2], gt[None,:,:2])
+    t = np.where((wh > 0).all(axis=2), wh[:,:,0]*wh[:,:,1], 0)
+    da = (dt[:,2]*dt[:,3])[:,None]
+    ga = (gt[:,2]*gt[:,3])[None,:]
+    u = np.where(ig[None,:], da, da+ga-t)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(t > 0, t/u, 0)
+
+def eval_res(gt, dt, thr=.5):
+    """
+    bbGt('evalRes') of one image, greedy matching of the dts by score.
+        INPUT
+            gt:  [Nx5] x y w h ignore
+            dt:  [Mx5] x y w h score
+            thr: overlap threshold
+        OUTPUT
+            gt:  [Nx5] the gts, non ignored first, col 5 is 1 matched, 0 missed, -1 ignore
+            dt:  [Mx6] the dts by score, col 6 is 1 true positive, 0 false positive,
+                 -1 matched to an ignore gt
+    """
+    gt = np.asarray(gt, dtype=np.float64).reshape(-1, 5)
+    dt = np.asarray(dt, dtype=np.float64).reshape(-1, 5)
+    # sort dt highest score first, gt ignore last, both stable as matlab's sort
+    dt = dt[np.argsort(-dt[:,4], kind='stable')]
+    gt = gt[np.argsort(gt[:,4], kind='stable')]
+    gt[:,4] = -gt[:,4]
+    dt = np.hstack([dt, np.zeros((len(dt),1))])
+    ig = gt[:,4] == -1
+    oa = comp_oas(dt[:,:4], gt[:,:4], ig)
+    for d in range(len(dt)):
+        # the best unmatched gt, on a tie the last one as the matlab loop
+        cand = (gt[:,4] == 0) & (oa[d] >= thr)
+        if cand.any():
+            g = np.flatnonzero(cand & (oa[d] == oa[d][cand].max()))[-1]
+            gt[g,4] = 1
+            dt[d,5] = 1
+        elif (ig & (oa[d] >= thr)).any():
+            dt[d,5] = -1
+    return gt, dt
+
+def comp_roc(n_gt, n_img, scores, tps, ref=10.**np.arange(-2, .01, .25)):
+    """
+    bbGt('compRoc') for the roc of all images, from the outputs of eval_res().
+    As compRoc, without dts the curves are [0] and the recall at ref is 0, and
+    without gts the recall is 0 everywhere, both give a miss rate of 1.
+        INPUT
+            n_gt:   number of not ignored gts
+            n_img:  number of images
+            scores: [M] scores of the dts which are not matched to an ignore gt
+            tps:    [M] 1 for a true positive, 0 for a false positive
+            ref:    fppi reference points
+        OUTPUT
+            fppi:   [M] false positives per image
+            recall: [M] recall at every dt
+            ref_recall: recall at ref
+    """
+    if len(scores) == 0:
+        return np.zeros(1), np.zeros(1), np.zeros(len(ref))
+    n_gt = max(n_gt, np.finfo(np.float64).eps)
+    order = np.argsort(-np.asarray(scores, dtype=np.float64), kind='stable')
+    tp = np.asarray(tps, dtype=np.float64)[order]
+    fppi = np.cumsum(tp != 1)/float(n_img)
+    recall = np.cumsum(tp)/float(n_gt)
+    xs1 = np.concatenate([[-np.inf], fppi])
+    ys1 = np.concatenate([[0], recall])
+    ref_recall = ys1[np.searchsorted(xs1, ref, side='right')-1]
+    return fppi, recall, ref_recall
+
+def log_average_miss_rate(ref_recall):
+    """
+    exp(mean(log(miss rate))) over the fppi reference points, as dbEval.m.
+    """
+    return float(np.exp(np.mean(np.log(np.maximum(1e-10, 1-np.asarray(ref_recall))))))
+
+def load_bbs_txt(filename):
+    """
+    Load a result txt of write_bbs_results(), rows of frame,x,y,w,h,score.
+    """
+    if not os.path.exists(filename) or os.path.getsize(filename) == 0:
+        return np.zeros((0, 6))
+    return np.loadtxt(filename, delimiter=',', ndmin=2)
+
+def eval_video(vbb_file, res_file, skip, setups, lbls, plbls, bnds, aspectRatio=.41, cache_dir=None):
+    """
+    Match the dts of one video to its gt for every setup, the loadGt, loadDt and
+    evalAlgs steps of dbEval.m.
+        INPUT
+            vbb_file:  the vbb of the video
+            res_file:  its result txt, frames are 1-based
+            skip:      frames skip-1, 2*skip-1, ... are evaluated
+            setups:    from get_eval_setups()
+            lbls:      the gt labels which are loaded, the other boxes are dropped
+            plbls:     the positive labels, see filter_gt()
+            bnds:      see filter_gt()
+            aspectRatio: the gt and dt boxes are resized to this width/height
+            cache_dir: vbb cache dir, see load_vbbs()
+        OUTPUT
+            n_img:     number of evaluated frames
+            res:       for every setup (n_gt, scores, tps), see comp_roc()
+    """
+    vbb = load_vbb_cached(vbb_file, cache_dir, columnar=True)
+    ol = vbb['objLists']
+    lbl = np.array(ol.lbls + [''], dtype=str)[ol.lbl]
+    frames = np.arange(skip-1, vbb['nFrame'], skip)
+
+    rows = np.isin(ol.frame, frames) & np.isin(lbl, lbls)
+    gt_frame, gt_pos, gt_posv, gt_lbl = ol.frame[rows], ol.pos[rows], ol.posv[rows], lbl[rows]
+
+    A = load_bbs_txt(res_file)
+    A = A[np.isin(A[:,0], frames+1)]
+    A = A[np.argsort(A[:,0], kind='stable')]
+    dt_frame = A[:,0].astype(np.int64)-1
+    dt_bb = np.hstack([bbox_resize_array(A[:,1:5].copy(), 1, 0, aspectRatio), A[:,5:6]])
+
+    res = []
+    for setup in setups:
+        keep = filter_gt(gt_lbl, gt_pos, gt_posv, setup, plbls, bnds, aspectRatio)
+        gt_bb = gt_pos.copy()
+        gt_bb[keep] = bbox_resize_array(gt_bb[keep], 1, 0, aspectRatio)
+        gt_bb = np.hstack([gt_bb, (~keep)[:,None].astype(np.float64)])
+        hr = np.array(setup['hr'])*[1./setup['filterGt'], setup['filterGt']]
+        dt_keep = (dt_bb[:,3] >= hr[0]) & (dt_bb[:,3] < hr[1])
+        d_frame, d_bb = dt_frame[dt_keep], dt_bb[dt_keep]
+        # gts and dts are sorted by frame, so every frame is a slice of them
+        fs = np.union1d(gt_frame, d_frame)
+        gs = np.searchsorted(gt_frame, fs, side='left'), np.searchsorted(gt_frame, fs, side='right')
+        ds = np.searchsorted(d_frame, fs, side='left'), np.searchsorted(d_frame, fs, side='right')
+        n_gt = int(keep.sum())
+        scores, tps = [np.zeros(0)], [np.zeros(0)]
+        for k in range(len(fs)):
+            _, d = eval_res(gt_bb[gs[0][k]:gs[1][k]], d_bb[ds[0][k]:ds[1][k]], setup['overlap'])
+            d = d[d[:,5] != -1]
+            scores.append(d[:,4])
+            tps.append(d[:,5])
+        res.append((n_gt, np.concatenate(scores), np.concatenate(tps)))
+    return len(frames), res
+
+def db_eval(videos, skip, setups, lbls, plbls, bnds, aspectRatio=.41, workers=0, cache_dir=None):
+    """
+    Log-average miss rate of the results of a subset for every setup, as dbEval.m.
+        INPUT
+            videos:  a list of (vbb_file, res_file)
+            workers: number of processes evaluating the videos, 0 or 1 one by one
+            the others, see eval_video()
+        OUTPUT
+            results: a list of dicts, for every setup
+                name, mr (log-average miss rate), fppi, miss_rate (the curve) and n_gt
+    """
+    evaluate = partial(eval_video, skip=skip, setups=setups, lbls=lbls, plbls=plbls,
+                       bnds=bnds, aspectRatio=aspectRatio, cache_dir=cache_dir)
+    vbb_files = [v for v, _ in videos]
+    res_files = [r for _, r in videos]
+    for r in res_files:
+        if not os.path.exists(r):
+            print('Missing result {}, evaluated as no detections.'.format(r))
+    if workers > 1 and len(videos) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            out = list(executor.map(evaluate, vbb_files, res_files))
+    else:
+        out = [evaluate(v, r) for v, r in zip(vbb_files, res_files)]
+
+    n_img = sum(n for n, _ in out)
+    results = []
+    for k, setup in enumerate(setups):
+        n_gt = sum(res[k][0] for _, res in out)
+        scores = np.concatenate([res[k][1] for _, res in out])
+        tps = np.concatenate([res[k][2] for _, res in out])
+        fppi, recall, ref_recall = comp_roc(n_gt, n_img, scores, tps)
+        results.append({'name':setup['name'], 'mr':log_average_miss_rate(ref_recall),
+                        'fppi':fppi, 'miss_rate':1-recall, 'n_gt':n_gt})
+    return results
+
+def print_eval_results(results):
+    """
+    Print the log-average miss rate of every setup of db_eval().
+    """
+    print('-----------------------------------------------------')
+    for r in results:
+        print('{:<14s} {:6.2f}%  ({} gt)'.format(r['name'], 100*r['mr'], r['n_gt']))
+    print('-----------------------------------------------------')
@@ -0,0 +1,101 @@
+# Copyright (c) 2018, Zhewei Xu
+# [xzhewei-at-gmail.com]
+# Licensed under The MIT License [see LICENSE for details]
+
+# Export coco style annotations to the label formats of other frameworks.
+
+import os
+import numpy as np
+
+from pydatatool.utils import mkdir_if_missing, load_json
+
+def _yolo_boxes(anns, images):
+    """
+    The darknet boxes of all annotations in one pass.
+        OUTPUT
+            pos:     [N] index in images of every kept ann
+            cls:     [N] class, category_id-1
+            boxes:   [Nx4] x y w h, box center and size divided by the image size
+            has_ann: [len(images)] bool, the image has an annotation, ignored or not
+    """
+    img_pos = {img['id']:k for k, img in enumerate(images)}
+    has_ann = np.zeros(len(images), dtype=bool)
+    has_ann[[img_pos[ann['image_id']] for ann in anns if ann['image_id'] in img_pos]] = True
+    keep = [ann for ann in anns if not ann.get('ignore', False) and ann['image_id'] in img_pos]
+    pos = np.array([img_pos[ann['image_id']] for ann in keep], dtype=np.int64)
+    cls = np.array([ann['category_id']-1 for ann in keep], dtype=np.int64)
+    bb = np.array([ann['bbox'] for ann in keep], dtype=np.float64).reshape(-1, 4)
+    dw = 1./np.array([img['width'] for img in images], dtype=np.float64)[pos]
+    dh = 1./np.array([img['height'] for img in images], dtype=np.float64)[pos]
+    # the -1 of darknet's voc_label.py, which takes 1-based pixel boxes
+    boxes = np.stack([(bb[:,0] + bb[:,2]/2.0 - 1)*dw,
+                      (bb[:,1] + bb[:,3]/2.0 - 1)*dh,
+                      bb[:,2]*dw,
+                      bb[:,3]*dh], axis=1)
+    return pos, cls, boxes, has_ann
+
+def _write_files(items):
+    for filename, text in items:
+        with open(filename, 'w') as f:
+            f.write(text)
+
+def to_yolo(coco_dict_or_path, out_dir, list_file=None, image_dir='', skip_empty=False, workers=0):
+    """
+    Write darknet (yolo) label files of a coco dict, one txt per image.
+
+        A label line is "class x y w h", class is category_id-1 and the box is normalized
+        by the image size. Annotations with ignore set are left out.
+
+        INPUT
+            coco_dict_or_path: a coco dict or a coco json file
+            out_dir:    dir of the label files, out_dir/<image name>.txt
+            list_file:  the image list darknet trains on, one image_dir/<file_name> per line
+            image_dir:  the images dir written in list_file
+            skip_empty: no label file and list entry for images without annotations
+            workers:    number of threads writing the files, 0 or 1 writes them one by one
+        OUTPUT
+            n_images:   the number of label files written
+        EXAMPLE
+            import pydatatool as pdt
+            pdt.export.to_yolo('scut_train.json', 'output/yolo/labels/train', 'output/yolo/train.txt',
+                               '/home/all/darknet/data/scut/images/train', skip_empty=True, workers=8)
+    """
+    coco = coco_dict_or_path
+    if not isinstance(coco, dict):
+        coco = load_json(coco)
+    images = coco['images']
+    pos, cls, boxes, has_ann = _yolo_boxes(coco['annotations'], images)
+
+    # group the boxes by image, the boxes of images[k] are rows order[offsets[k]:offsets[k+1]]
+    order = np.argsort(pos, kind='stable')
+    offsets = np.searchsorted(pos[order], np.arange(len(images)+1))
+    cls = cls[order].tolist()
+    boxes = boxes[order].tolist()
+
+    mkdir_if_missing(out_dir)
+    items = []
+    names = []
+    for k, img in enumerate(images):
+        s, e = int(offsets[k]), int(offsets[k+1])
+        if skip_empty and not has_ann[k]:
+            continue
+        name = os.path.splitext(img['file_name'])[0]
+        text = ''.join(str(cls[j]) + ' ' + ' '.join([str(a) for a in boxes[j]]) + '\n' for j in range(s, e))
+        items.append((os.path.join(out_dir, name+'.txt'), text))
+        names.append(img['file_name'])
+
+    if workers > 1 and len(items) > 1:
+        from concurrent.futures import ThreadPoolExecutor
+        chunk = (len(items)+workers*4-1)//(workers*4)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            list(executor.map(_write_files, [items[i:i+chunk] for i in range(0, len(items), chunk)]))
+    else:
+        _write_files(items)
+
+    if list_file is not None:
+        path, _ = os.path.split(list_file)
+        if path:
+            mkdir_if_missing(path)
+        with open(list_file, 'w') as f:
+            f.write(''.join(os.path.join(image_dir, fn)+'\n' for fn in names))
+    return len(items)
@@ -0,0 +1,470 @@
+# Copyright (c) 2018, Zhewei Xu
+# [xzhewei-at-gmail.com]
+# Licensed under The MIT License [see LICENSE for details]
+
+# Norpix .seq video reading shared by caltech, kaist and scut, the format
+# of seqIo.m in Piotr's toolbox.
+
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+import numpy as np
+import hashlib
+import json
+import mmap
+import os
+
+from pydatatool.utils import mkdir_if_missing
+
+SEQ_HEADER_SIZE = 1024
+SEQ_INDEX_VERSION = 1
+
+def read_seq_header(buf):
+    """
+    Parse the 1024 byte Norpix header, as seqIo('getInfo').
+        INPUT
+            buf:    the first 1024 bytes of a seq file, bytes or a buffer
+        OUTPUT
+            header: {'version', 'headerSize', 'width', 'height', 'imageBitDepth',
+                     'imageBitDepthReal', 'imageSizeBytes', 'imageFormat', 'numFrames',
+                     'trueImageSize', 'fps'}
+    """
+    if len(buf) < SEQ_HEADER_SIZE or np.frombuffer(buf, '<u4', 1, 0)[0] != 0xFEED:
+        raise ValueError('Not a Norpix seq file.')
+    version, headerSize = np.frombuffer(buf, '<i4', 2, 28).tolist()
+    info = np.frombuffer(buf, '<u4', 9, 548).tolist()
+    header = {'version':version, 'headerSize':headerSize,
+              'width':info[0], 'height':info[1], 'imageBitDepth':info[2], 'imageBitDepthReal':info[3],
+              'imageSizeBytes':info[4], 'imageFormat':info[5], 'numFrames':info[6],
+              'trueImageSize':info[8], 'fps':float(np.frombuffer(buf, '<f8', 1, 584)[0])}
+    return header
+
+def build_seq_offsets(buf, header):
+    """
+    Find where every frame is stored, as seqIo's getImgBounds.
+
+        Raw frames (imageFormat 100, 101, 200) have a fixed size. Compressed frames
+        (jpg, png) start with a uint32 size that counts itself and are followed by an
+        8 byte timestamp, 16 bytes if the uint32 after the first frame is 0.
+        INPUT
+            buf:    the whole seq file, e.g. a mmap
+            header: from read_seq_header()
+        OUTPUT
+            starts: [nFrame] int64, first byte of each frame image
+            sizes:  [nFrame] int64, image size in bytes
+    """
+    n = header['numFrames']
+    if header['imageFormat'] in (100, 101, 200):
+        starts = SEQ_HEADER_SIZE + np.arange(n, dtype=np.int64)*header['trueImageSize']
+        sizes = np.full(n, header['imageSizeBytes'], dtype=np.int64)
+        return starts, sizes
+    starts = np.zeros(n, dtype=np.int64)
+    sizes = np.zeros(n, dtype=np.int64)
+    extra = 8
+    s = SEQ_HEADER_SIZE
+    end = len(buf)
+    for i in range(n):
+        if s+4 > end:
+            # truncated file, keep the frames before
+            return starts[:i], sizes[:i]
+        size = int(np.frombuffer(buf, '<u4', 1, s)[0])
+        starts[i] = s+4
+        sizes[i] = size-4
+        s += size+extra
+        if i == 0 and s+4 <= end and np.frombuffer(buf, '<u4', 1, s)[0] == 0:
+            s += 8
+            extra += 8
+    return starts, sizes
+
+def seq_index_file(filename, index_dir=None):
+    """
+    The index file of a seq, the sidecar V000.seq.idx.npz, or a file named by the hash
+    of the seq absolute path in index_dir, e.g. when the videos dir is read only.
+    """
+    if index_dir is None:
+        return filename + '.idx.npz'
+    key = hashlib.sha1(os.path.abspath(filename).encode('utf-8')).hexdigest()
+    return os.path.join(index_dir, key+'.idx.npz')
+
+def save_seq_index(filename, header, starts, sizes, index_dir=None):
+    """
+    Save the header and frame offsets of a seq, keyed by the seq size and mtime.
+        OUTPUT
+            index_file: the written file
+    """
+    index_file = seq_index_file(filename, index_dir)
+    path, _ = os.path.split(index_file)
+    if path:
+        mkdir_if_missing(path)
+    st = os.stat(filename)
+    # write to a temp file then rename, workers may share the index dir
+    tmp_file = '{}.{}.tmp'.format(index_file, os.getpid())
+    with open(tmp_file, 'wb') as f:
+        np.savez(f, version=SEQ_INDEX_VERSION, src_size=st.st_size, src_mtime=st.st_mtime_ns,
+                 header=json.dumps(header), starts=starts, sizes=sizes)
+    os.replace(tmp_file, index_file)
+    return index_file
+
+def load_seq_index(filename, index_dir=None):
+    """
+    Load the index of a seq, None if there is none or the seq changed since.
+        OUTPUT
+            header, starts, sizes: see read_seq_header() and build_seq_offsets()
+    """
+    index_file = seq_index_file(filename, index_dir)
+    if not os.path.exists(index_file):
+        return None
+    try:
+        st = os.stat(filename)
+        with np.load(index_file) as data:
+            if int(data['version']) != SEQ_INDEX_VERSION or int(data['src_size']) != st.st_size or \
+               int(data['src_mtime']) != st.st_mtime_ns:
+                return None
+            return json.loads(str(data['header'])), data['starts'], data['sizes']
+    except (OSError, ValueError, KeyError):
+        # broken index file, rebuild it
+        return None
+
+def index_seq(filename, index_dir=None):
+    """
+    Build and save the index of a seq unless a valid one exists, return its number of frames.
+    """
+    with SeqReader(filename, index=True, index_dir=index_dir) as sr:
+        return len(sr)
+
+def index_seqs(filenames, workers=0, index_dir=None):
+    """
+    index_seq() of many seq files with a process pool.
+        OUTPUT
+            nFrames: a list, the number of frames of each file
+    """
+    index = partial(index_seq, index_dir=index_dir)
+    if workers > 1 and len(filenames) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(index, filenames))
+    return [index(fn) for fn in filenames]
+
+class SeqReader(object):
+    """
+    Random access to the frames of a Norpix .seq video.
+
+        The file is memory-mapped, the header and the frame offsets are parsed once and
+        reader[i] is the image of frame i (a jpg for caltech and kaist) as a memoryview
+        of the mapping, no bytes are read or copied until they are used.
+        Frames still referenced at close() keep the mapping until they are freed,
+        copy them with bytes() to let close() unmap it.
+
+        With index=True the offsets come from the index file of load_seq_index() when it is
+        valid, otherwise they are parsed and the index file is written for the next reader.
+        A dir which can not be written just skips the save. index=False always parses.
+
+        EXAMPLE
+            import pydatatool as pdt
+            with pdt.caltech.SeqReader('/home/all/datasets/caltech/videos/set00/V000.seq') as sr:
+                print(len(sr), sr.header['width'], sr.header['height'])
+                with open('I00029.jpg', 'wb') as f:
+                    f.write(sr[29])
+    """
+    def __init__(self, filename, index=True, index_dir=None):
+        self.filename = filename
+        self._file = open(filename, 'rb')
+        self._mm = None
+        try:
+            self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            loaded = load_seq_index(filename, index_dir) if index else None
+            if loaded is not None:
+                self.header, self.starts, self.sizes = loaded
+            else:
+                self.header = read_seq_header(self._mm)
+                self.starts, self.sizes = build_seq_offsets(self._mm, self.header)
+                if index:
+                    try:
+                        save_seq_index(filename, self.header, self.starts, self.sizes, index_dir)
+                    except OSError:
+                        pass
+            self._view = memoryview(self._mm)
+        except Exception:
+            if self._mm is not None:
+                self._mm.close()
+            self._file.close()
+            raise
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self.starts)
+        if i < 0 or i >= len(self.starts):
+            raise IndexError('frame {} out of range, {} has {} frames.'.format(i, self.filename, len(self)))
+        s = int(self.starts[i])
+        return self._view[s:s+int(self.sizes[i])]
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def close(self):
+        if self._file is None:
+            return
+        self._view.release()
+        try:
+            self._mm.close()
+        except BufferError:
+            # frames are still referenced, the mapping is unmapped with the last of them
+            pass
+        self._file.close()
+        self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+class PairedSeqReader(object):
+    """
+    Aligned seq streams of one video, e.g. the visible and lwir seqs of a KAIST video.
+
+        The streams share one frame index: len() is the smallest number of frames and
+        reader[i] is the tuple of frame i of every stream, memoryviews as SeqReader.
+        A warning is printed when the streams have different numbers of frames.
+
+        EXAMPLE
+            import pydatatool as pdt
+            with pdt.kaist.PairedSeqReader(['set00/V000/visible.seq','set00/V000/lwir.seq']) as pr:
+                visible, lwir = pr[29]
+    """
+    def __init__(self, filenames, index=True, index_dir=None):
+        self.filenames = list(filenames)
+        self.readers = []
+        try:
+            for fn in self.filenames:
+                self.readers.append(SeqReader(fn, index, index_dir))
+        except Exception:
+            self.close()
+            raise
+        lens = [len(sr) for sr in self.readers]
+        self.n = min(lens) if lens else 0
+        if len(set(lens)) > 1:
+            print('Warning: the streams {} have {} frames, use the first {}.'.format(self.filenames, lens, self.n))
+
+    def __len__(self):
+        return self.n
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += self.n
+        if i < 0 or i >= self.n:
+            raise IndexError('frame {} out of range, {} has {} frames.'.format(i, self.filenames, self.n))
+        return tuple(sr[i] for sr in self.readers)
+
+    def close(self):
+        for sr in self.readers:
+            sr.close()
+        self.readers = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+def seq2imgs(vname,tdir,skip=1,index_dir=None,verbose=True):
+    """
+    Convert a seq file to images.
+        Only the frames skip-1, 2*skip-1, ... are read, the images are named
+        setXX_VYYY_ZZZZZ.jpg by the 0-based frame index.
+        INPUT
+            vname: the seq file path
+            tdir: the ouput images dir
+            skip: interval of frames
+            index_dir: where the frame index is kept, see SeqReader
+            verbose: print the number of frames
+        OUTPUT
+            n_frames: the number of written images
+            n_bytes: their total size
+        EXAMPLE
+            pdt.caltech.seq2imgs('/home/all/datasets/caltech/videos/set00/V000.seq','./extract',30)
+    """
+    s,v = os.path.split(vname)
+    v,_ = os.path.splitext(v)
+    _,s = os.path.split(s)
+    mkdir_if_missing(tdir)
+    n_frames = 0
+    n_bytes = 0
+    with SeqReader(vname, index_dir=index_dir) as sr:
+        for idx in range(skip-1, len(sr), skip):
+            fname = "{}_{}_{:0>5}.jpg".format(s,v,idx)
+            fname = os.path.join(tdir, fname)
+            img = sr[idx]
+            with open(fname,'wb') as f:
+                f.write(img)
+            n_bytes += img.nbytes
+            img.release()
+            n_frames += 1
+    if verbose:
+        print('#Frames: {:d}'.format(n_frames))
+    return n_frames, n_bytes
+
+def extract_seqs(vnames,tdir,skip=1,workers=0,index_dir=None):
+    """
+    seq2imgs() of many seq files, workers of them at a time.
+
+        The videos are extracted by a pool of threads, at most 2*workers videos are
+        queued, so the open files and pending writes stay bounded. The files are the
+        same as seq2imgs() of each video.
+        INPUT
+            vnames: the seq file paths
+            tdir: the ouput images dir
+            skip: interval of frames
+            workers: number of videos extracted at the same time, 0 or 1 one by one
+            index_dir: where the frame indexes are kept, see SeqReader
+        OUTPUT
+            n_frames, n_bytes: totals of all videos
+    """
+    import time
+    tic = time.time()
+    n_frames, n_bytes = 0, 0
+    mkdir_if_missing(tdir)
+    if workers > 1:
+        from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+        extract = partial(seq2imgs, tdir=tdir, skip=skip, index_dir=index_dir, verbose=False)
+        pending = set()
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for vname in vnames:
+                if len(pending) >= 2*workers:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for fu in done:
+                        n, b = fu.result()
+                        n_frames, n_bytes = n_frames+n, n_bytes+b
+                pending.add(executor.submit(extract, vname))
+            for fu in pending:
+                n, b = fu.result()
+                n_frames, n_bytes = n_frames+n, n_bytes+b
+    else:
+        for vname in vnames:
+            print("Extrace {} to imgs.".format(vname))
+            t = time.time()
+            n, b = seq2imgs(vname,tdir,skip,index_dir)
+            n_frames, n_bytes = n_frames+n, n_bytes+b
+            print('Done (t={:0.2f}s)'.format(time.time()-t))
+    t = max(time.time()-tic, 1e-9)
+    print('Extract {} images ({:0.1f} MB) from {} videos (t={:0.2f}s, {:0.1f} images/s, {:0.1f} MB/s)'.format(
+        n_frames, n_bytes/2.**20, len(vnames), t, n_frames/t, n_bytes/2.**20/t))
+    return n_frames, n_bytes
+
+class SeqFrames(object):
+    """
+    Training samples read straight from the seq videos, no images are extracted.
+
+        images are coco image dicts whose id is get_image_id(s,v,i), the jpg of an image
+        is frame i of video_dir/setXX/VYYY.seq, read by a SeqReader which is opened on
+        first use. ds[k] is {'image': decode(jpg), 'image_info': images[k], 'anns': [...]},
+        the jpg is decoded only then. Without decode 'image' is the jpg bytes.
+        prefetch() reads and decodes the next samples in a thread pool.
+        The object can be pickled, e.g. to dataloader worker processes, which open
+        their own readers.
+
+        INPUT
+            video_dir: the videos dir, contains setXX/VYYY.seq
+            images:    a list of coco image dicts
+            anns:      a list of coco annotation dicts, grouped by image_id
+            decode:    a function of the jpg buffer, e.g. lambda b: cv2.imdecode(np.frombuffer(b, np.uint8), 1).
+                       The buffer is a view of the video mapping. If the result keeps a reference
+                       to it, the jpg is copied and decoded again, so keep no views for speed.
+            index_dir: where the frame indexes are kept, see SeqReader
+    """
+    def __init__(self, video_dir, images, anns=(), decode=None, index_dir=None):
+        import threading
+        self.video_dir = video_dir
+        self.images = list(images)
+        self.decode = decode
+        self.index_dir = index_dir
+        ids = set(img['id'] for img in self.images)
+        self.anns = dict((img['id'], []) for img in self.images)
+        for ann in anns:
+            if ann['image_id'] in ids:
+                self.anns[ann['image_id']].append(ann)
+        self._readers = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.images)
+
+    def reader(self, s, v):
+        """
+        The SeqReader of video setXX/VYYY, opened once.
+        """
+        key = (s, v)
+        sr = self._readers.get(key)
+        if sr is None:
+            with self._lock:
+                sr = self._readers.get(key)
+                if sr is None:
+                    vname = os.path.join(self.video_dir, 'set{:0>2}'.format(s), 'V{:0>3}.seq'.format(v))
+                    sr = SeqReader(vname, index_dir=self.index_dir)
+                    self._readers[key] = sr
+        return sr
+
+    def jpg(self, k):
+        """
+        The undecoded image of images[k], a memoryview of the video mapping.
+        """
+        id = self.images[k]['id']
+        return self.reader(id//(10**8), id//(10**5)%1000)[id%(10**5)]
+
+    def __getitem__(self, k):
+        img = self.images[k]
+        buf = self.jpg(k)
+        if self.decode is None:
+            image = bytes(buf)
+        else:
+            image = self.decode(buf)
+        try:
+            buf.release()
+        except BufferError:
+            # decode kept a view of the mapping, e.g. np.frombuffer(buf), decode a copy
+            del image
+            image = self.decode(bytes(buf))
+        return {'image':image, 'image_info':img, 'anns':self.anns[img['id']]}
+
+    def __iter__(self):
+        for k in range(len(self)):
+            yield self[k]
+
+    def prefetch(self, indices=None, workers=4, depth=None):
+        """
+        Yield self[k] for k in indices, in order, while the next ones are read and
+        decoded by a pool of workers threads. At most depth samples are in flight.
+        """
+        from concurrent.futures import ThreadPoolExecutor
+        from collections import deque
+        if indices is None:
+            indices = range(len(self))
+        if depth is None:
+            depth = 2*workers
+        pending = deque()
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for k in indices:
+                if len(pending) >= depth:
+                    yield pending.popleft().result()
+                pending.append(executor.submit(self.__getitem__, k))
+            while pending:
+                yield pending.popleft().result()
+
+    def close(self):
+        with self._lock:
+            for sr in self._readers.values():
+                sr.close()
+            self._readers = {}
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_readers'] = {}
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        import threading
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
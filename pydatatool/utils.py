@@ -1,6 +1,12 @@
 # Copyright (c) 2018, Zhewei Xu
 # [xzhewei-at-gmail.com]
 # Licensed under The MIT License [see LICENSE for details]
+import numpy as np
+import types
+import copy
+import gzip
+import json
+import math
 import os
 
 def mkdir_if_missing(path):
@@ -30,15 +36,407 @@ def load_pkl(filename):
         data = cPickle.load(f)
     return data
 
-def load_json(filename):
-    import json
-    A = json.load(open(filename,'r'))
-    return A
+JSON_BACKENDS = ('orjson', 'rapidjson', 'ujson', 'json')
 
-def save_json(data,filename):
-    import json
+class JsonBackend(object):
+    """
+    A json encoder/decoder, see get_json_backend().
+        loads(s): decode a str or bytes
+        dumps(obj): encode to a str
+    """
+    def __init__(self, name):
+        self.name = name
+        if name == 'orjson':
+            import orjson
+            self.loads = orjson.loads
+            self.dumps = lambda obj: _orjson_dumps(orjson, obj)
+        elif name == 'rapidjson':
+            import rapidjson
+            self.loads = rapidjson.loads
+            self.dumps = rapidjson.dumps
+        elif name == 'ujson':
+            import ujson
+            self.loads = ujson.loads
+            self.dumps = ujson.dumps
+        elif name == 'json':
+            self.loads = json.loads
+            self.dumps = json.dumps
+        else:
+            raise ValueError('Unknown json backend {}, use one of {} or auto.'.format(name, JSON_BACKENDS))
+
+def _has_non_finite(obj):
+    """
+    True if a float in obj, a json serializable object, is nan or inf.
+    """
+    stack = [obj]
+    while stack:
+        v = stack.pop()
+        if isinstance(v, float):
+            if not math.isfinite(v):
+                return True
+        elif isinstance(v, dict):
+            stack.extend(v.values())
+        elif isinstance(v, (list, tuple)):
+            stack.extend(v)
+    return False
+
+def _orjson_dumps(orjson, obj):
+    """
+    orjson gives compact output, but writes nan and inf as null. Data with
+    such floats is encoded by the stdlib, which keeps them as NaN and Infinity.
+    """
+    if _has_non_finite(obj):
+        return json.dumps(obj)
+    return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS).decode('utf-8')
+
+def get_json_backend(name=None, dump=False):
+    """
+    Pick the json backend.
+
+        name, else the PYDATATOOL_JSON environment variable, else 'auto'.
+        'auto' decodes with the first installed of orjson and rapidjson, which give the
+        same objects as the stdlib, and encodes with the stdlib json, whose output
+        is the one the repo files have. A named backend is used for both.
+        INPUT
+            name: one of JSON_BACKENDS, 'auto' or None
+            dump: pick the encoder for 'auto'
+        OUTPUT
+            backend: a JsonBackend
+        EXAMPLE
+            # PYDATATOOL_JSON=orjson python train.py
+            import pydatatool as pdt
+            print(pdt.get_json_backend().name)
+    """
+    if name is None:
+        name = os.environ.get('PYDATATOOL_JSON', 'auto')
+    if name != 'auto':
+        return JsonBackend(name)
+    if not dump:
+        for name in ('orjson', 'rapidjson'):
+            try:
+                return JsonBackend(name)
+            except ImportError:
+                pass
+    return JsonBackend('json')
+
+def load_json(filename, backend=None):
+    """
+    Load a json file, .gz files are decompressed.
+    backend: the json decoder, see get_json_backend()
+    """
+    backend = get_json_backend(backend)
+    if filename.endswith('.gz'):
+        with gzip.open(filename,'rb') as f:
+            s = f.read()
+    else:
+        with open(filename,'rb') as f:
+            s = f.read()
+    try:
+        return backend.loads(s)
+    except ValueError:
+        if backend.name == 'json':
+            raise
+        # e.g. NaN or Infinity, which only the stdlib reads
+        return json.loads(s)
+
+def save_json(data,filename,backend=None):
+    """
+    Save data to a json file.
+    backend: the json encoder, see get_json_backend()
+    """
+    backend = get_json_backend(backend, dump=True)
+    path, _ = os.path.split(filename)
+    mkdir_if_missing(path)
+    s = backend.dumps(data)
+    with open(filename,'w') as json_file:
+        json_file.write(s)
+
+def save_json_stream(filename, fields, compress=None):
+    """
+    Save a json object whose list fields are written item by item from iterables,
+    so a big coco json never has to be built in memory.
+
+        INPUT
+            filename: the json file, gzip compressed if it ends with .gz
+            fields:   a list of (key, value). If value is a list, tuple or generator its
+                      items are encoded one at a time, otherwise it is dumped as a whole.
+            compress: True/False to force gzip on/off, default by the file name
+
+        EXAMPLE
+            import pydatatool as pdt
+            images = (img for img in image_ids)
+            annotations = (ann for vid_anns in all_vid_anns for ann in vid_anns)
+            pdt.save_json_stream('caltech.json.gz', [('images',images),
+                                                     ('annotations',annotations),
+                                                     ('categories',pdt.caltech.get_categories())])
+    """
     path, _ = os.path.split(filename)
     mkdir_if_missing(path)
-    json_file = open(filename,'w')
-    json.dump(data, json_file)
-    json_file.close()
+    if compress is None:
+        compress = filename.endswith('.gz')
+    if compress:
+        json_file = gzip.open(filename, 'wt')
+    else:
+        json_file = open(filename, 'w')
+    # same separators as json.dump, so the file equals a json.dump of the dict
+    with json_file:
+        json_file.write('{')
+        for k, (key, value) in enumerate(fields):
+            if k > 0:
+                json_file.write(', ')
+            json_file.write(json.dumps(key) + ': ')
+            if isinstance(value, (list, tuple, types.GeneratorType)):
+                json_file.write('[')
+                for i, item in enumerate(value):
+                    if i > 0:
+                        json_file.write(', ')
+                    json_file.write(json.dumps(item))
+                json_file.write(']')
+            else:
+                json_file.write(json.dumps(value))
+        json_file.write('}')
+
+
+COCO_COLUMNS_VERSION = 1
+
+def _encode_column(values):
+    """
+    Pick a lossless encoding for the values of one annotation key.
+    Return (spec, arrays), arrays are the .npy files of the column.
+    """
+    first = values[0]
+    # fixed length lists of numbers, like bbox, become Nx4 columns
+    if isinstance(first, list) and len(first) > 0 and \
+       all(isinstance(x, list) and len(x) == len(first) for x in values):
+        flat = [y for x in values for y in x]
+        shape = (len(values), len(first))
+    else:
+        flat = values
+        shape = (len(values),)
+    kinds = set(type(x) for x in flat)
+    if kinds == {bool}:
+        return {'type':'bool'}, {'': np.array(flat, dtype=bool).reshape(shape)}
+    if kinds <= {int, float} and len(kinds) > 0:
+        if kinds == {int}:
+            try:
+                return {'type':'int'}, {'': np.array(flat, dtype=np.int64).reshape(shape)}
+            except OverflowError:
+                pass
+        else:
+            isint = np.array([type(x) is int for x in flat], dtype=bool).reshape(shape)
+            arrays = {'': np.array(flat, dtype=np.float64).reshape(shape)}
+            if isint.any():
+                # json keeps 23 and 23.0 apart, so does the round trip
+                arrays['.isint'] = isint
+            return {'type':'float'}, arrays
+    if kinds == {str} and shape == (len(values),):
+        vocab = sorted(set(flat))
+        index = {v:k for k, v in enumerate(vocab)}
+        return {'type':'str', 'vocab':vocab}, {'': np.array([index[x] for x in flat], dtype=np.int32)}
+    dumps = [json.dumps(x) for x in values]
+    if all(d == dumps[0] for d in dumps):
+        return {'type':'const', 'value':first}, {}
+    return {'type':'json'}, {}
+
+def save_coco_columns(coco, out_dir):
+    """
+    Save a coco dict as a dir of memory-mappable columns, see load_coco_columns().
+
+        Every annotation key becomes a column: numbers and fixed length number lists
+        (bbox, bbox_v, vis_bbox) are .npy arrays, strings are codes with a vocabulary,
+        keys with the same value everywhere are kept once, anything else is a json list.
+        The annotations are indexed by image with ann_index.npy and img_offsets.npy.
+        Images, categories and the other fields are kept in meta.json.
+
+        INPUT
+            coco:    a coco dict, as saved by save_coco(), or from cvt_annotations()
+                     or convert_to_coco()
+            out_dir: the dir to write
+        EXAMPLE
+            import pydatatool as pdt
+            coco = pdt.load_json('data/json/caltech_train_1x.json')
+            pdt.save_coco_columns(coco, 'caltech_train_1x.cols')
+    """
+    mkdir_if_missing(out_dir)
+    anns = coco.get('annotations', [])
+    images = coco.get('images', [])
+
+    # the key order of every annotation, so the dicts come back the same
+    layouts = []
+    layout_ids = {}
+    layout = np.zeros(len(anns), dtype=np.int32)
+    keys = []
+    for k, ann in enumerate(anns):
+        ks = tuple(ann.keys())
+        if ks not in layout_ids:
+            layout_ids[ks] = len(layouts)
+            layouts.append(list(ks))
+            keys.extend(key for key in ks if key not in keys)
+        layout[k] = layout_ids[ks]
+
+    columns = {}
+    arrays = {'layout': layout}
+    for key in keys:
+        rows = [k for k, ann in enumerate(anns) if key in ann]
+        values = [anns[k][key] for k in rows]
+        spec, arrs = _encode_column(values)
+        if len(rows) < len(anns) and spec['type'] not in ('const','json'):
+            # rows without the key get zeros, layout tells they are absent
+            for suffix, arr in arrs.items():
+                full = np.zeros((len(anns),)+arr.shape[1:], dtype=arr.dtype)
+                full[rows] = arr
+                arrs[suffix] = full
+        if spec['type'] == 'json':
+            spec['file'] = 'col_{}.json'.format(len(columns))
+            with open(os.path.join(out_dir, spec['file']), 'w') as f:
+                json.dump(values, f)
+        spec['files'] = {}
+        for suffix, arr in arrs.items():
+            fname = 'col_{}{}.npy'.format(len(columns), suffix)
+            arrays[fname[:-4]] = arr
+            spec['files'][suffix] = fname
+        columns[key] = spec
+
+    # per image offsets into ann_index, which lists the anns image by image
+    img_pos = {img['id']:k for k, img in enumerate(images)}
+    ann_img = np.array([img_pos.get(ann.get('image_id'), len(images)) for ann in anns], dtype=np.int64)
+    ann_index = np.argsort(ann_img, kind='stable')
+    img_offsets = np.searchsorted(ann_img[ann_index], np.arange(len(images)+1))
+    arrays['ann_index'] = ann_index
+    arrays['img_offsets'] = img_offsets
+
+    for name, arr in arrays.items():
+        np.save(os.path.join(out_dir, name+'.npy'), np.ascontiguousarray(arr))
+    meta = {'version':COCO_COLUMNS_VERSION,
+            'fields':[[key, None if key == 'annotations' else value] for key, value in coco.items()],
+            'nAnn':len(anns),
+            'layouts':layouts,
+            'columns':columns}
+    with open(os.path.join(out_dir, 'meta.json'), 'w') as f:
+        json.dump(meta, f)
+
+class CocoColumns(object):
+    """
+    The annotations of a coco dict as columns, from load_coco_columns().
+
+        columns[key] is the array of an annotation key, e.g. columns['bbox'] is Nx4,
+        columns['image_id'], columns['category_id'], columns['ignore'], columns['occl'].
+        height is bbox[:,3] unless the annotations have a 'height' key.
+        The anns of images[k] are rows ann_index[img_offsets[k]:img_offsets[k+1]].
+        to_coco() gives back the coco dict.
+    """
+    def __init__(self, out_dir, meta, arrays):
+        self.dir = out_dir
+        self.meta = meta
+        self.arrays = arrays
+        self.fields = dict(meta['fields'])
+        self.images = self.fields.get('images', [])
+        self.categories = self.fields.get('categories', [])
+        self.ann_index = arrays['ann_index']
+        self.img_offsets = arrays['img_offsets']
+        self.columns = {}
+        for key, spec in meta['columns'].items():
+            if '' in spec['files']:
+                self.columns[key] = arrays[spec['files']['']]
+
+    def __len__(self):
+        return self.meta['nAnn']
+
+    @property
+    def height(self):
+        if 'height' in self.columns:
+            return self.columns['height']
+        return self.columns['bbox'][:,3]
+
+    def image_anns(self, k):
+        """
+        The rows of the annotations of images[k].
+        """
+        return self.ann_index[self.img_offsets[k]:self.img_offsets[k+1]]
+
+    def _values(self, key):
+        spec = self.meta['columns'][key]
+        if spec['type'] == 'const':
+            return None
+        if spec['type'] == 'json':
+            with open(os.path.join(self.dir, spec['file']), 'r') as f:
+                values = json.load(f)
+            # the json list only has the rows with the key
+            rows = np.flatnonzero(self._has_key(key))
+            full = [None]*len(self)
+            for k, v in zip(rows.tolist(), values):
+                full[k] = v
+            return full
+        arr = self.arrays[spec['files']['']]
+        if spec['type'] == 'str':
+            vocab = spec['vocab']
+            return [vocab[c] for c in arr.tolist()]
+        values = arr.tolist()
+        if '.isint' in spec['files']:
+            isint = self.arrays[spec['files']['.isint']]
+            if arr.ndim == 1:
+                values = [int(x) if m else x for x, m in zip(values, isint.tolist())]
+            else:
+                values = [[int(x) if m else x for x, m in zip(row, mrow)]
+                          for row, mrow in zip(values, isint.tolist())]
+        return values
+
+    def _has_key(self, key):
+        has = np.array([key in ks for ks in self.meta['layouts']], dtype=bool)
+        return has[self.arrays['layout']]
+
+    def to_coco(self):
+        """
+        Rebuild the coco dict, equal to the one given to save_coco_columns().
+        """
+        layouts = self.meta['layouts']
+        values = {}
+        for key, spec in self.meta['columns'].items():
+            values[key] = self._values(key)
+        layout = self.arrays['layout'].tolist()
+        anns = []
+        for k in range(len(self)):
+            ann = {}
+            for key in layouts[layout[k]]:
+                v = values[key]
+                ann[key] = copy.deepcopy(self.meta['columns'][key]['value']) if v is None else v[k]
+            anns.append(ann)
+        coco = {}
+        for key, value in self.meta['fields']:
+            coco[key] = anns if key == 'annotations' else value
+        return coco
+
+def load_coco_columns(out_dir, mmap=True):
+    """
+    Load a dir written by save_coco_columns().
+
+        With mmap=True the .npy columns are memory-mapped read only, the dataloader workers
+        which load the same dir share the pages instead of each parsing the json.
+
+        INPUT
+            out_dir: the dir of save_coco_columns()
+            mmap:    memory-map the columns, else read them into memory
+        OUTPUT
+            cols:    a CocoColumns
+        EXAMPLE
+            import pydatatool as pdt
+            cols = pdt.load_coco_columns('caltech_train_1x.cols')
+            for k, img in enumerate(cols.images):
+                rows = cols.image_anns(k)
+                boxes = cols.columns['bbox'][rows]
+                ignore = cols.columns['iscrowd'][rows]
+            coco = cols.to_coco() # the same dict as pdt.load_json('data/json/caltech_train_1x.json')
+    """
+    with open(os.path.join(out_dir, 'meta.json'), 'r') as f:
+        meta = json.load(f)
+    if meta.get('version') != COCO_COLUMNS_VERSION:
+        raise ValueError('{} has columns version {}, expected {}.'.format(
+            out_dir, meta.get('version'), COCO_COLUMNS_VERSION))
+    names = ['layout', 'ann_index', 'img_offsets']
+    for spec in meta['columns'].values():
+        names.extend(spec['files'].values())
+    arrays = {}
+    for name in names:
+        fname = name if name.endswith('.npy') else name+'.npy'
+        arrays[name] = np.load(os.path.join(out_dir, fname), mmap_mode='r' if mmap else None)
+    return CocoColumns(out_dir, meta, arrays)
@@ -0,0 +1,803 @@
+# Copyright (c) 2018, Zhewei Xu
+# [xzhewei-at-gmail.com]
+# Licensed under The MIT License [see LICENSE for details]
+
+# vbb annotation reading and coco conversion shared by caltech, kaist and scut.
+# The three datasets use the same vbb 1.4 structure, only the filter
+# parameters and the dbInfo differ, so they all import from here and pass
+# their own get_dbInfo(), get_image_ids(), vbb2coco() ... where needed.
+
+from scipy.io import loadmat
+from collections import defaultdict
+from collections.abc import Mapping
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+import numpy as np
+import hashlib
+import glob
+import json
+import os
+
+from pydatatool.utils import mkdir_if_missing, load_json
+
+VBB_CACHE_VERSION = 1
+
+class VbbObjLists(Mapping):
+    """
+    Columnar objLists of a vbb, one row per box instead of one dict per box.
+
+        The boxes of frame i are rows offsets[i]:offsets[i+1] of the flat arrays
+            frame:   [N] frame index of the box
+            id:      [N] object id in the video (0-start)
+            pos:     [Nx4] bbox, x y w h
+            posv:    [Nx4] visible bbox, x y w h
+            occl:    [N] occlusion flag
+            lock:    [N] lock flag
+            lbl:     [N] label code, lbls[lbl] is the label name
+            offsets: [nFrame+1] per frame offsets
+
+        Indexing a frame gives the legacy list of obj dicts, so the object can be
+        used where vbb['objLists'] is expected, e.g. vbb2coco() and bbox_filter().
+        The dicts are built on demand, changing them does not change the arrays.
+
+        EXAMPLE
+            import pydatatool as pdt
+            vbb = pdt.caltech.load_vbb('/home/all/datasets/caltech/annotations/set00/V000.vbb',columnar=True)
+            objs = vbb['objLists'][100]         # legacy list of dicts
+            pos = vbb['objLists'].pos           # all boxes of the video
+            s = vbb['objLists'].frame_slice(100) # boxes of frame 100 are pos[s]
+    """
+    def __init__(self, offsets, id, pos, posv, occl, lock, lbl, lbls):
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.id = np.asarray(id, dtype=np.int32)
+        self.pos = np.asarray(pos, dtype=np.float64).reshape(-1, 4)
+        self.posv = np.asarray(posv, dtype=np.float64).reshape(-1, 4)
+        self.occl = np.asarray(occl, dtype=np.int32)
+        self.lock = np.asarray(lock, dtype=np.int32)
+        self.lbl = np.asarray(lbl, dtype=np.int32)
+        self.lbls = list(lbls)
+        self.frame = np.repeat(np.arange(len(self.offsets)-1, dtype=np.int32), np.diff(self.offsets))
+
+    @classmethod
+    def from_objLists(cls, objLists, nFrame=None):
+        """
+        Build the columnar form from a legacy objLists dict.
+        """
+        if nFrame is None:
+            nFrame = len(objLists)
+        lbls = []
+        counts = np.zeros(nFrame, dtype=np.int64)
+        rows = []
+        for i in range(nFrame):
+            objs = objLists.get(i, [])
+            counts[i] = len(objs)
+            for obj in objs:
+                if obj['lbl'] not in lbls:
+                    lbls.append(obj['lbl'])
+                rows.append((obj['id'], obj['pos'], obj['posv'], obj['occl'], obj['lock'], lbls.index(obj['lbl'])))
+        offsets = np.concatenate([[0], np.cumsum(counts)])
+        if len(rows) == 0:
+            return cls(offsets, [], [], [], [], [], [], lbls)
+        id, pos, posv, occl, lock, lbl = zip(*rows)
+        return cls(offsets, id, pos, posv, occl, lock, lbl, lbls)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __iter__(self):
+        return iter(range(len(self)))
+
+    def __contains__(self, i):
+        return isinstance(i, (int, np.integer)) and 0 <= i < len(self)
+
+    def __getitem__(self, i):
+        if i not in self:
+            raise KeyError(i)
+        return [self.obj(k) for k in range(self.offsets[i], self.offsets[i+1])]
+
+    def frame_slice(self, i):
+        """
+        The rows of frame i in the flat arrays.
+        """
+        return slice(int(self.offsets[i]), int(self.offsets[i+1]))
+
+    def obj(self, k):
+        """
+        The legacy obj dict of row k.
+        """
+        keys_obj = ('id','pos','occl','lock','posv','ignore')
+        datum = dict(zip(keys_obj, [int(self.id[k]), self.pos[k].tolist(), int(self.occl[k]),
+                                    int(self.lock[k]), self.posv[k].tolist(), False]))
+        datum['lbl'] = self.lbls[self.lbl[k]]
+        return datum
+
+    def to_dict(self):
+        """
+        The legacy objLists, a dict of frame -> list of obj dicts.
+        """
+        return {i: self[i] for i in range(len(self))}
+
+def load_vbb(filename, columnar=False):
+    """
+    A is a dict load from the caltech vbb file has the same data structure.
+        INPUT
+            filename: vbb path
+            columnar: if True, A['objLists'] is a VbbObjLists holding flat arrays
+                      instead of a dict of obj dict lists, see VbbObjLists
+        OUTPUT
+            vbb: vbb annotation
+        EXAMPLE
+            import pydatatool as pdt
+            vbb = pdt.caltech.load_vbb('/home/all/datasets/caltech/annotations/set00/V000.vbb')
+    """
+    vbb = loadmat(filename)
+    nFrame = int(vbb['A'][0][0][0][0][0])
+    objLists = vbb['A'][0][0][1][0]
+    maxObj = int(vbb['A'][0][0][2][0][0])
+    objInit = vbb['A'][0][0][3][0]
+    objLbl = [str(v[0]) for v in vbb['A'][0][0][4][0]]
+    objStr = vbb['A'][0][0][5][0]
+    objEnd = vbb['A'][0][0][6][0]
+    objHide = vbb['A'][0][0][7][0]
+    altered = int(vbb['A'][0][0][8][0][0])
+    log = vbb['A'][0][0][9][0]
+    logLen = int(vbb['A'][0][0][10][0][0])
+
+    if columnar:
+        obj_list = _objLists_columnar(objLists, objLbl)
+    else:
+        obj_list = _objLists_dict(objLists, objLbl)
+
+    keys_vbb = ('nFrame','objLists','maxObj','objInit','objLbl','objStr','objEnd','objHide','altered','log','logLen')
+    A = dict(zip(keys_vbb, [nFrame, obj_list, maxObj, objInit, objLbl, objStr, objEnd, objHide, altered, log, logLen]))
+    return A
+
+def _objLists_dict(objLists, objLbl):
+    obj_list = dict()
+    for frame_id, obj in enumerate(objLists):
+        objs = []
+        if obj.shape[1] > 0:
+            for id, pos, occl, lock, posv in zip(obj['id'][0], obj['pos'][0], obj['occl'][0], obj['lock'][0], obj['posv'][0]):
+                id = int(id[0][0])-1 # matlab is 1-start
+                pos = pos[0].tolist()
+                occl = int(occl[0][0])
+                lock = int(lock[0][0])
+                posv = posv[0].tolist()
+                keys_obj = ('id','pos','occl','lock','posv','ignore')
+                datum = dict(zip(keys_obj, [id, pos, occl, lock, posv, False]))
+                datum['lbl'] = objLbl[id]
+                objs.append(datum)
+        obj_list[frame_id] = objs
+    return obj_list
+
+def _objLists_columnar(objLists, objLbl):
+    lbls = list(dict.fromkeys(objLbl))
+    lbl_code = np.array([lbls.index(l) for l in objLbl], dtype=np.int32)
+    counts = np.zeros(len(objLists), dtype=np.int64)
+    ids, pos, posv, occl, lock = [], [], [], [], []
+    for frame_id, obj in enumerate(objLists):
+        if obj.shape[1] > 0:
+            counts[frame_id] = obj.shape[1]
+            ids.append([int(v[0][0]) for v in obj['id'][0]])
+            pos.append(np.vstack(obj['pos'][0]))
+            posv.append(np.vstack(obj['posv'][0]))
+            occl.append([int(v[0][0]) for v in obj['occl'][0]])
+            lock.append([int(v[0][0]) for v in obj['lock'][0]])
+    offsets = np.concatenate([[0], np.cumsum(counts)])
+    if len(ids) == 0:
+        return VbbObjLists(offsets, [], [], [], [], [], [], lbls)
+    ids = np.concatenate(ids) - 1 # matlab is 1-start
+    return VbbObjLists(offsets, ids, np.vstack(pos), np.vstack(posv),
+                       np.concatenate(occl), np.concatenate(lock), lbl_code[ids], lbls)
+
+def load_vbb_txt(filename, columnar=False):
+    """
+    Read a vbb saved as text by vbb('vbbSaveTxt') of the datatool, without matlab.
+    The result has the same structure as load_vbb().
+        INPUT
+            filename: vbb text file path, vbb version 1.4
+            columnar: objLists form, see load_vbb()
+        OUTPUT
+            vbb: vbb annotation
+        EXAMPLE
+            import pydatatool as pdt
+            vbb = pdt.caltech.load_vbb_txt('/home/all/datasets/caltech/annotations_txt/set00/V000.txt')
+    """
+    def values(line, key):
+        # 'pos =[1.0 2.0 3.0 4.0; 5.0 6.0 7.0 8.0; ]' -> [1.0, 2.0, ...]
+        k, v = line.split('=', 1)
+        assert k.strip() == key, 'bad vbb text line in {}: {}'.format(filename, line)
+        return v.strip().strip('[]').replace(';', ' ').split()
+
+    objLbl, objStr, objEnd, objHide = [], [], [], []
+    ids, frames, pos, posv, occl, lock = [], [], [], [], [], []
+    with open(filename, 'r') as f:
+        line = f.readline().strip()
+        assert line.startswith('% vbb version='), 'not a vbb text file: {}'.format(filename)
+        vers = float(line.split('=')[1])
+        assert abs(vers-1.4) < 1e-6, 'unsupported vbb version {} in {}'.format(vers, filename)
+        header = dict(kv.split('=') for kv in f.readline().split())
+        nFrame, maxObj = int(header['nFrame']), int(header['n'])
+        log = np.array(values(f.readline(), 'log'), dtype=np.float64)
+        id = 0
+        for line in f:
+            line = line.strip()
+            if not line.startswith('lbl='):
+                continue
+            # lbl='person' str=1 end=10 hide=0
+            lbl, rest = line[len('lbl='):].split("'", 2)[1:]
+            info = dict(kv.split('=') for kv in rest.split())
+            s, e = int(info['str']), int(info['end'])
+            o_pos = np.array(values(f.readline(), 'pos'), dtype=np.float64).reshape(-1, 4)
+            o_posv = np.array(values(f.readline(), 'posv'), dtype=np.float64).reshape(-1, 4)
+            o_occl = np.array(values(f.readline(), 'occl'), dtype=np.int32)
+            o_lock = np.array(values(f.readline(), 'lock'), dtype=np.int32)
+            assert len(o_pos) == e-s+1, 'object {} of {} has {} boxes for frames {}-{}'.format(id, filename, len(o_pos), s, e)
+            objLbl.append(lbl); objStr.append(s); objEnd.append(e); objHide.append(int(info['hide']))
+            ids.append(np.full(e-s+1, id, dtype=np.int32))
+            frames.append(np.arange(s-1, e, dtype=np.int64)) # matlab is 1-start
+            pos.append(o_pos); posv.append(o_posv); occl.append(o_occl); lock.append(o_lock)
+            id += 1
+    maxObj = max(maxObj, id)
+
+    lbls = list(dict.fromkeys(objLbl))
+    if id > 0:
+        frames = np.concatenate(frames)
+        # objects are added in id order, a stable sort keeps that order in every frame
+        order = np.argsort(frames, kind='stable')
+        ids = np.concatenate(ids)[order]
+        lbl_code = np.array([lbls.index(l) for l in objLbl], dtype=np.int32)
+        obj_list = VbbObjLists(np.searchsorted(frames[order], np.arange(nFrame+1)), ids,
+                               np.vstack(pos)[order], np.vstack(posv)[order],
+                               np.concatenate(occl)[order], np.concatenate(lock)[order],
+                               lbl_code[ids], lbls)
+    else:
+        obj_list = VbbObjLists(np.zeros(nFrame+1, dtype=np.int64), [], [], [], [], [], [], lbls)
+    if not columnar:
+        obj_list = obj_list.to_dict()
+
+    objInit = np.zeros(maxObj)
+    objInit[:id] = 1
+    pad = lambda v: np.concatenate([np.array(v, dtype=np.float64), np.zeros(maxObj-id)])
+    keys_vbb = ('nFrame','objLists','maxObj','objInit','objLbl','objStr','objEnd','objHide','altered','log','logLen')
+    A = dict(zip(keys_vbb, [nFrame, obj_list, maxObj, objInit, objLbl, pad(objStr), pad(objEnd), pad(objHide), 0, log, len(log)]))
+    return A
+
+def _read_vbb(filename, columnar=False):
+    if os.path.splitext(filename)[1] == '.txt':
+        return load_vbb_txt(filename, columnar)
+    return load_vbb(filename, columnar)
+
+def vbb_cache_file(filename, cache_dir):
+    """
+    The cache file of a vbb, named by the hash of the vbb absolute path.
+    """
+    key = hashlib.sha1(os.path.abspath(filename).encode('utf-8')).hexdigest()
+    return os.path.join(cache_dir, key+'.npz')
+
+def _vbb_stat(filename):
+    st = os.stat(filename)
+    return os.path.abspath(filename), st.st_size, st.st_mtime_ns
+
+def save_vbb_cache(A, filename, cache_dir):
+    """
+    Save a parsed vbb to cache_dir as a npz file of flat arrays.
+    Every array is numeric or a fixed width string, so the cache is loaded without pickle.
+        INPUT
+            A:         the vbb data from load_vbb, any objLists form
+            filename:  the source vbb path, its size and mtime are saved as the key
+            cache_dir: the cache dir
+        OUTPUT
+            cache_file: the written file
+    """
+    mkdir_if_missing(cache_dir)
+    objLists = A['objLists']
+    if not isinstance(objLists, VbbObjLists):
+        objLists = VbbObjLists.from_objLists(objLists, A['nFrame'])
+    src_path, src_size, src_mtime = _vbb_stat(filename)
+    cache_file = vbb_cache_file(filename, cache_dir)
+    # write to a temp file then rename, workers may share the cache dir
+    tmp_file = '{}.{}.tmp'.format(cache_file, os.getpid())
+    with open(tmp_file, 'wb') as f:
+        np.savez(f, version=VBB_CACHE_VERSION,
+                 src_path=src_path, src_size=src_size, src_mtime=src_mtime,
+                 nFrame=A['nFrame'], maxObj=A['maxObj'], altered=A['altered'], logLen=A['logLen'],
+                 objInit=_plain_array(A['objInit']), objLbl=np.array(A['objLbl'], dtype=str),
+                 objStr=_plain_array(A['objStr']), objEnd=_plain_array(A['objEnd']),
+                 objHide=_plain_array(A['objHide']), log=_plain_array(A['log']),
+                 offsets=objLists.offsets, id=objLists.id, pos=objLists.pos, posv=objLists.posv,
+                 occl=objLists.occl, lock=objLists.lock, lbl=objLists.lbl,
+                 lbls=np.array(objLists.lbls, dtype=str))
+    os.replace(tmp_file, cache_file)
+    return cache_file
+
+def _plain_array(a):
+    # matlab cells come back from loadmat as object arrays, store them as numbers
+    a = np.asarray(a)
+    return a.astype(np.float64) if a.dtype == object else a
+
+def _open_vbb_cache(filename, cache_dir):
+    cache_file = vbb_cache_file(filename, cache_dir)
+    if not os.path.exists(cache_file):
+        return None
+    try:
+        data = np.load(cache_file)
+    except (OSError, ValueError):
+        # broken cache file, rebuild it
+        return None
+    try:
+        src_path, src_size, src_mtime = _vbb_stat(filename)
+        fresh = int(data['version']) == VBB_CACHE_VERSION and str(data['src_path']) == src_path and \
+                int(data['src_size']) == src_size and int(data['src_mtime']) == src_mtime
+    except (OSError, ValueError, KeyError):
+        fresh = False
+    if not fresh:
+        data.close()
+        return None
+    return data
+
+def load_vbb_cache(filename, cache_dir, columnar=False):
+    """
+    Load a vbb from cache_dir, return None if there is no cache or it is stale.
+        INPUT
+            filename:  the source vbb path
+            cache_dir: the cache dir
+            columnar:  objLists form, see load_vbb()
+        OUTPUT
+            vbb: vbb annotation or None
+    """
+    data = _open_vbb_cache(filename, cache_dir)
+    if data is None:
+        return None
+    with data:
+        try:
+            objLists = VbbObjLists(data['offsets'], data['id'], data['pos'], data['posv'],
+                                   data['occl'], data['lock'], data['lbl'], data['lbls'].tolist())
+            A = {'nFrame':int(data['nFrame']),
+                 'objLists':objLists if columnar else objLists.to_dict(),
+                 'maxObj':int(data['maxObj']),
+                 'objInit':data['objInit'],
+                 'objLbl':data['objLbl'].tolist(),
+                 'objStr':data['objStr'],
+                 'objEnd':data['objEnd'],
+                 'objHide':data['objHide'],
+                 'altered':int(data['altered']),
+                 'log':data['log'],
+                 'logLen':int(data['logLen'])}
+        except (ValueError, KeyError):
+            # an incomplete cache file, or one with pickled arrays, is rebuilt
+            return None
+    return A
+
+def load_vbb_cached(filename, cache_dir=None, columnar=False):
+    """
+    load_vbb() through the cache in cache_dir. A missing or stale cache entry is
+    rebuilt from the vbb file, a valid one is loaded without reading the vbb.
+    """
+    if cache_dir is None:
+        return _read_vbb(filename, columnar)
+    A = load_vbb_cache(filename, cache_dir, columnar)
+    if A is None:
+        A = _read_vbb(filename, columnar=True)
+        save_vbb_cache(A, filename, cache_dir)
+        if not columnar:
+            A['objLists'] = A['objLists'].to_dict()
+    return A
+
+def load_vbb_header(filename, cache_dir=None):
+    """
+    Read nFrame and maxObj of a vbb without unpacking objLists.
+    With a valid cache entry in cache_dir only the two header arrays are read.
+        OUTPUT
+            header: {'nFrame':nFrame, 'maxObj':maxObj}
+    """
+    if cache_dir is not None:
+        data = _open_vbb_cache(filename, cache_dir)
+        if data is not None:
+            with data:
+                try:
+                    return {'nFrame':int(data['nFrame']), 'maxObj':int(data['maxObj'])}
+                except (ValueError, KeyError):
+                    pass
+    if os.path.splitext(filename)[1] == '.txt':
+        with open(filename, 'r') as f:
+            f.readline()
+            header = dict(kv.split('=') for kv in f.readline().split())
+        return {'nFrame':int(header['nFrame']), 'maxObj':int(header['n'])}
+    vbb = loadmat(filename)
+    return {'nFrame':int(vbb['A'][0][0][0][0][0]), 'maxObj':int(vbb['A'][0][0][2][0][0])}
+
+class LazyVbb(Mapping):
+    """
+    A vbb which is parsed on first access.
+
+        vbb['nFrame'] and vbb['maxObj'] are read by load_vbb_header() and do not parse
+        the video, any other key parses it once with load_vbb_cached() and keeps it.
+        See load_vbbs(lazy=True).
+    """
+    keys_vbb = ('nFrame','objLists','maxObj','objInit','objLbl','objStr','objEnd','objHide','altered','log','logLen')
+
+    def __init__(self, filename, columnar=False, cache_dir=None):
+        self.filename = filename
+        self.columnar = columnar
+        self.cache_dir = cache_dir
+        self._header = None
+        self._vbb = None
+
+    def __len__(self):
+        return len(self.keys_vbb)
+
+    def __iter__(self):
+        return iter(self.keys_vbb)
+
+    def __getitem__(self, key):
+        if self._vbb is None and key in ('nFrame','maxObj'):
+            if self._header is None:
+                self._header = load_vbb_header(self.filename, self.cache_dir)
+            return self._header[key]
+        return self.load()[key]
+
+    @property
+    def loaded(self):
+        return self._vbb is not None
+
+    def load(self):
+        """
+        Parse the video if it is not parsed yet, return the vbb dict.
+        """
+        if self._vbb is None:
+            self._vbb = load_vbb_cached(self.filename, self.cache_dir, self.columnar)
+        return self._vbb
+
+def find_vbbs(ann_dir, ext='vbb'):
+    """
+    List the vbb files under ann_dir in the order load_vbbs reads them.
+        INPUT
+            ann_dir: annotations dir, contains set*/V*.vbb
+            ext:     'vbb' for matlab files or 'txt' for vbb text files
+        OUTPUT
+            files:   a list of (set_name, [(video_name, vbb_path), ...])
+    """
+    files = []
+    for dname in sorted(glob.glob(ann_dir+'/set*')):
+        set_name = os.path.basename(dname)
+        videos = []
+        for anno_fn in sorted(glob.glob('{}/*.{}'.format(dname, ext))):
+            video_name = os.path.splitext(os.path.basename(anno_fn))[0]
+            videos.append((video_name, anno_fn))
+        files.append((set_name, videos))
+    return files
+
+def load_vbbs(ann_dir, workers=0, columnar=False, cache_dir=None, lazy=False, ext='vbb'):
+    """
+    Read all annotations from dir vbb files, data[set_name][video_name]=A
+        INPUT
+            ann_dir: caltech annotations dir
+            workers: number of processes used to parse the vbb files,
+                     0 or 1 parses them one by one in this process
+            columnar: load every video in the columnar form, see load_vbb()
+            cache_dir: keep the parsed videos as npz files in this dir, see
+                     load_vbb_cached(). Warm runs do not read the vbb files.
+            lazy:    only list the vbb files, vbbs[set_name][video_name] is a LazyVbb
+                     which parses the video when it is first used. 'nFrame' and
+                     'maxObj' are read without unpacking objLists.
+            ext:     'vbb' reads set*/V*.vbb, 'txt' reads vbb text files set*/V*.txt
+                     with load_vbb_txt(), so no matlab step is needed
+        OUTPUT
+            vbbs:    all caltech vbb anno, vbbs[set_name][video_name]
+        EXAMPLE
+            import pydatatool as pdt
+            vbbs = pdt.caltech.load_vbbs('/home/all/datasets/caltech/annotations')
+            vbbs = pdt.caltech.load_vbbs('/home/all/datasets/caltech/annotations', workers=8)
+            vbbs = pdt.caltech.load_vbbs('/home/all/datasets/caltech/annotations', cache_dir='./cache/vbb')
+            vbbs = pdt.caltech.load_vbbs('/home/all/datasets/caltech/annotations', lazy=True)
+            vbbs = pdt.caltech.load_vbbs('/home/all/datasets/caltech/annotations_txt', workers=8, ext='txt')
+    """
+    files = find_vbbs(ann_dir, ext)
+    if lazy:
+        vbbs = dict()
+        for set_name, videos in files:
+            vbbs[set_name] = dict()
+            for video_name, fn in videos:
+                vbbs[set_name][video_name] = LazyVbb(fn, columnar, cache_dir)
+        return vbbs
+
+    fnames = [fn for _, videos in files for _, fn in videos]
+    load = partial(load_vbb_cached, cache_dir=cache_dir, columnar=columnar)
+    if workers > 1 and len(fnames) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            # map keeps the input order, so the result is deterministic
+            annos = list(executor.map(load, fnames))
+    else:
+        annos = [load(fn) for fn in fnames]
+
+    vbbs = dict()
+    annos = iter(annos)
+    for set_name, videos in files:
+        vbbs[set_name] = dict()
+        for video_name, _ in videos:
+            vbbs[set_name][video_name] = next(annos)
+    return vbbs
+
+def iter_vbb_frames(path_or_dir, skip=1, cache_dir=None, ext='vbb'):
+    """
+    Iterate the frames of vbb files one by one, only one video is held in memory.
+        INPUT
+            path_or_dir: a vbb file, a set dir contains V*.vbb or an annotations dir contains set*/V*.vbb
+            skip:        interval of frames, the same frames as get_image_ids(dbName,vbbs,skip)
+            cache_dir:   vbb cache dir, see load_vbbs()
+            ext:         'vbb' or 'txt', see load_vbbs()
+        OUTPUT
+            a generator of (set_id, vid_id, frame_idx, objs), objs is the frame's list of obj dicts
+        EXAMPLE
+            import pydatatool as pdt
+            for s, v, i, objs in pdt.caltech.iter_vbb_frames('/home/all/datasets/caltech/annotations', 30):
+                image_id = pdt.caltech.get_image_id(s,v,i)
+    """
+    if os.path.isfile(path_or_dir):
+        set_name = os.path.basename(os.path.dirname(os.path.abspath(path_or_dir)))
+        video_name = os.path.splitext(os.path.basename(path_or_dir))[0]
+        files = [(set_name, [(video_name, path_or_dir)])]
+    elif len(glob.glob(path_or_dir+'/set*')) > 0:
+        files = find_vbbs(path_or_dir, ext)
+    else:
+        set_name = os.path.basename(os.path.normpath(path_or_dir))
+        files = [(set_name, [(os.path.splitext(os.path.basename(fn))[0], fn)
+                             for fn in sorted(glob.glob('{}/*.{}'.format(path_or_dir, ext)))])]
+
+    for set_name, videos in files:
+        setId = int(set_name[3:])
+        for video_name, fn in videos:
+            vidId = int(video_name[1:])
+            # columnar, so the skipped frames never build obj dicts
+            vbb = load_vbb_cached(fn, cache_dir, columnar=True)
+            objLists = vbb['objLists']
+            for i in range(skip-1, vbb['nFrame'], skip):
+                yield setId, vidId, i, objLists[i]
+            del vbb, objLists
+
+VBB_MANIFEST_VERSION = 1
+
+def vbb_file_sha1(filename):
+    """
+    The sha1 of a vbb file content.
+    """
+    h = hashlib.sha1()
+    with open(filename, 'rb') as f:
+        for chunk in iter(partial(f.read, 1<<20), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+def load_vbb_manifest(manifest_file, config):
+    """
+    Load a conversion manifest, see update_coco().
+    Return None if there is no manifest or it was written for another config.
+        INPUT
+            manifest_file: the manifest json file
+            config:        a json serializable dict of the conversion settings
+        OUTPUT
+            manifest:      {'version', 'config', 'annId_end', 'objId_end', 'videos'},
+                           videos['setXX/VYYY'] is {'sha1', 'size', 'mtime_ns', 'nFrame',
+                           'annId': [start, end], 'objId': [start, end]}
+    """
+    if not os.path.exists(manifest_file):
+        return None
+    try:
+        with open(manifest_file, 'r') as f:
+            manifest = json.load(f)
+    except ValueError:
+        return None
+    # compare the json form, tuples in the config come back as lists
+    if manifest.get('version') != VBB_MANIFEST_VERSION or \
+       manifest.get('config') != json.loads(json.dumps(config)):
+        return None
+    return manifest
+
+def save_vbb_manifest(manifest, manifest_file):
+    """
+    Save a conversion manifest, the file is replaced atomically.
+    """
+    path, _ = os.path.split(manifest_file)
+    mkdir_if_missing(path)
+    tmp_file = '{}.{}.tmp'.format(manifest_file, os.getpid())
+    with open(tmp_file, 'w') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(tmp_file, manifest_file)
+
+def new_vbb_manifest(config, annId_str=0, objId_str=0):
+    """
+    An empty manifest, ids are allocated from annId_str and objId_str.
+    """
+    return {'version':VBB_MANIFEST_VERSION, 'config':config,
+            'annId_end':annId_str, 'objId_end':objId_str, 'videos':{}}
+
+def vbb_manifest_changes(manifest, files):
+    """
+    Find the videos whose vbb file is new or changed since the manifest was written.
+        A video with the same size and mtime is unchanged without reading it, otherwise
+        its sha1 decides, so touching a file does not reconvert it.
+        INPUT
+            manifest: from load_vbb_manifest() or new_vbb_manifest()
+            files:    {'setXX/VYYY': vbb_path}
+        OUTPUT
+            changed:  the keys of files to reconvert, in sorted order
+            stats:    {key: {'sha1', 'size', 'mtime_ns'}} of every file
+    """
+    changed = []
+    stats = {}
+    for key in sorted(files):
+        st = os.stat(files[key])
+        old = manifest['videos'].get(key)
+        if old is not None and old['size'] == st.st_size and old['mtime_ns'] == st.st_mtime_ns:
+            stats[key] = {'sha1':old['sha1'], 'size':st.st_size, 'mtime_ns':st.st_mtime_ns}
+            continue
+        sha1 = vbb_file_sha1(files[key])
+        stats[key] = {'sha1':sha1, 'size':st.st_size, 'mtime_ns':st.st_mtime_ns}
+        if old is None or old['sha1'] != sha1:
+            changed.append(key)
+    return changed, stats
+
+def vbb_manifest_alloc(manifest, key, nAnn, nObj):
+    """
+    The ann id and obj id ranges of a reconverted video. The video keeps its id ranges
+    when its boxes and objects still fit in them, otherwise it gets new ranges after
+    all allocated ids. The ids of the other videos never change.
+        OUTPUT
+            annId, objId: [start, end] ranges to record in the manifest, the ids of the
+                          video start at start. A kept range is the old one, so it does
+                          not shrink when the video has fewer boxes.
+    """
+    old = manifest['videos'].get(key)
+    if old is not None and nAnn <= old['annId'][1]-old['annId'][0]:
+        annId = list(old['annId'])
+    else:
+        annId = [manifest['annId_end'], manifest['annId_end']+nAnn]
+        manifest['annId_end'] += nAnn
+    if old is not None and nObj <= old['objId'][1]-old['objId'][0]:
+        objId = list(old['objId'])
+    else:
+        objId = [manifest['objId_end'], manifest['objId_end']+nObj]
+        manifest['objId_end'] += nObj
+    return annId, objId
+
+def vbbs_setups_to_cocos(vbbs, dbName, setups, annId_str, objId_str, skip,
+                         get_dbInfo, get_image_id, categories, filter_objLists):
+    """
+    The dataset independent part of vbbs2cocos_setups(), see there.
+        INPUT
+            get_dbInfo, get_image_id, filter_objLists: the functions of the dataset
+            categories: get_categories() of the dataset
+    """
+    annotations = []
+    cat_ids = {cat['name']:cat['id'] for cat in categories}
+
+    dbInfo = get_dbInfo(dbName)
+    for s in dbInfo['setIds']:
+        set_name = 'set{:0>2}'.format(s)
+        for v in dbInfo['vidIds'][s]:
+            vid_name = 'V{:0>3}'.format(v)
+            vbb = vbbs[set_name][vid_name]
+            objLists = vbb['objLists']
+            if not isinstance(objLists, VbbObjLists):
+                objLists = VbbObjLists.from_objLists(objLists, vbb['nFrame'])
+            flags = [filter_objLists(objLists,param)[1] for _, param in setups]
+            for k in np.flatnonzero(objLists.frame % skip == skip-1):
+                id = int(objLists.id[k])
+                pos = objLists.pos[k].tolist()
+                ann={}
+                ann['id']=annId_str+int(k)
+                ann['obj_id']=objId_str+id
+                ann['image_id']=get_image_id(s,v,int(objLists.frame[k]))
+                ann['category_name']=vbb['objLbl'][id]
+                ann['category_id']=cat_ids.get(vbb['objLbl'][id],-1)
+                ann['bbox']=pos
+                ann['bbox_v']=objLists.posv[k].tolist()
+                ann['ignore']=False
+                ann['iscrowd']=bool(flags[0][k]) if len(setups) else False
+                for (name, _), flag in zip(setups, flags):
+                    ann['iscrowd_'+name]=bool(flag[k])
+                ann['occl']=int(objLists.occl[k])
+                ann['segmentation']=[]
+                ann['area']=pos[2]*pos[3]
+                annotations.append(ann)
+            annId_str = annId_str + len(objLists.id)
+            objId_str = objId_str + vbb['maxObj']
+
+    return annotations, annId_str, objId_str
+
+def export_vbbs_cocos(vbbs, targets, annId_str, objId_str,
+                      get_dbInfo, get_image_ids, vbb2coco, save_coco):
+    """
+    The dataset independent part of export_cocos(), see there.
+        INPUT
+            get_dbInfo, get_image_ids, vbb2coco, save_coco: the functions of the dataset
+    """
+    # videos in set order, each with the targets it belongs to
+    vid_targets = {}
+    for t, (dbName, skip, param, json_file) in enumerate(targets):
+        dbInfo = get_dbInfo(dbName)
+        for s in dbInfo['setIds']:
+            for v in dbInfo['vidIds'][s]:
+                vid_targets.setdefault((s,v), []).append(t)
+
+    # a target is saved after its last video, only the unfinished ones are held
+    last_vid = {}
+    for vid in sorted(vid_targets):
+        for t in vid_targets[vid]:
+            last_vid[t] = vid
+
+    annotations = [[] for _ in targets]
+    for s, v in sorted(vid_targets):
+        vbb = vbbs['set{:0>2}'.format(s)]['V{:0>3}'.format(v)]
+        for t in vid_targets[(s,v)]:
+            dbName, skip, param, json_file = targets[t]
+            anns, annId_end, objId_end = vbb2coco(s,v,vbb,annId_str,objId_str,param=param,skip=skip)
+            annotations[t].extend(anns)
+        annId_str, objId_str = annId_end, objId_end
+        for t in vid_targets[(s,v)]:
+            if last_vid[t] != (s,v):
+                continue
+            dbName, skip, param, json_file = targets[t]
+            print('Save {} (skip={}) to {}.'.format(dbName, skip, json_file))
+            save_coco(annotations[t],get_image_ids(dbName,vbbs,skip),json_file)
+            annotations[t] = None
+    for t, (dbName, skip, param, json_file) in enumerate(targets):
+        if t not in last_vid:
+            save_coco([],get_image_ids(dbName,vbbs,skip),json_file)
+    return annId_str, objId_str
+
+def update_vbbs_coco(ann_dir, dbName, json_file, param, skip, manifest_file, cache_dir, ext, annId_str, objId_str,
+                     get_dbInfo, get_image_ids, vbb2coco, save_coco):
+    """
+    The dataset independent part of update_coco(), see there.
+        INPUT
+            get_dbInfo, get_image_ids, vbb2coco, save_coco: the functions of the dataset
+    """
+    if manifest_file is None:
+        manifest_file = json_file + '.manifest'
+    config = {'dbName':dbName, 'param':param, 'skip':skip, 'ext':ext}
+
+    dbInfo = get_dbInfo(dbName)
+    vbbs = load_vbbs(ann_dir, lazy=True, cache_dir=cache_dir, ext=ext)
+    files = {}
+    for s in dbInfo['setIds']:
+        for v in dbInfo['vidIds'][s]:
+            set_name, vid_name = 'set{:0>2}'.format(s), 'V{:0>3}'.format(v)
+            files[set_name+'/'+vid_name] = vbbs[set_name][vid_name].filename
+
+    manifest = load_vbb_manifest(manifest_file, config)
+    old_anns = defaultdict(list)
+    if manifest is not None and os.path.exists(json_file):
+        for ann in load_json(json_file)['annotations']:
+            s, v = ann['image_id']//(10**8), ann['image_id']//(10**5)%1000
+            old_anns['set{:0>2}/V{:0>3}'.format(s,v)].append(ann)
+    else:
+        manifest = new_vbb_manifest(config, annId_str, objId_str)
+    changed, stats = vbb_manifest_changes(manifest, files)
+
+    annotations = []
+    for key in sorted(files):
+        if key not in changed:
+            annotations.extend(old_anns[key])
+            manifest['videos'][key].update(stats[key])
+            continue
+        s, v = int(key[3:5]), int(key[7:])
+        vbb = load_vbb_cached(files[key], cache_dir, columnar=True)
+        annId, objId = vbb_manifest_alloc(manifest, key, len(vbb['objLists'].id), vbb['maxObj'])
+        anns, _, _ = vbb2coco(s,v,vbb,annId[0],objId[0],param=param,skip=skip)
+        annotations.extend(anns)
+        manifest['videos'][key] = dict(stats[key], nFrame=vbb['nFrame'], annId=annId, objId=objId)
+        del vbb
+    # forget the videos which are gone, annId_end keeps their ids from being reused
+    for key in list(manifest['videos']):
+        if key not in files:
+            del manifest['videos'][key]
+
+    headers = defaultdict(dict)
+    for key, entry in manifest['videos'].items():
+        headers[key[:5]][key[6:]] = {'nFrame':entry['nFrame']}
+    image_ids = get_image_ids(dbName,headers,skip)
+    save_coco(annotations,image_ids,json_file)
+    save_vbb_manifest(manifest, manifest_file)
+    print('Converted {} of {} videos.'.format(len(changed), len(files)))
+    return changed
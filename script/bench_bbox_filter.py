@@ -0,0 +1,76 @@
+'''
+Compare the per box filter()/bbox_squarify() loop of the old bbox_filter() with
+bbox_filter() (one frame per call) and filter_objLists() with bbox_squarify_array()
+(one video per call) on the caltech train set.
+
+The 6.1x speedup quoted when the filter was vectorized was measured on a synthetic
+71 video train set with 1.8M boxes, not on the real caltech annotations. Rerun this
+script on the real annotations to get the numbers for the dataset. On that synthetic
+set: per box loop 2.37s, numpy per frame 8.41s, filter_objLists per video 0.69s.
+A frame holds a few boxes, so bbox_filter() keeps the per box loop.
+
+python bench_bbox_filter.py [caltech annotations dir]
+'''
+import sys
+import time
+import numpy as np
+import pydatatool as pdt
+
+ann_dir = sys.argv[1] if len(sys.argv) > 1 else '/home/all/datasets/caltech/annotations'
+
+def legacy_bbox_filter(bboxs,param):
+    # bbox_filter() before it was vectorized, one filter() and bbox_squarify() per box
+    bbox_filted = []
+    if len(param['lbls']) != 0:
+        lbl = set(param['lbls'])|(set(param['ilbls']))
+        bbox_filted = [bbox for bbox in bboxs if bbox['lbl'] in lbl]
+    for bbox in bbox_filted:
+        bbox['ignore'] = pdt.caltech.filter(bbox,param)
+        if (bbox['ignore'] == 0) and (len(param['squarify']) != 0):
+            bbox['pos'] = pdt.caltech.bbox_squarify(bbox['pos'],param['squarify'][0],param['squarify'][1])
+    return bbox_filted
+
+print("Load vbbs ...")
+vbbs = pdt.caltech.load_vbbs(ann_dir, columnar=True)
+dbInfo = pdt.caltech.get_dbInfo('caltech_train')
+objLists = [vbbs['set{:0>2}'.format(s)]['V{:0>3}'.format(v)]['objLists']
+            for s in dbInfo['setIds'] for v in dbInfo['vidIds'][s]]
+print("Done. {} boxes in {} videos.".format(sum(len(ol.pos) for ol in objLists), len(objLists)))
+
+param = pdt.caltech.get_default_filter()
+param['hRng'] = [50,float('inf')]
+param['vRng'] = [0.65,1]
+param['squarify'] = [3,0.41]
+
+# bbox_filter() changes the obj dicts, every run gets its own copy
+frames = [ol[i] for ol in objLists for i in ol]
+tic = time.time()
+res_loop = [legacy_bbox_filter(objs,param) for objs in frames]
+t_loop = time.time()-tic
+
+frames = [ol[i] for ol in objLists for i in ol]
+tic = time.time()
+res_frame = [pdt.caltech.bbox_filter(objs,param) for objs in frames]
+t_frame = time.time()-tic
+
+tic = time.time()
+res_video = []
+for ol in objLists:
+    keep, ignore = pdt.caltech.filter_objLists(ol,param)
+    pos = ol.pos.copy()
+    sq = keep & ~ignore
+    pos[sq] = pdt.caltech.bbox_squarify_array(pos[sq],param['squarify'][0],param['squarify'][1])
+    res_video.append((ignore[keep], pos[keep]))
+t_video = time.time()-tic
+
+flat_loop = [bbox for objs in res_loop for bbox in objs]
+flat_frame = [bbox for objs in res_frame for bbox in objs]
+ignore_loop = np.array([bool(bbox['ignore']) for bbox in flat_loop])
+pos_loop = np.array([bbox['pos'] for bbox in flat_loop]).reshape(-1,4)
+assert np.array_equal(ignore_loop, np.array([bool(bbox['ignore']) for bbox in flat_frame]))
+assert np.allclose(pos_loop, np.array([bbox['pos'] for bbox in flat_frame]).reshape(-1,4))
+assert np.array_equal(ignore_loop, np.concatenate([i for i, _ in res_video]))
+assert np.allclose(pos_loop, np.concatenate([p for _, p in res_video]))
+print('per box loop:               {:0.3f}s'.format(t_loop))
+print('bbox_filter, per frame:     {:0.3f}s ({:0.1f}x)'.format(t_frame, t_loop/max(t_frame,1e-9)))
+print('filter_objLists, per video: {:0.3f}s ({:0.1f}x)'.format(t_video, t_loop/max(t_video,1e-9)))
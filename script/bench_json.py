@@ -0,0 +1,50 @@
+'''
+Time load_json/save_json with every installed json backend on the repo annotation files.
+
+python bench_json.py [json files]
+'''
+import os
+import sys
+import time
+import tempfile
+import pydatatool as pdt
+
+root = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data')
+files = sys.argv[1:] or \
+        [os.path.join(root, 'json', fn) for fn in sorted(os.listdir(os.path.join(root, 'json')))] + \
+        [os.path.join(root, 'citypersons', 'annotations', 'val_gt.json')]
+
+backends = []
+for name in pdt.JSON_BACKENDS:
+    try:
+        pdt.get_json_backend(name)
+        backends.append(name)
+    except ImportError:
+        print('{} is not installed.'.format(name))
+
+def best_of(fn, repeat=3):
+    t = float('inf')
+    for _ in range(repeat):
+        tic = time.time()
+        fn()
+        t = min(t, time.time()-tic)
+    return t
+
+tmp_file = os.path.join(tempfile.mkdtemp(), 'bench.json')
+total = {name: [0.0, 0.0] for name in backends}
+print('{:<28}'.format('file') + ''.join('{:>22}'.format(name+' load/save') for name in backends))
+for fn in files:
+    data = pdt.load_json(fn, 'json')
+    row = '{:<28}'.format(os.path.basename(fn))
+    for name in backends:
+        assert pdt.load_json(fn, name) == data
+        t_load = best_of(lambda: pdt.load_json(fn, name))
+        t_save = best_of(lambda: pdt.save_json(data, tmp_file, name))
+        total[name][0] += t_load
+        total[name][1] += t_save
+        row += '{:>22}'.format('{:0.3f}s/{:0.3f}s'.format(t_load, t_save))
+    print(row)
+print('{:<28}'.format('total') + ''.join('{:>22}'.format('{:0.3f}s/{:0.3f}s'.format(*total[name])) for name in backends))
+print('auto decodes with {}, encodes with {}.'.format(pdt.get_json_backend('auto').name,
+                                                     pdt.get_json_backend('auto', dump=True).name))
+os.remove(tmp_file)
@@ -1,22 +1,12 @@
 import pydatatool as pdt
 print("Load vbbs ...")
-vbbs = pdt.caltech.load_vbbs('/home/all/datasets/caltech/annotations')
+vbbs = pdt.caltech.load_vbbs('/home/all/datasets/caltech/annotations', lazy=True)
 print("Done.")
-print("Convert train...")
 param = pdt.caltech.get_default_filter()
 param['hRng'] = [50,float('inf')]
 param['vRng'] = [1,1]
-annotations_train, annId_str, objId_str = pdt.caltech.vbbs2cocos(vbbs,'caltech_train',0,0,param)
-print("Convert test...")
-annotations_test, annId_str, objId_str = pdt.caltech.vbbs2cocos(vbbs,'caltech_test',annId_str, objId_str,param)
+print("Convert and save caltech train and test..")
+targets = [('caltech_train', 3, param, '../output/json/caltech_train_10x_reasonable_nooccl.json'),
+           ('caltech_test', 30, param, '../output/json/caltech_test_1x_reasonable.json')]
+pdt.caltech.export_cocos(vbbs, targets)
 print("Done.")
-print("Save caltech train..")
-skip = 3
-image_ids_train = pdt.caltech.get_image_ids('caltech_train',vbbs,skip)
-pdt.caltech.save_coco(annotations_train,image_ids_train,'../output/json/caltech_train_10x_reasonable_nooccl.json')
-print("Done.")
-print("Save caltech test..")
-skip = 30
-image_ids_test = pdt.caltech.get_image_ids('caltech_test',vbbs,skip)
-pdt.caltech.save_coco(annotations_test,image_ids_test,'../output/json/caltech_test_1x_reasonable.json')
-print("Done.")
\ No newline at end of file
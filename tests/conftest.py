@@ -0,0 +1,156 @@
+# Copyright (c) 2018, Zhewei Xu
+# [xzhewei-at-gmail.com]
+# Licensed under The MIT License [see LICENSE for details]
+
+# Synthetic vbb annotations shared by the tests, written with the same
+# structure as vbb 1.4 files saved by matlab.
+
+import os
+import numpy as np
+import pytest
+from scipy.io import savemat
+
+import pydatatool as pdt
+
+LBLS = ['person','people','person-fa','person?']
+
+def write_vbb(filename, rng, nFrame=40, maxObj=6, lbls=LBLS):
+    """
+    Write a random vbb, objects with random boxes, occlusion and labels.
+    """
+    lbl = [lbls[rng.randint(len(lbls))] for _ in range(maxObj)]
+    strs = rng.randint(1, nFrame//2, size=maxObj)
+    ends = np.minimum(nFrame, strs + rng.randint(3, nFrame//2, size=maxObj))
+    dt = [('id','O'),('pos','O'),('occl','O'),('lock','O'),('posv','O')]
+    objLists = np.empty((1,nFrame), dtype=object)
+    for f in range(nFrame):
+        ids = [i for i in range(maxObj) if strs[i]-1 <= f < ends[i]]
+        if not ids:
+            objLists[0,f] = np.zeros((0,0))
+            continue
+        s = np.empty((1,len(ids)), dtype=dt)
+        for k, i in enumerate(ids):
+            pos = np.array([[rng.uniform(0,600), rng.uniform(0,440), rng.uniform(5,60), rng.uniform(10,120)]])
+            occl = rng.randint(2)
+            if not occl or rng.rand() < .2:
+                posv = np.zeros((1,4))
+            elif rng.rand() < .3:
+                posv = pos.copy()
+            else:
+                posv = pos*[[1,1,.5,.7]]
+            s[0,k] = (np.array([[i+1]],dtype=float), pos, np.array([[occl]],dtype=float),
+                      np.array([[rng.randint(2)]],dtype=float), posv)
+        objLists[0,f] = s
+    objLbl = np.empty((1,maxObj), dtype=object)
+    for i, l in enumerate(lbl):
+        objLbl[0,i] = np.array([l])
+    A = {'nFrame':np.array([[nFrame]],dtype=float), 'objLists':objLists,
+         'maxObj':np.array([[maxObj]],dtype=float), 'objInit':np.ones((1,maxObj)),
+         'objLbl':objLbl, 'objStr':strs[None].astype(float), 'objEnd':ends[None].astype(float),
+         'objHide':np.zeros((1,maxObj)), 'altered':np.array([[0.]]),
+         'log':np.zeros((1,0)), 'logLen':np.array([[0.]])}
+    path, _ = os.path.split(filename)
+    if not os.path.exists(path):
+        os.makedirs(path)
+    savemat(filename, {'A':A})
+
+def write_vbb_boxes(filename, nFrame, boxes):
+    """
+    Write a vbb with the given boxes, a list of (frame, lbl, pos, posv, occl),
+    every box is an object of its own.
+    """
+    dt = [('id','O'),('pos','O'),('occl','O'),('lock','O'),('posv','O')]
+    objLists = np.empty((1,nFrame), dtype=object)
+    for f in range(nFrame):
+        ids = [i for i, b in enumerate(boxes) if b[0] == f]
+        if not ids:
+            objLists[0,f] = np.zeros((0,0))
+            continue
+        s = np.empty((1,len(ids)), dtype=dt)
+        for k, i in enumerate(ids):
+            _, _, pos, posv, occl = boxes[i]
+            s[0,k] = (np.array([[i+1]],dtype=float), np.array([pos],dtype=float),
+                      np.array([[occl]],dtype=float), np.array([[0]],dtype=float),
+                      np.array([posv],dtype=float))
+        objLists[0,f] = s
+    n = len(boxes)
+    objLbl = np.empty((1,n), dtype=object)
+    for i, b in enumerate(boxes):
+        objLbl[0,i] = np.array([b[1]])
+    frames = np.array([[b[0]+1 for b in boxes]], dtype=float)
+    A = {'nFrame':np.array([[nFrame]],dtype=float), 'objLists':objLists,
+         'maxObj':np.array([[n]],dtype=float), 'objInit':np.ones((1,n)),
+         'objLbl':objLbl, 'objStr':frames, 'objEnd':frames,
+         'objHide':np.zeros((1,n)), 'altered':np.array([[0.]]),
+         'log':np.zeros((1,0)), 'logLen':np.array([[0.]])}
+    path, _ = os.path.split(filename)
+    if not os.path.exists(path):
+        os.makedirs(path)
+    savemat(filename, {'A':A})
+
+@pytest.fixture(scope='session')
+def caltech_ann(tmp_path_factory):
+    """
+    A caltech annotations dir, every video of get_dbInfo('caltech') with a few frames.
+    """
+    root = str(tmp_path_factory.mktemp('caltech_ann'))
+    rng = np.random.RandomState(0)
+    dbInfo = pdt.caltech.get_dbInfo('caltech')
+    for s in dbInfo['setIds']:
+        for v in dbInfo['vidIds'][s]:
+            fn = os.path.join(root, 'set{:0>2}'.format(s), 'V{:0>3}.vbb'.format(v))
+            write_vbb(fn, rng, nFrame=rng.randint(35,70))
+    return root
+
+def random_objs(rng, n, lbls=LBLS):
+    """
+    n random obj dicts as in vbb['objLists'][i], and a few degenerate ones.
+    """
+    objs = []
+    for k in range(n):
+        pos = [rng.uniform(0,600), rng.uniform(0,440), rng.uniform(5,60), rng.uniform(10,120)]
+        r = rng.rand()
+        if r < .3:
+            posv = [0.,0.,0.,0.]
+        elif r < .45:
+            posv = list(pos)
+        else:
+            posv = [pos[0], pos[1], pos[2]*rng.uniform(.1,1), pos[3]*rng.uniform(.1,1)]
+        objs.append({'id':k, 'pos':pos, 'posv':posv, 'occl':int(rng.randint(3)), 'lock':0,
+                     'ignore':False, 'lbl':lbls[rng.randint(len(lbls))]})
+    # zero width, height and area boxes
+    for pos in ([10.,10.,0.,50.], [10.,10.,20.,0.], [10.,10.,0.,0.]):
+        for posv, occl in (([0.,0.,0.,0.], 0), ([0.,0.,0.,0.], 1), (list(pos), 1), ([10.,10.,5.,5.], 1)):
+            objs.append({'id':len(objs), 'pos':list(pos), 'posv':list(posv), 'occl':occl, 'lock':0,
+                         'ignore':False, 'lbl':'person'})
+    return objs
+
+def write_seq(filename, frames, ts16=False, fmt=102, width=640, height=480):
+    """
+    Write a Norpix seq of jpg (fmt 102) frames with 8 or 16 byte timestamps,
+    or of raw frames (fmt 100) of width*height bytes.
+    """
+    raw = fmt in (100, 101, 200)
+    size = width*height if raw else 0
+    h = bytearray(1024)
+    h[0:4] = np.array([0xFEED],'<u4').tobytes()
+    h[28:36] = np.array([5,1024],'<i4').tobytes()
+    h[548:584] = np.array([width,height,8,8,size,fmt,len(frames),0,size],'<u4').tobytes()
+    h[584:592] = np.array([30.0],'<f8').tobytes()
+    with open(filename, 'wb') as f:
+        f.write(h)
+        for fr in frames:
+            if raw:
+                f.write(fr)
+                continue
+            f.write(np.array([len(fr)+4],'<u4').tobytes())
+            f.write(fr)
+            f.write(b'\x01\x00\x00\x00\x02\x00' + b'\x00'*(10 if ts16 else 2))
+
+def jpg_frames(n, seed):
+    """
+    n fake jpg images of random sizes.
+    """
+    rng = np.random.RandomState(seed)
+    return [b'\xFF\xD8\xFF\xE0\x00\x10JFIF' + rng.bytes(rng.randint(100,5000)) + b'\xFF\xD9'
+            for _ in range(n)]
@@ -0,0 +1,233 @@
+import json
+import os
+import shutil
+import numpy as np
+
+import pydatatool as pdt
+from conftest import write_vbb, write_vbb_boxes
+
+def legacy_vbb2coco(m, setId, vidId, vbb, annId_str, objId_str, param):
+    # vbb2coco() before skip, every frame is converted
+    anns = []
+    for i in range(vbb['nFrame']):
+        for obj in vbb['objLists'][i]:
+            anns.append({'id':annId_str,
+                         'obj_id':objId_str+obj['id'],
+                         'image_id':m.get_image_id(setId,vidId,i),
+                         'category_name':vbb['objLbl'][obj['id']],
+                         'category_id':m.get_category_id(vbb['objLbl'][obj['id']]),
+                         'bbox':obj['pos'],
+                         'bbox_v':obj['posv'],
+                         'ignore':obj['ignore'],
+                         'iscrowd':m.filter(obj,param) or obj['ignore'],
+                         'occl':obj['occl'],
+                         'segmentation':[],
+                         'area':obj['pos'][2]*obj['pos'][3]})
+            annId_str += 1
+    return anns, annId_str, objId_str + vbb['maxObj']
+
+def legacy_save_coco(annotations, image_ids, json_file):
+    # save_coco() before streaming, a list join and one json.dump
+    img_ids = [img['id'] for img in image_ids]
+    json_data = {'info':{}, 'images':image_ids,
+                 'annotations':[ann for ann in annotations if ann['image_id'] in img_ids],
+                 'categories':pdt.caltech.get_categories()}
+    json_data['info'] = {'description': 'This is a json version label of the Caltech Pedestrian dataset, converted from vbb version.',
+                         'version': '1.1',
+                         'vbb_version': '1.4',
+                         'create_time': '2018-04-03'}
+    with open(json_file, 'w') as f:
+        json.dump(json_data, f)
+
+def legacy_export(vbbs, dbName, skip, param, json_file, annId_str, objId_str):
+    dbInfo = pdt.caltech.get_dbInfo(dbName)
+    annotations = []
+    for s in dbInfo['setIds']:
+        for v in dbInfo['vidIds'][s]:
+            vbb = vbbs['set{:0>2}'.format(s)]['V{:0>3}'.format(v)]
+            anns, annId_str, objId_str = legacy_vbb2coco(pdt.caltech, s, v, vbb, annId_str, objId_str, param)
+            annotations.extend(anns)
+    legacy_save_coco(annotations, pdt.caltech.get_image_ids(dbName, vbbs, skip), json_file)
+    return annId_str, objId_str
+
+def read(fn):
+    with open(fn, 'rb') as f:
+        return f.read()
+
+def filter_param():
+    param = pdt.caltech.get_default_filter()
+    param['hRng'] = [50, float('inf')]
+    param['vRng'] = [0.65, 1]
+    return param
+
+def test_export_cocos_matches_legacy(caltech_ann, tmp_path):
+    vbbs = pdt.caltech.load_vbbs(caltech_ann)
+    param = filter_param()
+    a, o = legacy_export(vbbs, 'caltech_train', 3, param, str(tmp_path/'train_ref.json'), 0, 0)
+    a, o = legacy_export(vbbs, 'caltech_test', 30, param, str(tmp_path/'test_ref.json'), a, o)
+
+    for kwargs in ({}, {'columnar':True}, {'lazy':True}):
+        vbbs = pdt.caltech.load_vbbs(caltech_ann, **kwargs)
+        ids = pdt.caltech.export_cocos(vbbs, [('caltech_train', 3, param, str(tmp_path/'train.json')),
+                                              ('caltech_test', 30, param, str(tmp_path/'test.json'))])
+        assert ids == (a, o)
+        assert read(tmp_path/'train.json') == read(tmp_path/'train_ref.json')
+        assert read(tmp_path/'test.json') == read(tmp_path/'test_ref.json')
+
+def test_vbbs2cocos_skip_matches_legacy(caltech_ann, tmp_path):
+    vbbs = pdt.caltech.load_vbbs(caltech_ann, columnar=True)
+    param = filter_param()
+    legacy_export(pdt.caltech.load_vbbs(caltech_ann), 'caltech_test', 30, param, str(tmp_path/'ref.json'), 0, 0)
+    anns, _, _ = pdt.caltech.vbbs2cocos(vbbs, 'caltech_test', 0, 0, param, 30)
+    image_ids = pdt.caltech.get_image_ids('caltech_test', vbbs, 30)
+    pdt.caltech.save_coco(anns, image_ids, str(tmp_path/'skip.json'))
+    pdt.caltech.save_coco(pdt.caltech.iter_vbbs2cocos(vbbs, 'caltech_test', 0, 0, param, 30),
+                          image_ids, str(tmp_path/'iter.json'))
+    assert read(tmp_path/'skip.json') == read(tmp_path/'ref.json')
+    assert read(tmp_path/'iter.json') == read(tmp_path/'ref.json')
+
+def test_vbbs2cocos_setups_matches_single_setups(caltech_ann, tmp_path):
+    vbbs = pdt.caltech.load_vbbs(caltech_ann)
+    reasonable = filter_param()
+    all_ = pdt.caltech.get_default_filter()
+    setups = [('reasonable', reasonable), ('all', all_)]
+    anns, _, _ = pdt.caltech.vbbs2cocos_setups(vbbs, 'caltech_test', setups)
+    image_ids = pdt.caltech.get_image_ids('caltech_test', vbbs, 30)
+    pdt.caltech.save_cocos(anns, image_ids, setups, str(tmp_path/'setup_{}.json'))
+    for name, param in setups:
+        legacy_export(vbbs, 'caltech_test', 30, param, str(tmp_path/'ref.json'), 0, 0)
+        assert read(tmp_path/('setup_%s.json' % name)) == read(tmp_path/'ref.json')
+
+def anns_by_video(json_file):
+    out = {}
+    for ann in pdt.load_json(json_file)['annotations']:
+        key = 'set{:0>2}/V{:0>3}'.format(ann['image_id']//10**8, ann['image_id']//10**5%1000)
+        out.setdefault(key, []).append(ann)
+    return out
+
+def test_update_coco_keeps_ids(caltech_ann, tmp_path):
+    ann_dir = str(tmp_path/'ann')
+    shutil.copytree(caltech_ann, ann_dir)
+    vbb_file = os.path.join(ann_dir, 'set06', 'V000.vbb')
+    boxes = [(f, 'person', [10.*k, 20, 30, 60], [0,0,0,0], 0) for f in range(2, 40, 3) for k in range(1+f%3)]
+    write_vbb_boxes(vbb_file, 40, boxes)
+    param = filter_param()
+    json_file = str(tmp_path/'test.json')
+
+    # the first run is a full conversion
+    assert len(pdt.caltech.update_coco(ann_dir, 'caltech_test', json_file, param, 3)) > 1
+    vbbs = pdt.caltech.load_vbbs(ann_dir)
+    pdt.caltech.save_coco(pdt.caltech.iter_vbbs2cocos(vbbs, 'caltech_test', 0, 0, param, 3),
+                          pdt.caltech.get_image_ids('caltech_test', vbbs, 3), str(tmp_path/'ref.json'))
+    assert read(json_file) == read(tmp_path/'ref.json')
+    manifest = pdt.load_json(json_file+'.manifest')
+    for key, entry in manifest['videos'].items():
+        vbb = vbbs[key[:5]][key[6:]]
+        assert entry['annId'][1]-entry['annId'][0] == sum(len(o) for o in vbb['objLists'].values())
+        assert entry['objId'][1]-entry['objId'][0] == vbb['maxObj']
+    before = anns_by_video(json_file)
+
+    # nothing changed
+    assert pdt.caltech.update_coco(ann_dir, 'caltech_test', json_file, param, 3) == []
+    assert read(json_file) == read(tmp_path/'ref.json')
+
+    # fewer boxes, one moved: the video keeps its ids, the others are untouched
+    edited = boxes[1:]
+    edited[0] = edited[0][:2] + ([300, 20, 30, 60],) + edited[0][3:]
+    write_vbb_boxes(vbb_file, 40, edited)
+    assert pdt.caltech.update_coco(ann_dir, 'caltech_test', json_file, param, 3) == ['set06/V000']
+    after = anns_by_video(json_file)
+    assert sorted(after) == sorted(before)
+    for key in before:
+        if key != 'set06/V000':
+            assert after[key] == before[key]
+    old, new = before['set06/V000'], after['set06/V000']
+    assert min(a['id'] for a in new) == min(a['id'] for a in old)
+    assert min(a['obj_id'] for a in new) == min(a['obj_id'] for a in old)
+    assert len(new) == len(old)-1 and new[0]['bbox'] == [300, 20, 30, 60]
+    manifest2 = pdt.load_json(json_file+'.manifest')
+    assert manifest2['videos']['set06/V000']['annId'] == manifest['videos']['set06/V000']['annId']
+    assert manifest2['annId_end'] == manifest['annId_end']
+
+    # more boxes than the range: new ids after all allocated ones
+    write_vbb_boxes(vbb_file, 40, boxes + [(5, 'person', [500, 20, 30, 60], [0,0,0,0], 0)])
+    pdt.caltech.update_coco(ann_dir, 'caltech_test', json_file, param, 3)
+    after = anns_by_video(json_file)
+    assert min(a['id'] for a in after['set06/V000']) == manifest['annId_end']
+    assert min(a['obj_id'] for a in after['set06/V000']) == manifest['objId_end']
+    for key in before:
+        if key != 'set06/V000':
+            assert after[key] == before[key]
+
+def test_export_cocos_saves_each_target_when_done(caltech_ann, tmp_path, monkeypatch):
+    vbbs = pdt.caltech.load_vbbs(caltech_ann)
+    events = []
+    vbb2coco, save_coco = pdt.caltech.vbb2coco, pdt.caltech.save_coco
+    def spy_vbb2coco(s, v, *args, **kwargs):
+        events.append(('video', s))
+        return vbb2coco(s, v, *args, **kwargs)
+    def spy_save_coco(annotations, image_ids, json_file):
+        events.append(('save', os.path.basename(json_file)))
+        return save_coco(annotations, image_ids, json_file)
+    monkeypatch.setattr(pdt.caltech.utils, 'vbb2coco', spy_vbb2coco)
+    monkeypatch.setattr(pdt.caltech.utils, 'save_coco', spy_save_coco)
+    param = filter_param()
+    pdt.caltech.export_cocos(vbbs, [('caltech_train', 3, param, str(tmp_path/'train.json')),
+                                    ('caltech_test', 30, param, str(tmp_path/'test.json'))])
+    # the train file is written before the first test video is converted
+    k = events.index(('save', 'train.json'))
+    assert max(s for e, s in events[:k] if e == 'video') == 5
+    assert min(s for e, s in events[k+1:] if e == 'video') == 6
+    assert events[-1] == ('save', 'test.json')
+
+def test_kaist_positional_skip(tmp_path):
+    rng = np.random.RandomState(5)
+    dbInfo = pdt.kaist.get_dbInfo('kaist_test_all')
+    for s in dbInfo['setIds']:
+        for v in dbInfo['vidIds'][s]:
+            write_vbb(str(tmp_path/'set{:0>2}'.format(s)/'V{:0>3}.vbb'.format(v)), rng,
+                      lbls=['person','people','cyclist','person?'])
+    vbbs = pdt.kaist.load_vbbs(str(tmp_path))
+    param = pdt.kaist.get_default_filter()
+    # skip stays the fifth argument as user-012 added it, param comes after it
+    ref = pdt.kaist.vbbs2cocos(vbbs, 'kaist_test_all', 0, 0, skip=20, param=param)
+    assert pdt.kaist.vbbs2cocos(vbbs, 'kaist_test_all', 0, 0, 20, param) == ref
+    assert list(pdt.kaist.iter_vbbs2cocos(vbbs, 'kaist_test_all', 0, 0, 20, param)) == ref[0]
+    assert set(ann['image_id'] % 20 for ann in ref[0]) == {19}
+    vbb = vbbs['set06']['V000']
+    assert pdt.kaist.vbb2coco(6, 0, vbb, 0, 0, 20) == pdt.kaist.vbb2coco(6, 0, vbb, skip=20)
+
+def legacy_txts2cocos(pth, annId_str, objId_str, param):
+    # txts2cocos() before load_txts(), one file after the other
+    annotations = []
+    image_ids = []
+    for fn in sorted(os.listdir(pth)):
+        s, v, i = fn.split('.')[0].split('_')
+        imgId = pdt.caltech.get_image_id(int(s[3:]), int(v[1:]), int(i[1:]))
+        objs = pdt.caltech.load_txt(os.path.join(pth, fn))
+        anns, annId_str, objId_str = pdt.caltech.txt2coco(imgId, objs, annId_str, objId_str, param)
+        annotations.extend(anns)
+        image_ids.append({'id':imgId, 'file_name':fn.split('.')[0]+'.jpg', 'height':480, 'width':640})
+    return annotations, image_ids, annId_str, objId_str
+
+def test_txts2cocos_matches_legacy(tmp_path):
+    rng = np.random.RandomState(8)
+    lbls = ['person', 'people', 'person?', 'person-fa']
+    for s in (6, 7):
+        for v in range(3):
+            for i in range(29, 300, 30):
+                with open(str(tmp_path/'set{:0>2}_V{:0>3}_I{:0>5}.txt'.format(s, v, i)), 'w') as f:
+                    f.write('% bbGt version=3\n')
+                    for _ in range(rng.randint(0, 4)):
+                        pos = rng.uniform(0, 400, 4).round(1)
+                        posv = pos*[1, 1, .5, .5] if rng.rand() < .5 else [0, 0, 0, 0]
+                        f.write('{} {} {} {} {} {} {} {} {} {} {} 0\n'.format(
+                            lbls[rng.randint(4)], *(list(pos)+[int(posv[2] > 0)]+list(posv)+[rng.randint(2)])))
+    param = filter_param()
+    ref = legacy_txts2cocos(str(tmp_path), 5, 7, param)
+    assert len(ref[0]) > 0 and any(len(pdt.caltech.load_txt(str(tmp_path/f))) == 0 for f in os.listdir(str(tmp_path)))
+    for workers in (0, 4):
+        assert pdt.caltech.txts2cocos(str(tmp_path), 5, 7, param, workers) == ref
+    files, objs = pdt.caltech.load_txts(str(tmp_path), workers=4)
+    assert files == sorted(os.listdir(str(tmp_path)))
+    assert objs == [pdt.caltech.load_txt(str(tmp_path/f)) for f in files]
@@ -0,0 +1,138 @@
+import os
+import numpy as np
+import pytest
+
+import pydatatool as pdt
+from pydatatool.dbeval import comp_oas, eval_res, comp_roc, log_average_miss_rate, db_eval, get_eval_setups
+from conftest import write_vbb_boxes
+
+def test_comp_oas():
+    dt = np.array([[0.,0,10,10]])
+    gt = np.array([[5.,0,10,10], [5.,0,10,10], [10.,0,10,10], [2.,2,4,4]])
+    ig = np.array([False, True, False, True])
+    # iou 50/150, ignore gt 50/dt area 100, touching boxes, ignore gt inside the dt 16/100
+    np.testing.assert_allclose(comp_oas(dt, gt, ig), [[1/3., .5, 0, .16]])
+    assert comp_oas(np.zeros((0,4)), gt, ig).shape == (0,4)
+    assert comp_oas(dt, np.zeros((0,4)), np.zeros(0, bool)).shape == (1,0)
+
+def test_eval_res_greedy_by_score():
+    gt = [[0,0,10,10,0]]
+    dt = [[1,0,10,10,.5], [0,0,10,10,.9]]
+    g, d = eval_res(gt, dt)
+    # the higher score takes the gt even with a lower overlap, the other is a false positive
+    assert d[:,4].tolist() == [.9, .5] and d[:,5].tolist() == [1, 0]
+    assert g[:,4].tolist() == [1]
+
+def test_eval_res_ignore():
+    gt = [[0,0,10,10,1], [100,0,10,10,0]]
+    dt = [[2,2,5,5,.9], [50,0,10,10,.8], [100,0,10,10,.7]]
+    g, d = eval_res(gt, dt)
+    # non ignored gts first, the dt inside the ignore gt is -1 and the ignore gt stays -1
+    assert g[:,:4].tolist() == [[100,0,10,10], [0,0,10,10]]
+    assert g[:,4].tolist() == [1, -1]
+    assert d[:,5].tolist() == [-1, 0, 1]
+
+def test_eval_res_prefers_unmatched_gt_over_ignore():
+    gt = [[0,0,10,10,1], [2,0,10,10,0]]
+    dt = [[0,0,10,10,.9], [0,0,10,10,.8]]
+    g, d = eval_res(gt, dt)
+    # overlap 1 with the ignore gt, 80/120 with the other: the other is matched,
+    # then only the ignore gt is left
+    assert g[:,4].tolist() == [1, -1]
+    assert d[:,5].tolist() == [1, -1]
+
+def test_eval_res_ties():
+    gt = [[0,0,10,10,0], [0,0,10,10,0], [20,0,10,10,0]]
+    dt = [[0,0,10,10,.5], [20,0,10,10,.5], [0,0,10,10,.5]]
+    g, d = eval_res(gt, dt)
+    # equal scores keep their order, equal overlaps go to the last gt as in the matlab loop
+    assert d[:,:4].tolist() == [[0,0,10,10], [20,0,10,10], [0,0,10,10]]
+    assert d[:,5].tolist() == [1, 1, 1]
+    g, d = eval_res(gt, dt[:1])
+    assert g[:,4].tolist() == [0, 1, 0]
+
+def test_eval_res_threshold():
+    gt = [[0,0,10,10,0]]
+    # iou exactly .5 matches, just below does not
+    _, d = eval_res(gt, [[0,0,10,5,.9]], .5)
+    assert d[:,5].tolist() == [1]
+    _, d = eval_res(gt, [[0,0,10,4.9,.9]], .5)
+    assert d[:,5].tolist() == [0]
+
+def test_log_average_miss_rate():
+    # 8 images, 4 gts, dts by score tp fp tp fp tp
+    fppi, recall, ref_recall = comp_roc(4, 8, [.9, .5, .7, .6, .8], [1, 1, 1, 0, 0])
+    np.testing.assert_allclose(fppi, [0, .125, .125, .25, .25])
+    np.testing.assert_allclose(recall, [.25, .25, .5, .5, .75])
+    # fppi 10^-2 ... 10^-1 at recall .25, 10^-.75 at .5, 10^-.5 ... 1 at .75
+    np.testing.assert_allclose(ref_recall, [.25]*5 + [.5] + [.75]*3)
+    assert log_average_miss_rate(ref_recall) == pytest.approx(.75**(5/9.) * .5**(1/9.) * .25**(3/9.))
+
+def test_comp_roc_empty():
+    # no dts: compRoc gives [0] curves and recall 0, a miss rate of 1
+    fppi, recall, ref_recall = comp_roc(3, 10, [], [])
+    assert fppi.tolist() == [0] and recall.tolist() == [0] and (ref_recall == 0).all()
+    assert log_average_miss_rate(ref_recall) == 1
+    # no gts: every dt is a false positive, recall 0
+    fppi, recall, ref_recall = comp_roc(0, 10, [.9, .8], [0, 0])
+    np.testing.assert_allclose(fppi, [.1, .2])
+    assert (recall == 0).all() and log_average_miss_rate(ref_recall) == 1
+    # all found before the first false positive
+    _, _, ref_recall = comp_roc(2, 10, [.9, .8], [1, 1])
+    assert log_average_miss_rate(ref_recall) == pytest.approx(1e-10)
+
+CALTECH_LBLS = ['person','person?','people','person-fa']
+
+def reference_scene(root):
+    """
+    One video of 60 frames evaluated at skip 30 (frames 29 and 59), the log-average
+    miss rates are traced by hand through dbEval.m and bbGt('evalRes'/'compRoc').
+    """
+    boxes = [(29, 'person', [100,100,41,100], [0,0,0,0], 0),   # A
+             (29, 'person', [300,100,20,40],  [0,0,0,0], 0),   # B, h 40
+             (29, 'people', [400,100,60,100], [0,0,0,0], 0),   # C, ignore label
+             (59, 'person', [200,150,30,80],  [200,150,30,40], 1), # D, visible .5
+             (59, 'person', [10,100,41,120],  [0,0,0,0], 0),   # E
+             (59, 'person', [500,200,41,90],  [0,0,0,0], 0)]   # F, missed
+    vbb_file = os.path.join(root, 'ann', 'set06', 'V000.vbb')
+    write_vbb_boxes(vbb_file, 60, boxes)
+    dets = [(30, [100,100,41,100], .9),    # A
+            (30, [300,100,20,40],  .8),    # B
+            (30, [410,100,41,100], .7),    # inside C
+            (30, [500,300,41,100], .6),    # false positive
+            (60, [10,100,41,120],  .5),    # E
+            (60, [0,0,41,100],     .95),   # false positive touching E
+            (60, [50,50,10,30],    .4),    # false positive, h 30
+            (45, [200,150,30,80],  .99)]   # D, a frame which is not evaluated
+    res_file = os.path.join(root, 'res', 'set06', 'V000.txt')
+    os.makedirs(os.path.dirname(res_file))
+    with open(res_file, 'w') as f:
+        for frame, bb, score in dets:
+            f.write('{:d},{:.3f},{:.3f},{:.3f},{:.3f},{:.7f}\n'.format(frame, *(bb+[score])))
+    return vbb_file, res_file
+
+def test_reference_scene(tmp_path):
+    vbb_file, res_file = reference_scene(str(tmp_path))
+    setups = get_eval_setups(['Reasonable', 'All'])
+    results = db_eval([(vbb_file, res_file)], 30, setups, CALTECH_LBLS, ['person'], [5,5,635,475])
+    mr = dict((r['name'], r) for r in results)
+    # Reasonable: gts A E F, B (h<50) D (visible .5) C ignore. dts by score
+    # .95 fp, .9 A, .8 -> B -1, .7 -> C -1, .6 fp, .5 E, .4 dropped (h<50/1.25).
+    # fppi .5 .5 1 1, recall 0 1/3 1/3 2/3 -> miss 1 at 10^-2..10^-.5, 2/3, 1/3
+    assert mr['Reasonable']['n_gt'] == 3
+    np.testing.assert_allclose(mr['Reasonable']['fppi'], [.5, .5, 1, 1])
+    assert mr['Reasonable']['mr'] == pytest.approx((2/3. * 1/3.)**(1/9.))
+    # All: gts A B D E F. dts .95 fp, .9 A, .8 B, .7 -> C -1, .6 fp, .5 E, .4 fp
+    # fppi .5 .5 .5 1 1 1.5, recall 0 .2 .4 .4 .6 .6 -> miss 1 .. 1, .6, .4
+    assert mr['All']['n_gt'] == 5
+    np.testing.assert_allclose(1-mr['All']['miss_rate'], [0, .2, .4, .4, .6, .6])
+    assert mr['All']['mr'] == pytest.approx((.6 * .4)**(1/9.))
+
+def test_db_eval_workers(tmp_path):
+    vbb_file, res_file = reference_scene(str(tmp_path))
+    videos = [(vbb_file, res_file), (vbb_file, str(tmp_path/'missing.txt'))]
+    setups = get_eval_setups()
+    r0 = db_eval(videos, 30, setups, CALTECH_LBLS, ['person'], [5,5,635,475])
+    r2 = db_eval(videos, 30, setups, CALTECH_LBLS, ['person'], [5,5,635,475], workers=2)
+    assert [r['mr'] for r in r0] == [r['mr'] for r in r2]
+    assert len(r0) == 18
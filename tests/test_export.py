@@ -0,0 +1,67 @@
+import os
+import numpy as np
+import pytest
+
+import pydatatool as pdt
+
+def legacy_to_yolo(coco, out_dir, list_file, image_dir, skip_empty):
+    # convert() and convert_annotation() of script/json2yolo.py before to_yolo()
+    def convert(size, box):
+        dw = 1./(size[0])
+        dh = 1./(size[1])
+        x = box[0] + box[2]/2.0 - 1
+        y = box[1] + box[3]/2.0 - 1
+        return (x*dw, y*dh, box[2]*dw, box[3]*dh)
+    img_anns = {}
+    for ann in coco['annotations']:
+        img_anns.setdefault(ann['image_id'], []).append(ann)
+    if not os.path.exists(out_dir):
+        os.makedirs(out_dir)
+    with open(list_file, 'w') as lf:
+        for img in coco['images']:
+            anns = img_anns.get(img['id'], [])
+            fname = img['file_name'].split('.')[0]
+            if len(anns) == 0 and skip_empty:
+                continue
+            with open(os.path.join(out_dir, fname+'.txt'), 'w') as f:
+                for ann in anns:
+                    if ann['ignore']:
+                        continue
+                    bb = convert((img['width'], img['height']), ann['bbox'])
+                    f.write(str(ann['category_id']-1) + ' ' + ' '.join([str(a) for a in bb]) + '\n')
+            lf.write('%s/%s.jpg\n' % (image_dir, fname))
+
+def random_coco(rng):
+    images = [{'id':pdt.scut.get_image_id(1,v,i), 'file_name':'set01_V{:0>3}_I{:0>5}.jpg'.format(v,i),
+               'height':576, 'width':720} for v in range(3) for i in range(24, 500, 25)]
+    anns = []
+    for img in images:
+        for _ in range(rng.choice([0, 0, 1, 3])):
+            xy, wh = rng.uniform(0, 500, 2), rng.uniform(5, 100, 2)
+            anns.append({'id':len(anns), 'image_id':img['id'], 'category_id':int(rng.randint(1, 7)),
+                         'bbox':[float(xy[0]), float(xy[1]), float(wh[0]), float(wh[1])],
+                         'ignore':bool(rng.rand() < .3)})
+    rng.shuffle(anns)
+    return {'images':images, 'annotations':anns, 'categories':pdt.scut.get_categories()}
+
+def read_tree(root):
+    out = {}
+    for fn in os.listdir(root):
+        with open(os.path.join(root, fn)) as f:
+            out[fn] = f.read()
+    return out
+
+@pytest.mark.parametrize('skip_empty', [False, True])
+@pytest.mark.parametrize('workers', [0, 4])
+def test_to_yolo_matches_legacy(skip_empty, workers, tmp_path):
+    coco = random_coco(np.random.RandomState(9))
+    legacy_to_yolo(coco, str(tmp_path/'ref'), str(tmp_path/'ref.txt'), '/data/images', skip_empty)
+    pdt.save_json(coco, str(tmp_path/'a.json'))
+    n = pdt.export.to_yolo(str(tmp_path/'a.json'), str(tmp_path/'out'), str(tmp_path/'out.txt'),
+                           '/data/images', skip_empty, workers)
+    ref = read_tree(str(tmp_path/'ref'))
+    assert n == len(ref) and read_tree(str(tmp_path/'out')) == ref
+    with open(str(tmp_path/'ref.txt')) as f1, open(str(tmp_path/'out.txt')) as f2:
+        assert f1.read() == f2.read()
+    # an image with only ignored anns still gets an empty label file
+    assert any(v == '' for v in ref.values())
@@ -0,0 +1,155 @@
+import copy
+import numpy as np
+import pytest
+
+import pydatatool as pdt
+from conftest import random_objs
+
+DATASETS = ['caltech', 'kaist', 'scut']
+
+def random_param(m, ds, rng):
+    param = m.get_default_filter()
+    for k in ['xRng','yRng','wRng','hRng','aRng','arRng','vRng']:
+        if rng.rand() < .4:
+            lo = rng.uniform(0, 1 if k == 'vRng' else 100)
+            hi = 1 if k == 'vRng' else (lo+rng.uniform(0,500) if rng.rand() < .7 else float('inf'))
+            param[k] = [lo, hi]
+        elif rng.rand() < .3:
+            param[k] = []
+    if rng.rand() < .3:
+        param['ilbls'] = []
+    if rng.rand() < .2:
+        param['lbls'] = []
+    if ds == 'kaist' and rng.rand() < .5:
+        occl = rng.randint(1,8)
+        param['occl'] = [occl] if rng.rand() < .5 else np.array([occl])
+    if ds == 'scut' and rng.rand() < .5:
+        occl = rng.randint(0,3)
+        param['occl'] = [occl] if rng.rand() < .5 else np.array([occl])
+    return param
+
+def columns(objs):
+    return ([o['lbl'] for o in objs], [o['pos'] for o in objs],
+            [o['posv'] for o in objs], [o['occl'] for o in objs])
+
+@pytest.mark.parametrize('ds', DATASETS)
+def test_filter_boxes_matches_filter(ds):
+    m = getattr(pdt, ds)
+    rng = np.random.RandomState(1)
+    objs = random_objs(rng, 300, lbls=['person','people','person-fa','person?','cyclist',
+                                       'walk_person','ride_person','squat_person'])
+    for t in range(60):
+        param = random_param(m, ds, rng)
+        keep, ignore = m.filter_boxes(*columns(objs), param=param)
+        expect = np.array([bool(m.filter(o, param)) for o in objs])
+        assert (ignore == expect).all()
+        labels = set(param['lbls']) | set(param['ilbls']) if len(param['lbls']) else set()
+        assert (keep == np.array([o['lbl'] in labels for o in objs])).all()
+
+@pytest.mark.parametrize('ds,occl', [('scut',[0]), ('scut',[1]), ('scut',[2]),
+                                     ('kaist',[1]), ('kaist',[3]), ('kaist',[1,4])])
+def test_occl_list_param(ds, occl):
+    m = getattr(pdt, ds)
+    param = m.get_default_filter()
+    param['ilbls'] = []
+    param['hRng'] = []
+    param['occl'] = occl
+    objs = [{'id':k, 'pos':[10.,10.,20.,50.], 'posv':[0.,0.,0.,0.], 'occl':k, 'lock':0,
+             'ignore':False, 'lbl':'person'} for k in range(3)]
+    _, ignore = m.filter_boxes(*columns(objs), param=param)
+    expect = np.array([bool(m.filter(o, param)) for o in objs])
+    assert (ignore == expect).all()
+    if ds == 'scut':
+        # [v] keeps occl v only, 2 keeps all
+        assert (ignore == [(occl[0] != 2 and k != occl[0]) for k in range(3)]).all()
+    else:
+        mask = np.bitwise_or.reduce(occl)
+        assert (ignore == [(2**k & mask) == 0 for k in range(3)]).all()
+
+@pytest.mark.parametrize('ds', DATASETS)
+def test_zero_area_boxes_are_ignored(ds):
+    m = getattr(pdt, ds)
+    objs = [{'id':0, 'pos':[10.,10.,20.,0.], 'posv':[10.,10.,5.,5.], 'occl':1, 'lock':0,
+             'ignore':False, 'lbl':'person'},
+            {'id':1, 'pos':[10.,10.,0.,0.], 'posv':[10.,10.,5.,5.], 'occl':1, 'lock':0,
+             'ignore':False, 'lbl':'person'}]
+    for k, rng in (('arRng', [0, float('inf')]), ('vRng', [0, float('inf')])):
+        param = m.get_default_filter()
+        param['ilbls'] = []
+        param['hRng'] = []
+        param[k] = rng
+        _, ignore = m.filter_boxes(*columns(objs), param=param)
+        assert ignore.all()
+        assert all(m.filter(o, param) for o in objs)
+
+def legacy_bbox_filter(m, bboxs, param):
+    # bbox_filter() before it was vectorized
+    bbox_filted = []
+    if len(param['lbls']) != 0:
+        lbl = set(param['lbls']) | set(param['ilbls'])
+        bbox_filted = [b for b in bboxs if b['lbl'] in lbl]
+    for b in bbox_filted:
+        b['ignore'] = m.filter(b, param)
+        if b['ignore'] == 0 and len(param['squarify']) != 0:
+            b['pos'] = m.bbox_squarify(b['pos'], param['squarify'][0], param['squarify'][1])
+    return bbox_filted
+
+@pytest.mark.parametrize('ds', DATASETS)
+def test_bbox_filter_matches_legacy(ds):
+    m = getattr(pdt, ds)
+    rng = np.random.RandomState(2)
+    objs = random_objs(rng, 200, lbls=['person','people','walk_person','squat_person'])[:200]
+    for t in range(20):
+        param = random_param(m, ds, rng)
+        param['squarify'] = [int(rng.randint(5)), .41] if rng.rand() < .7 else []
+        a = m.bbox_filter(copy.deepcopy(objs), param)
+        b = legacy_bbox_filter(m, copy.deepcopy(objs), param)
+        assert len(a) == len(b)
+        for x, y in zip(a, b):
+            assert x['id'] == y['id'] and bool(x['ignore']) == bool(y['ignore'])
+            np.testing.assert_allclose(x['pos'], y['pos'], rtol=1e-12)
+
+@pytest.mark.parametrize('ds', DATASETS)
+def test_filter_objLists_columnar(ds, caltech_ann):
+    m = getattr(pdt, ds)
+    vbb = pdt.caltech.load_vbb(caltech_ann+'/set01/V001.vbb', columnar=True)
+    param = m.get_default_filter()
+    k1, i1 = m.filter_objLists(vbb['objLists'], param)
+    k2, i2 = m.filter_objLists(vbb['objLists'].to_dict(), param)
+    assert (k1 == k2).all() and (i1 == i2).all()
+
+def random_bbs(rng, n):
+    return np.hstack([rng.uniform(0,600,(n,2)), rng.uniform(1,120,(n,2))])
+
+@pytest.mark.parametrize('ds', DATASETS)
+def test_bbox_resize_matches_array(ds):
+    m = getattr(pdt, ds)
+    rng = np.random.RandomState(3)
+    bbs = random_bbs(rng, 200)
+    for hr, wr, ar in [(1.2,0,.5), (0,1,.41), (1,0,.41), (1.5,.8,0), (.7,1.3,.5), (0,0,.41), (0,0,2)]:
+        ref = [m.bbox_resize(list(bb),hr,wr,ar) for bb in bbs]
+        out = m.bbox_resize_array(bbs.copy(),hr,wr,ar)
+        np.testing.assert_allclose(out, ref, rtol=1e-12)
+
+@pytest.mark.parametrize('ds', DATASETS)
+def test_bbox_squarify_matches_array(ds):
+    m = getattr(pdt, ds)
+    rng = np.random.RandomState(4)
+    bbs = random_bbs(rng, 200)
+    for flag in range(5):
+        for ar in (1, .41, 2):
+            ref = [m.bbox_squarify(list(bb),flag,ar) for bb in bbs]
+            out = m.bbox_squarify_array(bbs.copy(),flag,ar)
+            np.testing.assert_allclose(out, ref, rtol=1e-12)
+            w, h = out[:,2], out[:,3]
+            np.testing.assert_allclose(w/h, ar)
+            # the centers do not move
+            np.testing.assert_allclose(out[:,:2]+out[:,2:]/2, bbs[:,:2]+bbs[:,2:]/2)
+
+def test_bbox_resize_hand_cases():
+    # h'=1.2*h, w'=h'/2
+    assert pdt.caltech.bbox_resize([0.,0.,1.,1.],1.2,0,.5) == pytest.approx([.2,-.1,.6,1.2])
+    # w'=2*w, h unchanged: the width ratio is wr, not hr
+    assert pdt.caltech.bbox_resize([0.,0.,2.,4.],1,2) == pytest.approx([-1,0,4,4])
+    # same area, w/h=4
+    assert pdt.caltech.bbox_resize([0.,0.,2.,8.],0,0,4) == pytest.approx([-3,3,8,2])
@@ -0,0 +1,95 @@
+import json
+import pytest
+
+import pydatatool as pdt
+
+DATA = {'images':[{'id':1,'file_name':'set00_V000_I00029.jpg'}],
+        'annotations':[{'id':0,'bbox':[1.5,2.25,3.0,4.0],'iscrowd':False,'area':None}]}
+
+@pytest.mark.parametrize('backend', ['json', 'orjson', 'auto'])
+def test_save_load_json(backend, tmp_path):
+    if backend == 'orjson':
+        pytest.importorskip('orjson')
+    fn = str(tmp_path/'a.json')
+    pdt.save_json(DATA, fn, backend)
+    assert pdt.load_json(fn, backend) == DATA
+    with open(fn) as f:
+        assert json.load(f) == DATA
+
+@pytest.mark.parametrize('backend', ['json', 'orjson'])
+def test_non_finite_floats(backend, tmp_path):
+    if backend == 'orjson':
+        pytest.importorskip('orjson')
+    fn = str(tmp_path/'a.json')
+    data = {'score':[0.5, float('nan')], 'h':{'max':float('inf'), 'min':-float('inf')}}
+    pdt.save_json(data, fn, backend)
+    with open(fn) as f:
+        s = f.read()
+    # the same text whatever the backend, not null
+    assert s == json.dumps(data)
+    out = pdt.load_json(fn, backend)
+    assert out['h'] == data['h'] and out['score'][1] != out['score'][1]
+
+def test_load_json_gz(tmp_path):
+    fn = str(tmp_path/'a.json.gz')
+    pdt.save_json_stream(fn, [(k, v) for k, v in DATA.items()])
+    assert pdt.load_json(fn) == DATA
+
+def test_unknown_backend():
+    with pytest.raises(ValueError):
+        pdt.get_json_backend('yaml')
+
+def small_coco():
+    images = [{'id':k, 'file_name':'set06_V000_I{:0>5}.jpg'.format(k), 'height':480, 'width':640}
+              for k in (29, 59, 89)]
+    anns = []
+    for k, (img, bbox) in enumerate([(29, [1.5, 2, 30, 60]), (59, [10, 20, 41, 100]),
+                                     (29, [0.25, 0.5, 3.75, 8]), (89, [5, 5, 5, 5])]):
+        anns.append({'id':k, 'image_id':img, 'category_name':['person','people'][k%2],
+                     'category_id':1+k%2, 'bbox':bbox, 'bbox_v':[0, 0, 0, 0],
+                     'ignore':k == 3, 'iscrowd':k%2 == 1, 'occl':k%2,
+                     'segmentation':[], 'area':bbox[2]*bbox[3]})
+    # an ann without 'occl', one with a polygon segmentation
+    del anns[1]['occl']
+    anns[2]['segmentation'] = [[0, 0, 1, 0, 1, 1]]
+    return {'info':{'version':'1.1'}, 'images':images, 'annotations':anns,
+            'categories':[{'id':1, 'name':'person'}, {'id':2, 'name':'people'}]}
+
+@pytest.mark.parametrize('mmap', [True, False])
+def test_coco_columns_round_trip(mmap, tmp_path):
+    coco = small_coco()
+    pdt.save_coco_columns(coco, str(tmp_path/'cols'))
+    cols = pdt.load_coco_columns(str(tmp_path/'cols'), mmap)
+    out = cols.to_coco()
+    assert out == coco
+    assert json.dumps(out) == json.dumps(coco)
+    assert len(cols) == 4 and cols.columns['bbox'].shape == (4, 4)
+    assert cols.columns['ignore'].tolist() == [False, False, False, True]
+    assert cols.columns['iscrowd'].dtype == bool
+    assert cols.height.tolist() == [60, 100, 8, 5]
+    # anns of images[0], the image 29
+    assert cols.image_anns(0).tolist() == [0, 2]
+    assert cols.image_anns(2).tolist() == [3]
+
+def test_coco_columns_of_save_coco(caltech_ann, tmp_path):
+    vbbs = pdt.caltech.load_vbbs(caltech_ann)
+    fn = str(tmp_path/'test.json')
+    pdt.caltech.save_coco(pdt.caltech.iter_vbbs2cocos(vbbs, 'caltech_test', param=pdt.caltech.get_default_filter(), skip=3),
+                          pdt.caltech.get_image_ids('caltech_test', vbbs, 3), fn)
+    coco = pdt.load_json(fn)
+    pdt.save_coco_columns(coco, str(tmp_path/'cols'))
+    assert json.dumps(pdt.load_coco_columns(str(tmp_path/'cols')).to_coco()) == json.dumps(coco)
+
+@pytest.mark.parametrize('module', ['pycocotools.coco', 'pydatatool.citypersons.eval.coco'])
+def test_coco_copies_use_the_json_backend(module, tmp_path, monkeypatch):
+    pytest.importorskip('matplotlib')
+    m = pytest.importorskip(module)
+    assert m.load_json is pdt.load_json
+    fn = str(tmp_path/'a.json')
+    pdt.save_json({'images':[], 'annotations':[{'id':1, 'image_id':1, 'score':float('nan')}],
+                   'categories':[]}, fn, 'json')
+    # the environment is read at load time, and NaN falls back to the stdlib
+    pytest.importorskip('orjson')
+    monkeypatch.setenv('PYDATATOOL_JSON', 'orjson')
+    coco = m.COCO(fn)
+    assert coco.anns[1]['score'] != coco.anns[1]['score']
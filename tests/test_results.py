@@ -0,0 +1,77 @@
+import os
+import numpy as np
+
+import pydatatool as pdt
+
+def legacy_write(all_boxes, image_ids, path, cls_inds):
+    # write_voc_results_file() before write_bbs_results(), one formatted line per box,
+    # the classes of an image one after the other
+    tmp = ''
+    f = None
+    for im_ind, im_id in enumerate(image_ids):
+        s, v, i = im_id.split('_')
+        vname = os.path.join(path, s, v+'.txt')
+        if vname != tmp:
+            if f:
+                f.close()
+            pdt.mkdir_if_missing(os.path.split(vname)[0])
+            f = open(vname, 'w')
+            tmp = vname
+        for cls_ind in cls_inds:
+            dets = all_boxes[cls_ind][im_ind]
+            for k in range(len(dets)):
+                f.write("{:d},{:.3f},{:.3f},{:.3f},{:.3f},{:.7f}\n".format(
+                    int(i[1:])+1, dets[k,0]+1, dets[k,1]+1,
+                    dets[k,2]-dets[k,0]+1, dets[k,3]-dets[k,1]+1, dets[k,-1]))
+    if f:
+        f.close()
+
+def random_results(n_cls, dtype=np.float32):
+    rng = np.random.RandomState(0)
+    image_ids = ['set{:0>2}_V{:0>3}_I{:0>5}'.format(s, v, i)
+                 for s in (6, 7) for v in range(3) for i in range(29, 300, 30)]
+    all_boxes = [[[] for _ in image_ids] for _ in range(n_cls)]
+    for c in range(1, n_cls):
+        for k in range(len(image_ids)):
+            n = rng.randint(0, 4)
+            if n == 0:
+                all_boxes[c][k] = [] if rng.rand() < .5 else np.zeros((0,5), dtype)
+                continue
+            xy = rng.uniform(0, 600, (n,2))
+            wh = rng.uniform(5, 100, (n,2))
+            all_boxes[c][k] = np.hstack([xy, xy+wh, rng.rand(n,1)]).astype(dtype)
+    return all_boxes, image_ids
+
+def read_tree(root):
+    out = {}
+    for dirpath, _, files in os.walk(root):
+        for fn in files:
+            with open(os.path.join(dirpath, fn)) as f:
+                out[os.path.relpath(os.path.join(dirpath, fn), root)] = f.read()
+    return out
+
+def test_caltech_results_match_legacy(tmp_path):
+    classes = pdt.caltech.get_classes()
+    all_boxes, image_ids = random_results(len(classes))
+    pdt.caltech.write_voc_results_file(all_boxes, image_ids, str(tmp_path/'new'), classes)
+    legacy_write(all_boxes, image_ids, str(tmp_path/'ref'), [classes.index('person')])
+    ref = read_tree(str(tmp_path/'ref'))
+    assert len(ref) == 6 and read_tree(str(tmp_path/'new')) == ref
+
+def test_scut_results_match_legacy(tmp_path):
+    classes = pdt.scut.get_classes()
+    all_boxes, image_ids = random_results(len(classes), np.float64)
+    pdt.scut.write_voc_results_file(all_boxes, image_ids, str(tmp_path/'new'), classes)
+    walk, ride = classes.index('walk_person'), classes.index('ride_person')
+    legacy_write(all_boxes, image_ids, str(tmp_path/'ref'), [walk, ride])
+    legacy_write(all_boxes, image_ids, str(tmp_path/'ref-walk_person'), [walk])
+    legacy_write(all_boxes, image_ids, str(tmp_path/'ref-ride_person'), [ride])
+    for suffix in ('', '-walk_person', '-ride_person'):
+        ref = read_tree(str(tmp_path/('ref'+suffix)))
+        assert len(ref) == 6 and read_tree(str(tmp_path/('new'+suffix))) == ref
+
+def test_format_bbs_txt():
+    dets = np.array([[0, 1, 9, 19, .5], [10.25, 20, 30.5, 60, .123456789]])
+    assert pdt.caltech.format_bbs_txt([1, 30], dets) == \
+        '1,1.000,2.000,10.000,19.000,0.5000000\n30,11.250,21.000,21.250,41.000,0.1234568\n'
+    assert pdt.caltech.format_bbs_txt([], []) == ''
@@ -0,0 +1,212 @@
+import mmap
+import os
+import pickle
+import numpy as np
+import pytest
+
+import pydatatool as pdt
+import pydatatool.seq
+from conftest import write_seq, jpg_frames
+
+@pytest.mark.parametrize('ts16', [False, True])
+def test_seq_offsets(ts16, tmp_path):
+    fn = str(tmp_path/'V000.seq')
+    frames = jpg_frames(30, 0)
+    write_seq(fn, frames, ts16)
+    with pdt.caltech.SeqReader(fn, index=False) as sr:
+        assert len(sr) == 30 and sr.header['numFrames'] == 30
+        assert [bytes(sr[i]) for i in range(len(sr))] == frames
+        assert bytes(sr[-1]) == frames[-1]
+        with pytest.raises(IndexError):
+            sr[30]
+    # the first frame, the 8 byte timestamp and the 4 byte size of the next frame
+    starts, sizes = pdt.caltech.build_seq_offsets(open(fn, 'rb').read(), pdt.caltech.read_seq_header(open(fn, 'rb').read(1024)))
+    extra = 16 if ts16 else 8
+    assert starts[0] == 1024+4 and starts[1] == 1024+4+len(frames[0])+extra+4
+    assert (sizes == [len(fr) for fr in frames]).all()
+
+def test_seq_raw_frames(tmp_path):
+    fn = str(tmp_path/'V000.seq')
+    rng = np.random.RandomState(0)
+    frames = [rng.bytes(8*6) for _ in range(5)]
+    write_seq(fn, frames, fmt=100, width=8, height=6)
+    with pdt.caltech.SeqReader(fn, index=False) as sr:
+        assert [bytes(f) for f in sr] == frames
+
+def test_seq_truncated(tmp_path):
+    fn = str(tmp_path/'V000.seq')
+    frames = jpg_frames(10, 1)
+    write_seq(fn, frames)
+    size = os.path.getsize(fn)
+    with open(fn, 'r+b') as f:
+        f.truncate(size - len(frames[-1]) - 20)
+    with pdt.caltech.SeqReader(fn, index=False) as sr:
+        assert len(sr) == 9
+        assert bytes(sr[8]) == frames[8]
+
+def test_seq_index(tmp_path):
+    fn = str(tmp_path/'V000.seq')
+    frames = jpg_frames(12, 2)
+    write_seq(fn, frames)
+    with pdt.caltech.SeqReader(fn) as sr:
+        starts = sr.starts.copy()
+    assert os.path.exists(fn + '.idx.npz')
+    header, starts2, sizes2 = pdt.caltech.load_seq_index(fn)
+    assert (starts2 == starts).all() and (sizes2 == [len(fr) for fr in frames]).all()
+    index_dir = str(tmp_path/'idx')
+    assert pdt.caltech.index_seqs([fn], index_dir=index_dir) == [12]
+    assert pdt.caltech.load_seq_index(fn, index_dir) is not None
+    # a changed seq invalidates the index
+    write_seq(fn, frames[:5])
+    os.utime(fn, ns=(1, 1))
+    assert pdt.caltech.load_seq_index(fn) is None
+    with pdt.caltech.SeqReader(fn) as sr:
+        assert [bytes(f) for f in sr] == frames[:5]
+
+def test_seq_reader_closes_mmap_on_error(tmp_path, monkeypatch):
+    opened = []
+    class Mmap(mmap.mmap):
+        def __init__(self, *args, **kwargs):
+            opened.append(self)
+    monkeypatch.setattr(pydatatool.seq.mmap, 'mmap', Mmap)
+    fn = str(tmp_path/'bad.seq')
+    with open(fn, 'wb') as f:
+        f.write(b'\x00'*2048)
+    with pytest.raises(ValueError):
+        pdt.caltech.SeqReader(fn, index=False)
+    assert len(opened) == 1 and opened[0].closed
+
+def make_videos(root):
+    frames = jpg_frames(6, 3)
+    os.makedirs(os.path.join(root, 'set00'))
+    write_seq(os.path.join(root, 'set00', 'V000.seq'), frames)
+    images = [{'id':pdt.caltech.get_image_id(0,0,i), 'file_name':'set00_V000_I{:0>5}.jpg'.format(i)} for i in range(6)]
+    return frames, images
+
+def test_seq_frames(tmp_path):
+    frames, images = make_videos(str(tmp_path))
+    anns = [{'id':0, 'image_id':images[2]['id']}]
+    ds = pdt.caltech.SeqFrames(str(tmp_path), images, anns)
+    assert [s['image'] for s in ds] == frames
+    assert ds[2]['anns'] == anns and ds[3]['anns'] == []
+    assert [s['image'] for s in ds.prefetch(workers=3)] == frames
+    ds.close()
+
+def test_seq_frames_decode_keeps_view(tmp_path):
+    frames, images = make_videos(str(tmp_path))
+    # PickleBuffer holds an export of the frame view, np.frombuffer does not on every numpy
+    for decode in (pickle.PickleBuffer, lambda b: np.frombuffer(b, np.uint8)):
+        ds = pdt.caltech.SeqFrames(str(tmp_path), images, decode=decode)
+        out = [ds[k]['image'] for k in range(len(ds))]
+        ds.close()
+        assert [bytes(o) for o in out] == frames
+
+def test_seq_reader_close_with_live_frames(tmp_path):
+    fn = str(tmp_path/'V000.seq')
+    frames = jpg_frames(4, 4)
+    write_seq(fn, frames)
+    sr = pdt.caltech.SeqReader(fn, index=False)
+    view = sr[1]
+    arr = np.frombuffer(sr[2], np.uint8)
+    sr.close()
+    assert bytes(view) == frames[1] and arr.tobytes() == frames[2]
+
+def make_pair_videos(root):
+    frames = {'visible':jpg_frames(4, 5), 'lwir':jpg_frames(4, 6)}
+    for stream, fr in frames.items():
+        fn = os.path.join(root, 'set06', 'V000', stream+'.seq')
+        if not os.path.exists(os.path.dirname(fn)):
+            os.makedirs(os.path.dirname(fn))
+        write_seq(fn, fr)
+    images = [{'id':pdt.kaist.get_image_id(6,0,i), 'file_name':'set06_V000_I{:0>5}.jpg'.format(i)} for i in range(4)]
+    return frames, {'images':images, 'annotations':[]}
+
+@pytest.mark.parametrize('decode', [None, pickle.PickleBuffer])
+def test_seq_frame_pair_dataset(decode, tmp_path):
+    frames, coco = make_pair_videos(str(tmp_path))
+    ds = pdt.kaist.SeqFramePairDataset('kaist_test_all', str(tmp_path), coco, decode=decode)
+    out = [ds[k]['image'] for k in range(len(ds))]
+    ds.close()
+    # PickleBuffer holds an export of the frame view, like a decoder keeping it
+    out = [tuple(bytes(im) for im in ims) for ims in out]
+    assert out == list(zip(frames['visible'], frames['lwir']))
+
+def test_seq_index_rebuilt_when_stale(tmp_path, monkeypatch):
+    fn = str(tmp_path/'V000.seq')
+    frames = jpg_frames(6, 7)
+    write_seq(fn, frames)
+    os.utime(fn, ns=(10**18, 10**18))
+    builds = []
+    build = pydatatool.seq.build_seq_offsets
+    monkeypatch.setattr(pydatatool.seq, 'build_seq_offsets', lambda *a: builds.append(1) or build(*a))
+    with pdt.caltech.SeqReader(fn) as sr:
+        assert len(sr) == 6
+    with pdt.caltech.SeqReader(fn) as sr:
+        assert [bytes(f) for f in sr] == frames
+    assert len(builds) == 1
+
+    # the same size, frames of other lengths, only the mtime tells: the stale
+    # offsets would cut the frames in the wrong places
+    size = os.path.getsize(fn)
+    swapped = frames[::-1]
+    write_seq(fn, swapped)
+    assert os.path.getsize(fn) == size
+    os.utime(fn, ns=(10**18+1, 10**18+1))
+    with pdt.caltech.SeqReader(fn) as sr:
+        assert [bytes(f) for f in sr] == swapped
+    assert len(builds) == 2
+    with np.load(fn+'.idx.npz') as data:
+        assert int(data['src_mtime']) == 10**18+1
+
+    # the same mtime, another size
+    write_seq(fn, swapped[:4])
+    os.utime(fn, ns=(10**18+1, 10**18+1))
+    with pdt.caltech.SeqReader(fn) as sr:
+        assert [bytes(f) for f in sr] == swapped[:4]
+    assert len(builds) == 3
+    # the rebuilt index is used again
+    with pdt.caltech.SeqReader(fn) as sr:
+        assert len(sr) == 4
+    assert len(builds) == 3
+
+def test_extract_seqs_matches_seq2imgs(tmp_path, monkeypatch):
+    vnames = []
+    for v in range(10):
+        fn = str(tmp_path/'videos'/'set01'/'V{:0>3}.seq'.format(v))
+        if v == 0:
+            os.makedirs(os.path.dirname(fn))
+        write_seq(fn, jpg_frames(7+v, 20+v))
+        vnames.append(fn)
+    for fn in vnames:
+        pdt.caltech.seq2imgs(fn, str(tmp_path/'ref'), 3, verbose=False)
+
+    # count the videos submitted and not finished
+    import concurrent.futures, threading, time
+    lock, outstanding = threading.Lock(), [0, 0]
+    class CountingExecutor(concurrent.futures.ThreadPoolExecutor):
+        def submit(self, *args, **kwargs):
+            with lock:
+                outstanding[0] += 1
+                outstanding[1] = max(outstanding[1], outstanding[0])
+            fu = super(CountingExecutor, self).submit(*args, **kwargs)
+            def finished(_):
+                with lock:
+                    outstanding[0] -= 1
+            fu.add_done_callback(finished)
+            return fu
+    seq2imgs = pydatatool.seq.seq2imgs
+    def slow_seq2imgs(*args, **kwargs):
+        time.sleep(.01)
+        return seq2imgs(*args, **kwargs)
+    monkeypatch.setattr(concurrent.futures, 'ThreadPoolExecutor', CountingExecutor)
+    monkeypatch.setattr(pydatatool.seq, 'seq2imgs', slow_seq2imgs)
+    n, b = pdt.caltech.extract_seqs(vnames, str(tmp_path/'out'), 3, workers=2)
+    assert 0 < outstanding[1] <= 4
+
+    ref = sorted(os.listdir(str(tmp_path/'ref')))
+    assert sorted(os.listdir(str(tmp_path/'out'))) == ref
+    assert n == len(ref) == sum((7+v)//3 for v in range(10))
+    for fn in ref:
+        with open(str(tmp_path/'ref'/fn), 'rb') as f1, open(str(tmp_path/'out'/fn), 'rb') as f2:
+            assert f1.read() == f2.read()
+    assert b == sum(os.path.getsize(str(tmp_path/'ref'/fn)) for fn in ref)
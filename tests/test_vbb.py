@@ -0,0 +1,157 @@
+import os
+import numpy as np
+
+import pydatatool as pdt
+
+KEYS = ('nFrame','maxObj','objLbl')
+
+def same_vbbs(a, b):
+    assert sorted(a) == sorted(b)
+    for s in a:
+        assert sorted(a[s]) == sorted(b[s])
+        for v in a[s]:
+            x, y = a[s][v], b[s][v]
+            for k in KEYS:
+                assert x[k] == y[k]
+            ox, oy = x['objLists'], y['objLists']
+            if isinstance(ox, pdt.caltech.VbbObjLists):
+                ox = ox.to_dict()
+            if isinstance(oy, pdt.caltech.VbbObjLists):
+                oy = oy.to_dict()
+            assert ox == oy
+
+def test_load_vbbs_paths(caltech_ann, tmp_path):
+    ref = pdt.caltech.load_vbbs(caltech_ann)
+    same_vbbs(ref, pdt.caltech.load_vbbs(caltech_ann, workers=2))
+    same_vbbs(ref, pdt.caltech.load_vbbs(caltech_ann, columnar=True))
+    cache_dir = str(tmp_path/'cache')
+    # cold then warm cache
+    same_vbbs(ref, pdt.caltech.load_vbbs(caltech_ann, cache_dir=cache_dir))
+    same_vbbs(ref, pdt.caltech.load_vbbs(caltech_ann, cache_dir=cache_dir))
+    same_vbbs(ref, pdt.caltech.load_vbbs(caltech_ann, cache_dir=cache_dir, columnar=True))
+    same_vbbs(ref, pdt.caltech.load_vbbs(caltech_ann, lazy=True))
+
+def test_lazy_image_ids(caltech_ann):
+    ref = pdt.caltech.load_vbbs(caltech_ann)
+    lazy = pdt.caltech.load_vbbs(caltech_ann, lazy=True)
+    assert pdt.caltech.get_image_ids('caltech_test', lazy, 30) == pdt.caltech.get_image_ids('caltech_test', ref, 30)
+    # only the headers were read
+    assert not any(lazy[s][v].loaded for s in lazy for v in lazy[s])
+
+def test_iter_vbb_frames(caltech_ann):
+    vbb = pdt.caltech.load_vbb(caltech_ann+'/set00/V000.vbb')
+    frames = list(pdt.caltech.iter_vbb_frames(caltech_ann+'/set00/V000.vbb', skip=3))
+    assert [f[:3] for f in frames] == [(0, 0, i) for i in range(2, vbb['nFrame'], 3)]
+    assert [f[3] for f in frames] == [vbb['objLists'][i] for i in range(2, vbb['nFrame'], 3)]
+
+class RecordLoad(object):
+    # wraps np.load in pydatatool.vbb, keeps the opened npz files
+    def __init__(self, load):
+        self.load = load
+        self.files = []
+
+    def __call__(self, *args, **kwargs):
+        data = self.load(*args, **kwargs)
+        self.files.append(data)
+        return data
+
+def test_vbb_cache_rebuilds_bad_files(caltech_ann, tmp_path, monkeypatch):
+    fn = caltech_ann+'/set00/V000.vbb'
+    ref = pdt.caltech.load_vbb(fn)
+    cache_dir = str(tmp_path/'cache')
+    cache_file = pdt.vbb.vbb_cache_file(fn, cache_dir)
+    good = pdt.vbb.save_vbb_cache(ref, fn, cache_dir)
+    with np.load(good) as data:
+        fields = dict(data)
+    recorder = RecordLoad(np.load)
+    monkeypatch.setattr(pdt.vbb.np, 'load', recorder)
+    broken = [dict(fields, log=np.array([None, 1], dtype=object)),   # pickled
+              dict((k, v) for k, v in fields.items() if k != 'pos'),  # incomplete
+              dict((k, v) for k, v in fields.items() if k != 'version'),
+              dict(fields, src_size=0)]                               # stale
+    for b in broken:
+        with open(cache_file, 'wb') as f:
+            np.savez(f, **b)
+        assert pdt.caltech.load_vbb_header(fn, cache_dir) == {'nFrame':ref['nFrame'], 'maxObj':ref['maxObj']}
+        same_vbbs({'s':{'v':ref}}, {'s':{'v':pdt.caltech.load_vbb_cached(fn, cache_dir)}})
+    # the rebuilt cache is plain arrays, and every opened file was closed
+    with np.load(cache_file, allow_pickle=False) as data:
+        assert all(data[k].dtype != object for k in data.files)
+    assert recorder.files and all(data.zip is None for data in recorder.files)
+
+def write_vbb_txt(filename, nFrame, objs):
+    # the text form of vbb('vbbSaveTxt'), objs is a list of (lbl, str, [Kx4 pos])
+    with open(filename, 'w') as f:
+        f.write('% vbb version=1.4\n')
+        f.write('nFrame={} n={}\n'.format(nFrame, len(objs)))
+        f.write('log=[]\n')
+        for lbl, s, pos in objs:
+            f.write("lbl='{}' str={} end={} hide=0\n".format(lbl, s, s+len(pos)-1))
+            f.write('pos =[{}]\n'.format(''.join(' '.join(map(str, p))+'; ' for p in pos)))
+            f.write('posv=[{}]\n'.format('0 0 0 0; '*len(pos)))
+            f.write('occl=[{}]\n'.format(' '.join(['0']*len(pos))))
+            f.write('lock=[{}]\n'.format(' '.join(['0']*len(pos))))
+
+def test_lazy_headers(caltech_ann, tmp_path, monkeypatch):
+    calls = []
+    loadmat = pdt.vbb.loadmat
+    monkeypatch.setattr(pdt.vbb, 'loadmat', lambda fn: calls.append(fn) or loadmat(fn))
+    ref = pdt.caltech.get_image_ids('caltech_test', pdt.caltech.load_vbbs(caltech_ann), 30)
+    dbInfo = pdt.caltech.get_dbInfo('caltech_test')
+    n_test = sum(len(dbInfo['vidIds'][s]) for s in dbInfo['setIds'])
+
+    # without a cache the header read is one loadmat per video, nothing is kept parsed
+    del calls[:]
+    cache_dir = str(tmp_path/'cache')
+    lazy = pdt.caltech.load_vbbs(caltech_ann, lazy=True, cache_dir=cache_dir)
+    assert pdt.caltech.get_image_ids('caltech_test', lazy, 30) == ref
+    assert len(calls) == n_test
+    assert not any(lazy[s][v].loaded for s in lazy for v in lazy[s])
+    # a parsed video fills the cache, then its header comes from the cache
+    vbb = lazy['set06']['V000']
+    assert len(vbb['objLists']) == vbb['nFrame'] and vbb.loaded
+    del calls[:]
+    header = pdt.caltech.load_vbb_header(vbb.filename, cache_dir)
+    assert header == {'nFrame':vbb['nFrame'], 'maxObj':vbb['maxObj']} and calls == []
+
+    # the txt header is the first two lines
+    fn = str(tmp_path/'set00'/'V000.txt')
+    os.makedirs(os.path.dirname(fn))
+    write_vbb_txt(fn, 12, [('person', 2, [[1,2,3,4], [2,3,4,5]]), ('people', 5, [[5,6,7,8]])])
+    assert pdt.caltech.load_vbb_header(fn) == {'nFrame':12, 'maxObj':2}
+    lazy = pdt.caltech.load_vbbs(str(tmp_path), lazy=True, ext='txt')
+    assert lazy['set00']['V000']['nFrame'] == 12 and not lazy['set00']['V000'].loaded
+    vbb = pdt.caltech.load_vbb_txt(fn)
+    assert vbb['objLbl'] == ['person', 'people']
+    assert [len(vbb['objLists'][i]) for i in range(12)] == [0,1,1,0,1,0,0,0,0,0,0,0]
+    assert calls == []
+
+def test_vbb_manifest(tmp_path):
+    files = {}
+    for k in range(3):
+        files['set00/V{:0>3}'.format(k)] = str(tmp_path/'V{:0>3}.vbb'.format(k))
+        with open(files['set00/V{:0>3}'.format(k)], 'w') as f:
+            f.write('video {}'.format(k))
+    manifest = pdt.vbb.new_vbb_manifest({'skip':1}, 100, 10)
+    changed, stats = pdt.vbb.vbb_manifest_changes(manifest, files)
+    assert changed == sorted(files)
+    for key, n in zip(changed, (5, 0, 7)):
+        annId, objId = pdt.vbb.vbb_manifest_alloc(manifest, key, n, 2)
+        manifest['videos'][key] = dict(stats[key], annId=annId, objId=objId)
+    assert [manifest['videos'][k]['annId'] for k in sorted(files)] == [[100,105], [105,105], [105,112]]
+    assert manifest['annId_end'] == 112 and manifest['objId_end'] == 16
+
+    # a touched file is read but not changed, an edited one is
+    os.utime(files['set00/V000'], ns=(1, 1))
+    with open(files['set00/V002'], 'w') as f:
+        f.write('video 2 edited')
+    changed, stats = pdt.vbb.vbb_manifest_changes(manifest, files)
+    assert changed == ['set00/V002'] and stats['set00/V000']['mtime_ns'] == 1
+    # fits: the old range is kept, it does not shrink; too big: a new range at the end
+    assert pdt.vbb.vbb_manifest_alloc(manifest, 'set00/V002', 6, 2) == ([105,112], [14,16])
+    assert pdt.vbb.vbb_manifest_alloc(manifest, 'set00/V001', 1, 3) == ([112,113], [16,19])
+    assert manifest['annId_end'] == 113 and manifest['objId_end'] == 19
+
+    pdt.vbb.save_vbb_manifest(manifest, str(tmp_path/'m'/'a.manifest'))
+    assert pdt.vbb.load_vbb_manifest(str(tmp_path/'m'/'a.manifest'), {'skip':1}) == manifest
+    assert pdt.vbb.load_vbb_manifest(str(tmp_path/'m'/'a.manifest'), {'skip':2}) is None